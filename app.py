@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context
+import json
 import os
 import sys
+import uuid
 from werkzeug.utils import secure_filename
 
 
@@ -17,6 +19,10 @@ from scripts.configuracion import config
 from scripts.gestor_aprovisionamiento_grupos_simplificado import GestorAprovisionamientoGruposSimplificado
 from scripts.vinculador_estudiantes_grupos import VinculadorEstudiantesGrupos
 from scripts.creador_equipos_teams_multiples_owners import CreadorEquiposTeamsMultipleOwners
+from scripts.elementos_eliminados import GestorElementosEliminados
+from scripts.control_concurrencia import controlador_concurrencia
+from scripts.cola_trabajos import cola_trabajos
+from scripts.progreso import obtener_reportador
 
     
 app = Flask(__name__)
@@ -44,17 +50,17 @@ def dashboard():
 def dashboard_charts():
     """API para obtener datos de gráficos"""
     analizador = AnalizadorEstadisticas()
-    datos = {
-        'lineas': analizador.obtener_datos_grafico_lineas(),
-        'barras': analizador.obtener_datos_grafico_barras(),
-        'dona': analizador.obtener_datos_grafico_dona()
-    }
-    return jsonify(datos)
+    return jsonify(analizador.obtener_datos_graficos())
+
+@app.route('/api/concurrencia')
+def estado_concurrencia():
+    """API con los límites de concurrencia actuales por clase de endpoint"""
+    return jsonify(controlador_concurrencia.limites_actuales())
 
 @app.route('/upload/<accion>', methods=['GET', 'POST'])
 def upload(accion):
     # ✅ CAMBIO IMPORTANTE: Agregar 'crear_teams_con_owners' a la lista válida
-    if accion not in ['crear', 'actualizar', 'eliminar', 'desvincular', 'aprovisionar_grupos', 'vincular_grupos', 'eliminar_teams', 'crear_teams_con_owners']:
+    if accion not in ['crear', 'actualizar', 'eliminar', 'desvincular', 'aprovisionar_grupos', 'vincular_grupos', 'eliminar_teams', 'crear_teams_con_owners', 'restaurar_eliminados', 'purgar_eliminados']:
         flash('Acción no válida', 'error')
         return redirect(url_for('index'))
         
@@ -70,14 +76,15 @@ def upload(accion):
             return redirect(request.url)
             
         if file and (file.filename.endswith('.xlsx') or file.filename.endswith('.csv')):
-            filename = secure_filename(file.filename)
+            # Prefijo único: varios administradores pueden subir archivos con el mismo nombre
+            filename = f"{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
-            # Ejecutar proceso
-            resultados = procesar_accion(accion, filepath)
+            # Encolar proceso (se ejecuta en segundo plano)
+            trabajo_id = cola_trabajos.enviar(accion, filepath, procesar_accion)
             
-            return render_template('results.html', resultados=resultados, accion=accion)
+            return redirect(url_for('ver_trabajo', trabajo_id=trabajo_id))
         else:
             flash('Formato no permitido. Use .xlsx o .csv', 'error')
             
@@ -91,7 +98,9 @@ def upload(accion):
         'eliminar_teams': 'Eliminar Teams del Tenant',
         'aprovisionar_grupos': 'Aprovisionar Estudiantes a Grupos',
         'vincular_grupos': 'Vincular Estudiantes a Grupos',
-        'crear_teams_con_owners': 'Crear Equipos de Teams con Owners'  # ✅ NUEVA ACCIÓN
+        'crear_teams_con_owners': 'Crear Equipos de Teams con Owners',  # ✅ NUEVA ACCIÓN
+        'restaurar_eliminados': 'Restaurar Elementos Eliminados',
+        'purgar_eliminados': 'Purgar Elementos Eliminados'
     }
             
     return render_template('upload.html', accion=accion, titulo=titulos.get(accion, 'Acción desconocida'))
@@ -102,17 +111,17 @@ def procesar_accion(accion, filepath):
     
     if accion == 'crear':
         creador = CreadorEstudiantes()
-        resultados = creador.procesar_estudiantes(filepath, confirmacion=False)
+        resultados = creador.procesar_estudiantes(filepath, confirmacion=False, modo="lotes")
         
     elif accion == 'actualizar':
         actualizador = ActualizadorEstudiantes()
-        resultados = actualizador.procesar_actualizaciones(filepath, confirmacion=False)
+        resultados = actualizador.procesar_actualizaciones(filepath, confirmacion=False, modo="diferencial")
         
     elif accion == 'eliminar':
         eliminador = EliminadorEstudiantes()
         # Para eliminar, primero cargamos la lista
         codigos = eliminador.cargar_lista_estudiantes(filepath)
-        resultados = eliminador.eliminar_masivo_con_confirmacion(codigos, confirmacion=False)
+        resultados = eliminador.eliminar_masivo_con_confirmacion(codigos, confirmacion=False, modo="lotes")
         
     elif accion == 'desvincular':
         vaciador = VaciadorEquipos()
@@ -120,7 +129,7 @@ def procesar_accion(accion, filepath):
         
     elif accion == 'aprovisionar_grupos':        
         gestor = GestorAprovisionamientoGruposSimplificado() 
-        resultados = gestor.procesar(filepath)  
+        resultados = gestor.procesar(filepath, modo="masivo")
         
     elif accion == 'vincular_grupos':
         vinculador = VinculadorEstudiantesGrupos()
@@ -134,9 +143,62 @@ def procesar_accion(accion, filepath):
     elif accion == 'eliminar_teams':
         eliminador = EliminadorTeams()
         resultados = eliminador.procesar(filepath, confirmacion=False)
+    
+    elif accion in ('restaurar_eliminados', 'purgar_eliminados'):
+        gestor = GestorElementosEliminados()
+        resultados = gestor.procesar(filepath, accion=accion.split('_')[0], confirmacion=False)
            
     return resultados
 
+@app.route('/trabajos')
+def trabajos():
+    """Lista de trabajos recientes"""
+    return render_template('trabajos.html', trabajos=cola_trabajos.listar())
+
+@app.route('/trabajo/<trabajo_id>')
+def ver_trabajo(trabajo_id):
+    """Muestra el progreso de un trabajo o sus resultados si ya terminó"""
+    trabajo = cola_trabajos.obtener(trabajo_id)
+    if not trabajo:
+        flash('Trabajo no encontrado', 'error')
+        return redirect(url_for('trabajos'))
+    
+    if trabajo['estado'] == cola_trabajos.COMPLETADO:
+        return render_template('results.html', resultados=trabajo['resultados'], accion=trabajo['accion'])
+    
+    return render_template('trabajo.html', trabajo=trabajo)
+
+@app.route('/api/trabajos/<trabajo_id>')
+def estado_trabajo(trabajo_id):
+    """API con el estado de un trabajo"""
+    trabajo = cola_trabajos.obtener(trabajo_id)
+    if not trabajo:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo)
+
+@app.route('/api/trabajos/<trabajo_id>/eventos')
+def eventos_trabajo(trabajo_id):
+    """Server-Sent Events con el progreso de un trabajo en curso"""
+    def generar():
+        reportador = obtener_reportador(trabajo_id)
+        version = -1
+        while reportador:
+            version, estado = reportador.esperar_cambio(version, timeout=15)
+            yield f"data: {json.dumps(estado, ensure_ascii=False)}\n\n"
+            if estado['finalizado']:
+                return
+        
+        # Trabajo ya terminado (o inexistente): un único evento final
+        trabajo = cola_trabajos.obtener(trabajo_id)
+        estado = {'trabajo_id': trabajo_id, 'finalizado': True, 'estado': trabajo['estado'] if trabajo else None}
+        yield f"data: {json.dumps(estado)}\n\n"
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/logs')
 def logs():
     log_files = sorted(os.listdir(config.CARPETA_LOGS), reverse=True)
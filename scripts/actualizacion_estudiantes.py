@@ -10,45 +10,83 @@ import sys
 # Añadir la carpeta scripts al path para importar configuración
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.preprocesamiento import registros
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class ActualizadorEstudiantes:
     """Clase para actualizar estudiantes existentes en Microsoft 365"""
     
+    CAMPOS_ACTUALIZABLES = ("displayName", "jobTitle", "department", "city", "givenName", "surname")
+    
     def __init__(self):
         # Validar configuración al inicializar
         config.validar_configuracion()
         self.token = None
+        self.progreso = reportador_actual()
         self.resultados = {
             "total": 0,
             "actualizados": 0,
+            "sin_cambios": 0,
             "errores": 0,
             "detalles_errores": []
         }
         
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("Token obtenido correctamente")
             return True
         except requests.RequestException as e:
             print(f"Error obteniendo token: {e}")
             return False
 
-    def actualizar_estudiante(self, estudiante: dict) -> bool:
-        """Actualiza un estudiante individual en Microsoft 365"""
+    def datos_deseados(self, estudiante: dict) -> dict:
+        """Atributos que debe tener el estudiante según el archivo"""
+        return {
+            "displayName": f"Estudiante - {estudiante['CURSO']}: {estudiante['NOMBRES']} {estudiante['APELLIDOS']}",
+            "jobTitle": estudiante["CURSO"],
+            "department": config.DEFAULT_DEPARTMENT,
+            "city": "Bogotá",
+            "givenName": estudiante["NOMBRES"],
+            "surname": estudiante["APELLIDOS"]
+        }
+
+    def obtener_instantanea(self, df: pd.DataFrame) -> dict:
+        """Descarga una sola vez los atributos actuales de los estudiantes del archivo
+
+        Solo se consultan sus UPN ('userPrincipalName in (...)', 15 por
+        petición), no el resto de usuarios del tenant.
+
+        Returns:
+            dict: {upn_en_minusculas: usuario}
+        """
+        print("\nDescargando atributos actuales de los estudiantes...")
+        upns = (df["CODIGO"].astype(str) + f"@{config.COLEGIO_DOMINIO}").tolist()
+        select = ",".join(("userPrincipalName",) + self.CAMPOS_ACTUALIZABLES)
+        instantanea = cliente_graph.resolver_usuarios(upns, select=select)
+        print(f"{len(instantanea)} estudiantes descargados")
+        return instantanea
+
+    def calcular_cambios(self, estudiante: dict, actual: dict) -> dict:
+        """Solo los atributos cuyo valor difiere del actual en Azure AD"""
+        return {
+            campo: valor
+            for campo, valor in self.datos_deseados(estudiante).items()
+            if (actual.get(campo) or "") != valor
+        }
+
+    def actualizar_estudiante(self, estudiante: dict, datos_actualizacion: dict = None) -> bool:
+        """Actualiza un estudiante individual en Microsoft 365
+
+        Args:
+            datos_actualizacion: Atributos a enviar (por defecto, todos)
+        """
         if not self.token:
             print("Token no disponible")
             return False
@@ -61,18 +99,12 @@ class ActualizadorEstudiantes:
         user_principal_name = f"{estudiante['CODIGO']}@{config.COLEGIO_DOMINIO}"
 
         # Datos a actualizar usando configuración
-        datos_actualizacion = {
-            "displayName": f"Estudiante - {estudiante['CURSO']}: {estudiante['NOMBRES']} {estudiante['APELLIDOS']}",
-            "jobTitle": estudiante["CURSO"],
-            "department": config.DEFAULT_DEPARTMENT,
-            "city": "Bogotá",
-            "givenName": estudiante["NOMBRES"],
-            "surname": estudiante["APELLIDOS"]
-        }
+        if datos_actualizacion is None:
+            datos_actualizacion = self.datos_deseados(estudiante)
 
         try:
             url = f"{config.GRAPH_ENDPOINT}/users/{user_principal_name}"
-            response = requests.patch(url, headers=headers, json=datos_actualizacion, verify=False)
+            response = cliente_graph.patch(url, headers=headers, json=datos_actualizacion, verify=False)
 
             if response.status_code == 204:
                 print(f"Estudiante actualizado: {estudiante['CODIGO']}")
@@ -92,16 +124,7 @@ class ActualizadorEstudiantes:
     def cargar_archivo(self, ruta_archivo: str) -> pd.DataFrame:
         """Carga estudiantes desde archivo Excel o CSV"""
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8", sep=";")
-            else:
-                raise ValueError("Formato no soportado. Usa .xlsx o .csv")
-            
-            # Limpiar datos
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            df = cargar_dataframe(ruta_archivo, sep=";")
             
             print(f"Archivo cargado: {len(df)} estudiantes para actualizar")
             return df
@@ -121,12 +144,15 @@ class ActualizadorEstudiantes:
         print("Datos válidos")
         return True
 
-    def procesar_actualizaciones(self, ruta_archivo: str = None, confirmacion: bool = True) -> dict:
+    def procesar_actualizaciones(self, ruta_archivo: str = None, confirmacion: bool = True, modo: str = "completo") -> dict:
         """Procesa la actualización masiva de estudiantes
         
         Args:
             ruta_archivo (str, optional): Ruta al archivo. Defaults to None.
             confirmacion (bool, optional): Pedir confirmación. Defaults to True.
+            modo (str, optional): "completo" (PATCH de todos los atributos a cada
+                estudiante) o "diferencial" (compara con una instantánea de los
+                usuarios y solo envía los atributos que cambiaron). Defaults to "completo".
             
         Returns:
             dict: Resultados del proceso
@@ -165,21 +191,42 @@ class ActualizadorEstudiantes:
             # Procesar actualizaciones
             print(f"\nIniciando actualización de {len(df)} estudiantes...")
             print("="*50)
+            self.progreso.iniciar(len(df), etapa="Actualizando estudiantes")
+            
+            instantanea = self.obtener_instantanea(df) if modo == "diferencial" else None
             
-            for index, estudiante in df.iterrows():
+            total = len(df)
+            for posicion, estudiante in enumerate(registros(df), 1):
                 try:
-                    print(f"\nProcesando {index + 1}/{len(df)}: {estudiante['CODIGO']}")
+                    cambios = None
+                    if instantanea is not None:
+                        upn = f"{estudiante['CODIGO']}@{config.COLEGIO_DOMINIO}".lower()
+                        actual = instantanea.get(upn)
+                        # Sin usuario en la instantánea se envía todo (Graph dirá si no existe)
+                        cambios = self.calcular_cambios(estudiante, actual) if actual else None
+                        if cambios == {}:
+                            self.resultados["sin_cambios"] += 1
+                            self.progreso.avanzar(actual=estudiante['CODIGO'])
+                            continue
                     
-                    if self.actualizar_estudiante(estudiante):
+                    print(f"\nProcesando {posicion}/{total}: {estudiante['CODIGO']}")
+                    self.progreso.actualizar(actual=estudiante['CODIGO'])
+                    if cambios:
+                        print(f"Cambios: {', '.join(cambios)}")
+                    
+                    if self.actualizar_estudiante(estudiante, cambios):
                         self.resultados["actualizados"] += 1
+                        self.progreso.avanzar()
                     else:
                         self.resultados["errores"] += 1
+                        self.progreso.avanzar(exito=False, error=f"Error actualizando {estudiante['CODIGO']}")
                         
                 except Exception as e:
                     error_msg = f"Error procesando {estudiante.get('CODIGO', 'desconocido')}: {e}"
                     print(f"{error_msg}")
                     self.resultados["detalles_errores"].append(error_msg)
                     self.resultados["errores"] += 1
+                    self.progreso.avanzar(exito=False, error=error_msg)
             
             # Mostrar resumen
             self.mostrar_resumen()
@@ -200,6 +247,7 @@ class ActualizadorEstudiantes:
         print(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Total procesados: {self.resultados['total']}")
         print(f"Estudiantes actualizados: {self.resultados['actualizados']}")
+        print(f"Sin cambios: {self.resultados['sin_cambios']}")
         print(f"Errores: {self.resultados['errores']}")
         
         if self.resultados['errores'] > 0:
@@ -222,6 +270,7 @@ class ActualizadorEstudiantes:
                 f.write("="*50 + "\n")
                 f.write(f"Total procesados: {self.resultados['total']}\n")
                 f.write(f"Estudiantes actualizados: {self.resultados['actualizados']}\n")
+                f.write(f"Sin cambios: {self.resultados['sin_cambios']}\n")
                 f.write(f"Errores: {self.resultados['errores']}\n\n")
                 
                 if self.resultados['detalles_errores']:
@@ -230,6 +279,8 @@ class ActualizadorEstudiantes:
                     for error in self.resultados['detalles_errores']:
                         f.write(f"- {error}\n")
             
+            registrar_log(log_file)
+            
             print(f"Log guardado en: {log_file}")
             
         except Exception as e:
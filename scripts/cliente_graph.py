@@ -0,0 +1,234 @@
+# scripts/cliente_graph.py
+"""
+Cliente HTTP compartido para Microsoft Graph.
+Todas las clases usan la misma sesión para reutilizar conexiones (keep-alive)
+en lugar de abrir una conexión TCP+TLS nueva en cada llamada, y el mismo
+token de aplicación, que se renueva antes de expirar.
+"""
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from datetime import datetime, timedelta
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+from scripts.control_concurrencia import controlador_concurrencia
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+class ProveedorToken:
+    """Token client-credentials compartido por todo el proceso (thread-safe)
+
+    El token se guarda hasta poco antes de 'expires_in' y se renueva en
+    segundo plano, de modo que las operaciones largas nunca esperan por él.
+    """
+
+    REINTENTO_FALLO = 30  # Segundos antes de reintentar una renovación fallida
+
+    def __init__(self, cliente: "ClienteGraph", margen: int = None):
+        self.cliente = cliente
+        self.margen = config.TOKEN_MARGEN_RENOVACION if margen is None else margen
+        self.renovaciones = 0
+        self._token = None
+        self._expira_en = 0.0  # time.monotonic() en el que debe renovarse
+        self._expiracion = None  # datetime equivalente (informativo)
+        self._lock = threading.RLock()
+        self._temporizador = None
+
+    def _solicitar_token(self) -> dict:
+        """Pide un token nuevo a login.microsoftonline.com"""
+        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": config.CLIENT_ID,
+            "client_secret": config.CLIENT_SECRET,
+            "scope": "https://graph.microsoft.com/.default"
+        }
+        response = self.cliente.request("POST", url, data=data, autenticar=False)
+        response.raise_for_status()
+        return response.json()
+
+    def _renovar(self):
+        """Obtiene un token nuevo y programa su renovación (requiere el lock)"""
+        token_data = self._solicitar_token()
+        expires_in = int(token_data.get("expires_in", 3600))
+        vigencia = max(expires_in - self.margen, 60)
+
+        self._token = token_data["access_token"]
+        self._expira_en = time.monotonic() + vigencia
+        self._expiracion = datetime.now() + timedelta(seconds=vigencia)
+        self.renovaciones += 1
+        self._programar_renovacion(vigencia)
+
+    def _programar_renovacion(self, segundos: float):
+        """Programa la renovación en segundo plano"""
+        if self._temporizador:
+            self._temporizador.cancel()
+        self._temporizador = threading.Timer(segundos, self._renovar_en_segundo_plano)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _renovar_en_segundo_plano(self):
+        with self._lock:
+            try:
+                self._renovar()
+            except Exception as e:
+                print(f"⚠️ Error renovando token en segundo plano: {e}")
+                self._programar_renovacion(self.REINTENTO_FALLO)
+
+    def token_valido(self) -> bool:
+        """Indica si hay un token en cache que aún no debe renovarse"""
+        return bool(self._token) and time.monotonic() < self._expira_en
+
+    def obtener_token(self, forzar: bool = False) -> str:
+        """Devuelve el token en cache o uno nuevo si expiró
+
+        Lanza requests.RequestException si no se puede autenticar.
+        """
+        with self._lock:
+            if forzar or not self.token_valido():
+                self._renovar()
+            return self._token
+
+    def invalidar(self, token: str = None):
+        """Descarta el token actual (p. ej. tras un 401)
+
+        Si se indica 'token', solo se descarta si sigue siendo el vigente,
+        para no tirar un token que otro hilo ya renovó.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expira_en = 0.0
+
+    @property
+    def expiracion(self) -> datetime:
+        return self._expiracion
+
+
+class ClienteGraph:
+    """Sesión HTTP con pool de conexiones, timeout por defecto y autenticación"""
+
+    TAMANO_FILTRO_IN = 15  # Máximo de valores en un filtro 'in' de Graph
+
+    def __init__(self, tamano_pool: int = None, timeout: float = None):
+        self.tamano_pool = tamano_pool or config.GRAPH_POOL_SIZE
+        self.timeout = timeout or config.GRAPH_TIMEOUT
+
+        self.session = requests.Session()
+        self.session.verify = False
+
+        # Un pool por host (graph.microsoft.com y login.microsoftonline.com)
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=self.tamano_pool)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+        self.proveedor_token = ProveedorToken(self)
+
+    def _es_url_graph(self, url: str) -> bool:
+        return url.startswith(config.GRAPH_ENDPOINT) or url.startswith("https://graph.microsoft.com")
+
+    def request(self, metodo: str, url: str, autenticar: bool = None, **kwargs) -> requests.Response:
+        """Ejecuta una petición HTTP usando la sesión compartida
+
+        Las peticiones a Graph llevan el token compartido; ante un 401 el
+        token se invalida y la petición se reintenta una vez con uno nuevo.
+        Ante un 429/503 se respeta el Retry-After (pausando toda la clase de
+        endpoint en el controlador de concurrencia) y se reintenta.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", False)
+
+        if autenticar is None:
+            autenticar = self._es_url_graph(url)
+        if not autenticar:
+            return self.session.request(metodo, url, **kwargs)
+
+        clase = controlador_concurrencia.clasificar(url)
+        headers = dict(kwargs.pop("headers", None) or {})
+
+        for intento in range(config.MAX_REINTENTOS_LIMITACION + 1):
+            controlador_concurrencia.esperar(clase)
+
+            token = self.proveedor_token.obtener_token()
+            headers["Authorization"] = f"Bearer {token}"
+            response = self.session.request(metodo, url, headers=headers, **kwargs)
+
+            if response.status_code == 401:
+                self.proveedor_token.invalidar(token)
+                headers["Authorization"] = f"Bearer {self.proveedor_token.obtener_token()}"
+                response = self.session.request(metodo, url, headers=headers, **kwargs)
+
+            espera = controlador_concurrencia.registrar_respuesta(
+                clase, response.status_code, response.headers, intento
+            )
+            if not espera or intento == config.MAX_REINTENTOS_LIMITACION:
+                break
+            print(f"   ⏳ Graph limitó la petición ({response.status_code}), reintentando en {espera:.0f}s...")
+
+        return response
+
+    def listar(self, url: str, **kwargs):
+        """Itera todos los elementos de una colección paginada (@odata.nextLink)
+
+        Lanza requests.HTTPError si alguna página falla.
+        """
+        while url:
+            response = self.get(url, **kwargs)
+            response.raise_for_status()
+            data = response.json()
+            yield from data.get("value", [])
+            url = data.get("@odata.nextLink")
+
+    def resolver_usuarios(self, upns: list, select: str = "id,userPrincipalName") -> dict:
+        """Resuelve muchos UPN con '$filter=userPrincipalName in (...)'
+
+        Graph admite hasta 15 valores por filtro 'in'; los bloques se piden
+        en paralelo bajo el controlador de concurrencia.
+
+        Returns:
+            dict: {upn_en_minusculas: usuario} solo para los encontrados
+        """
+        unicos = sorted({str(u).strip().lower() for u in upns if u and str(u).strip()})
+        bloques = [unicos[i:i + self.TAMANO_FILTRO_IN] for i in range(0, len(unicos), self.TAMANO_FILTRO_IN)]
+        if "userPrincipalName" not in select.split(","):
+            select = f"{select},userPrincipalName"
+
+        def consultar(bloque):
+            valores = ",".join("'" + u.replace("'", "''") + "'" for u in bloque)
+            url = f"{config.GRAPH_ENDPOINT}/users?$filter=userPrincipalName in ({valores})&$select={select}"
+            return list(self.listar(url))
+
+        encontrados = {}
+        for usuarios in controlador_concurrencia.ejecutar(consultar, bloques, "usuarios"):
+            for usuario in usuarios:
+                encontrados[usuario["userPrincipalName"].lower()] = usuario
+        return encontrados
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def cerrar(self):
+        """Cierra las conexiones abiertas del pool"""
+        self.session.close()
+
+
+# Instancias globales del cliente y del token compartido
+cliente_graph = ClienteGraph()
+proveedor_token = cliente_graph.proveedor_token
@@ -0,0 +1,154 @@
+# scripts/cola_trabajos.py
+"""
+Cola de trabajos en segundo plano para las acciones de la aplicación web.
+
+Cada carga de archivo se registra como un trabajo con un id; un pool
+acotado de hilos lo ejecuta mientras la petición HTTP responde de
+inmediato. El estado y los resultados se guardan en SQLite, así que
+sobreviven a un reinicio (los trabajos que quedaron a medias se marcan
+como interrumpidos).
+"""
+
+import json
+import sqlite3
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+from scripts.progreso import registrar_reportador, activar_reportador, desactivar_reportador
+
+
+class ColaTrabajos:
+    """Ejecuta acciones en un pool de hilos y persiste su estado en SQLite"""
+
+    EN_COLA = "en_cola"
+    EJECUTANDO = "ejecutando"
+    COMPLETADO = "completado"
+    FALLIDO = "fallido"
+    INTERRUMPIDO = "interrumpido"
+
+    ESTADOS_FINALES = (COMPLETADO, FALLIDO, INTERRUMPIDO)
+
+    def __init__(self, ruta_db: str = None, max_trabajos: int = None):
+        self.ruta_db = ruta_db or config.COLA_TRABAJOS_DB
+        carpeta = os.path.dirname(self.ruta_db)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.ruta_db, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._crear_tablas()
+        self._marcar_interrumpidos()
+
+        self.max_trabajos = max_trabajos or config.MAX_TRABAJOS_SIMULTANEOS
+        self._pool = ThreadPoolExecutor(max_workers=self.max_trabajos, thread_name_prefix="trabajo")
+
+    def _crear_tablas(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    accion TEXT,
+                    archivo TEXT,
+                    estado TEXT,
+                    creado TEXT,
+                    iniciado TEXT,
+                    finalizado TEXT,
+                    resultados TEXT,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_trabajos_creado ON trabajos(creado);
+            """)
+
+    def _marcar_interrumpidos(self):
+        """Los trabajos pendientes de una ejecución anterior no se reanudan"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE trabajos SET estado = ?, finalizado = ?, "
+                "error = 'La aplicación se reinició antes de terminar el trabajo' "
+                "WHERE estado IN (?, ?)",
+                (self.INTERRUMPIDO, self._ahora(), self.EN_COLA, self.EJECUTANDO)
+            )
+
+    @staticmethod
+    def _ahora() -> str:
+        return datetime.now().isoformat(timespec="seconds")
+
+    def _actualizar(self, trabajo_id: str, **campos):
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE trabajos SET {asignaciones} WHERE id = ?",
+                (*campos.values(), trabajo_id)
+            )
+
+    def enviar(self, accion: str, archivo: str, funcion) -> str:
+        """Registra el trabajo y lo encola; devuelve su id de inmediato
+
+        Args:
+            accion: Nombre de la acción (crear, actualizar, ...)
+            archivo: Ruta del archivo subido
+            funcion: Callable(accion, archivo) que devuelve el dict de resultados
+        """
+        trabajo_id = uuid.uuid4().hex[:12]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO trabajos (id, accion, archivo, estado, creado) VALUES (?, ?, ?, ?, ?)",
+                (trabajo_id, accion, archivo, self.EN_COLA, self._ahora())
+            )
+        reportador = registrar_reportador(trabajo_id)
+        self._pool.submit(self._ejecutar, trabajo_id, accion, archivo, funcion, reportador)
+        return trabajo_id
+
+    def _ejecutar(self, trabajo_id: str, accion: str, archivo: str, funcion, reportador):
+        self._actualizar(trabajo_id, estado=self.EJECUTANDO, iniciado=self._ahora())
+        activar_reportador(reportador)
+        print(f"▶️  Trabajo {trabajo_id} ({accion}) iniciado")
+        try:
+            resultados = funcion(accion, archivo)
+            self._actualizar(
+                trabajo_id,
+                estado=self.COMPLETADO,
+                finalizado=self._ahora(),
+                resultados=json.dumps(resultados or {}, ensure_ascii=False, default=str)
+            )
+            print(f"✅ Trabajo {trabajo_id} ({accion}) completado")
+        except Exception as e:
+            traceback.print_exc()
+            self._actualizar(trabajo_id, estado=self.FALLIDO, finalizado=self._ahora(), error=str(e))
+            print(f"❌ Trabajo {trabajo_id} ({accion}) falló: {e}")
+        finally:
+            # Después de guardar el estado final, para que los suscriptores lo vean
+            desactivar_reportador()
+
+    def _a_dict(self, fila) -> dict:
+        trabajo = dict(fila)
+        trabajo["resultados"] = json.loads(trabajo["resultados"]) if trabajo["resultados"] else None
+        trabajo["terminado"] = trabajo["estado"] in self.ESTADOS_FINALES
+        return trabajo
+
+    def obtener(self, trabajo_id: str) -> dict or None:
+        """Estado actual del trabajo (None si no existe)"""
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+        return self._a_dict(fila) if fila else None
+
+    def listar(self, limite: int = 50) -> list:
+        """Trabajos más recientes primero"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT * FROM trabajos ORDER BY creado DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [self._a_dict(fila) for fila in filas]
+
+
+# Instancia global de la cola
+cola_trabajos = ColaTrabajos()
@@ -20,6 +20,37 @@ class ConfiguracionM365:
         self.AUTHORITY = os.getenv('AUTHORITY')
         self.GRAPH_ENDPOINT = os.getenv('GRAPH_ENDPOINT', 'https://graph.microsoft.com/v1.0')
         
+        # Cliente HTTP de Graph (pool de conexiones y timeout por defecto en segundos)
+        self.GRAPH_POOL_SIZE = int(os.getenv('GRAPH_POOL_SIZE', '20'))
+        self.GRAPH_TIMEOUT = float(os.getenv('GRAPH_TIMEOUT', '30'))
+        # Segundos antes de 'expires_in' en los que se renueva el token
+        self.TOKEN_MARGEN_RENOVACION = int(os.getenv('TOKEN_MARGEN_RENOVACION', '300'))
+        
+        # Concurrencia adaptativa frente a la limitación de Graph (429/503)
+        self.CONCURRENCIA_INICIAL = int(os.getenv('CONCURRENCIA_INICIAL', '4'))
+        self.CONCURRENCIA_MINIMA = int(os.getenv('CONCURRENCIA_MINIMA', '1'))
+        self.CONCURRENCIA_MAXIMA = int(os.getenv('CONCURRENCIA_MAXIMA', '16'))
+        self.MAX_REINTENTOS_LIMITACION = int(os.getenv('MAX_REINTENTOS_LIMITACION', '5'))
+        
+        # Seguimiento de clonaciones de Teams (teamsAsyncOperation), en segundos
+        self.CLON_ESPERA_INICIAL = float(os.getenv('CLON_ESPERA_INICIAL', '2'))
+        self.CLON_ESPERA_MAXIMA = float(os.getenv('CLON_ESPERA_MAXIMA', '30'))
+        self.CLON_TIEMPO_LIMITE = float(os.getenv('CLON_TIEMPO_LIMITE', '600'))
+        # Clonaciones en vuelo a la vez al crear Teams en modo concurrente
+        self.MAX_CLONES_SIMULTANEOS = int(os.getenv('MAX_CLONES_SIMULTANEOS', '5'))
+        
+        # Eliminaciones simultáneas al vaciar Teams (miembros y owners)
+        self.VACIADO_TRABAJADORES = int(os.getenv('VACIADO_TRABAJADORES', '8'))
+        # Peticiones $batch simultáneas al eliminar estudiantes en lotes
+        # y al restaurar o purgar elementos eliminados
+        self.ELIMINACION_LOTES_SIMULTANEOS = int(os.getenv('ELIMINACION_LOTES_SIMULTANEOS', '4'))
+        
+        # Diarios de checkpoint (uno por operación y archivo de entrada);
+        # fsync cada N entradas o cada tantos segundos
+        self.CARPETA_CHECKPOINTS = os.getenv('CARPETA_CHECKPOINTS', 'resultados/checkpoints')
+        self.CHECKPOINT_FSYNC_LOTE = int(os.getenv('CHECKPOINT_FSYNC_LOTE', '50'))
+        self.CHECKPOINT_FSYNC_SEGUNDOS = float(os.getenv('CHECKPOINT_FSYNC_SEGUNDOS', '2'))
+        
         # Configuración del colegio
         self.COLEGIO_NOMBRE = os.getenv('COLEGIO_NOMBRE')
         self.COLEGIO_DOMINIO = os.getenv('COLEGIO_DOMINIO')
@@ -44,6 +75,18 @@ class ConfiguracionM365:
         self.CARPETA_RESULTADOS = os.getenv('CARPETA_RESULTADOS', 'resultados')
         self.CARPETA_LOGS = os.getenv('CARPETA_LOGS', 'resultados/logs')
         
+        # Espejo local del directorio (SQLite + consultas delta)
+        self.USAR_DIRECTORIO_LOCAL = os.getenv('USAR_DIRECTORIO_LOCAL', 'false').lower() in ('true', '1', 'si', 'yes')
+        self.DIRECTORIO_LOCAL_DB = os.getenv('DIRECTORIO_LOCAL_DB', 'resultados/directorio.db')
+        self.DIRECTORIO_MAX_ANTIGUEDAD = int(os.getenv('DIRECTORIO_MAX_ANTIGUEDAD', '600'))  # segundos
+        
+        # Cola de trabajos de la aplicación web
+        self.COLA_TRABAJOS_DB = os.getenv('COLA_TRABAJOS_DB', 'resultados/trabajos.db')
+        self.MAX_TRABAJOS_SIMULTANEOS = int(os.getenv('MAX_TRABAJOS_SIMULTANEOS', '2'))
+        
+        # Índice de estadísticas del dashboard (resumen de cada log)
+        self.ESTADISTICAS_DB = os.getenv('ESTADISTICAS_DB', 'resultados/estadisticas.db')
+        
         # Logging
         self.LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
         self.LOG_FORMAT = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
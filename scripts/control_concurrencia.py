@@ -0,0 +1,191 @@
+# scripts/control_concurrencia.py
+"""
+Control adaptativo de concurrencia frente a la limitación (throttling) de Graph.
+Cada clase de endpoint (usuarios, grupos, teams) tiene su propio límite de
+operaciones en vuelo que sube poco a poco con cada éxito y se reduce a la
+mitad con cada 429/503 (AIMD), respetando el Retry-After recibido.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+
+
+class LimiteAdaptativo:
+    """Límite de operaciones en vuelo (AIMD) para una clase de endpoint"""
+
+    def __init__(self, nombre: str, inicial: int, minimo: int, maximo: int):
+        self.nombre = nombre
+        self.minimo = minimo
+        self.maximo = maximo
+        self.limite = float(min(max(inicial, minimo), maximo))
+        self.en_vuelo = 0
+        self.pausa_hasta = 0.0  # time.monotonic() hasta el que no se envía nada
+        self.exitos = 0
+        self.limitaciones = 0
+        self._cond = threading.Condition()
+
+    def esperar_pausa(self):
+        """Bloquea mientras la clase esté en pausa por un Retry-After"""
+        with self._cond:
+            while True:
+                restante = self.pausa_hasta - time.monotonic()
+                if restante <= 0:
+                    return
+                self._cond.wait(restante)
+
+    def adquirir(self):
+        """Reserva un hueco de ejecución respetando el límite actual"""
+        with self._cond:
+            while True:
+                restante = self.pausa_hasta - time.monotonic()
+                if restante > 0:
+                    self._cond.wait(restante)
+                elif self.en_vuelo < int(self.limite):
+                    self.en_vuelo += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def liberar(self):
+        with self._cond:
+            self.en_vuelo -= 1
+            self._cond.notify_all()
+
+    def registrar_exito(self):
+        """Incremento aditivo: +1 en el límite por cada 'ventana' completa de éxitos"""
+        with self._cond:
+            self.exitos += 1
+            self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+            self._cond.notify_all()
+
+    def registrar_limitacion(self, retry_after: float):
+        """Decremento multiplicativo y pausa de toda la clase
+
+        Las limitaciones que llegan durante una pausa ya en curso (p. ej.
+        varios hilos que reciben 429 a la vez) solo la alargan: el límite se
+        reduce a la mitad una vez por ventana de pausa.
+        """
+        with self._cond:
+            self.limitaciones += 1
+            ahora = time.monotonic()
+            if ahora >= self.pausa_hasta:
+                self.limite = max(self.minimo, self.limite / 2)
+            self.pausa_hasta = max(self.pausa_hasta, ahora + retry_after)
+            self._cond.notify_all()
+
+    def estado(self) -> dict:
+        with self._cond:
+            return {
+                "limite": int(self.limite),
+                "en_vuelo": self.en_vuelo,
+                "pausa_restante": round(max(0.0, self.pausa_hasta - time.monotonic()), 1),
+                "exitos": self.exitos,
+                "limitaciones": self.limitaciones
+            }
+
+
+class ControladorConcurrencia:
+    """Ejecuta operaciones en paralelo ajustando la concurrencia según Graph"""
+
+    CLASES = ("usuarios", "grupos", "teams", "otros")
+    STATUS_LIMITACION = (429, 503)
+
+    def __init__(self, inicial: int = None, minimo: int = None, maximo: int = None):
+        inicial = inicial or config.CONCURRENCIA_INICIAL
+        minimo = minimo or config.CONCURRENCIA_MINIMA
+        maximo = maximo or config.CONCURRENCIA_MAXIMA
+        self.limites = {
+            clase: LimiteAdaptativo(clase, inicial, minimo, maximo)
+            for clase in self.CLASES
+        }
+
+    @staticmethod
+    def clasificar(url: str) -> str:
+        """Clase de endpoint a partir de la URL (absoluta o relativa)"""
+        ruta = url
+        if ruta.startswith(config.GRAPH_ENDPOINT):
+            ruta = ruta[len(config.GRAPH_ENDPOINT):]
+        ruta = ruta.lstrip("/").lower()
+
+        if ruta.startswith("users"):
+            return "usuarios"
+        if ruta.startswith("groups"):
+            return "grupos"
+        if ruta.startswith("teams"):
+            return "teams"
+        return "otros"
+
+    @staticmethod
+    def leer_retry_after(headers, intento: int = 0) -> float:
+        """Segundos a esperar según Retry-After (segundos o fecha HTTP)"""
+        valor = (headers or {}).get("Retry-After")
+        if valor:
+            try:
+                return max(float(valor), 0.0)
+            except (TypeError, ValueError):
+                try:
+                    fecha = parsedate_to_datetime(valor)
+                    return max((fecha - datetime.now(timezone.utc)).total_seconds(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        # Sin cabecera: espera exponencial
+        return float(min(2 ** intento, 60))
+
+    def limite(self, clase: str) -> LimiteAdaptativo:
+        return self.limites.get(clase, self.limites["otros"])
+
+    def esperar(self, clase: str):
+        """Espera a que termine la pausa (Retry-After) de la clase"""
+        self.limite(clase).esperar_pausa()
+
+    def registrar_respuesta(self, clase: str, status_code: int, headers=None, intento: int = 0) -> float:
+        """Actualiza el límite según la respuesta
+
+        Returns:
+            float: segundos de espera si fue limitada, 0 si no
+        """
+        limite = self.limite(clase)
+        if status_code in self.STATUS_LIMITACION:
+            espera = max(self.leer_retry_after(headers, intento), 0.5)
+            limite.registrar_limitacion(espera)
+            return espera
+        if 200 <= status_code < 300:
+            limite.registrar_exito()
+        return 0.0
+
+    def ejecutar(self, funcion, elementos: list, clase: str = "otros", max_trabajadores: int = None) -> list:
+        """Aplica 'funcion' a cada elemento en paralelo
+
+        El número de llamadas simultáneas lo decide el límite adaptativo de
+        la clase (sin superar 'max_trabajadores', si se indica). Devuelve los
+        resultados en el mismo orden que 'elementos'.
+        """
+        limite = self.limite(clase)
+        trabajadores = min(max_trabajadores or limite.maximo, limite.maximo)
+
+        def tarea(elemento):
+            limite.adquirir()
+            try:
+                return funcion(elemento)
+            finally:
+                limite.liberar()
+
+        with ThreadPoolExecutor(max_workers=max(trabajadores, 1)) as pool:
+            return list(pool.map(tarea, elementos))
+
+    def limites_actuales(self) -> dict:
+        """Estado actual de cada clase (para diagnóstico)"""
+        return {clase: limite.estado() for clase, limite in self.limites.items()}
+
+
+# Instancia global del controlador
+controlador_concurrencia = ControladorConcurrencia()
@@ -1,13 +1,21 @@
 import pandas as pd
-import requests
 import urllib3
 from datetime import datetime
 import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import LectorArchivo
+from scripts.preprocesamiento import limpiar_columnas, errores_obligatorios, filas_duplicadas, registros
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.progreso import reportador_actual
+from scripts.diario_checkpoint import abrir_diario
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -15,6 +23,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 class CreadorEquiposTeamsMultipleOwners:
     """Crea Teams con múltiples owners automáticamente"""
     
+    HOJA_EQUIPOS = "Grupos de Estudio"
+    
     def __init__(self):
         try:
             config.validar_configuracion()
@@ -25,6 +35,10 @@ class CreadorEquiposTeamsMultipleOwners:
         self.team_fuente_id = self.obtener_team_fuente_id_desde_env()
         self.usuarios_cache = {}
         self.teams_existentes = {}
+        # Protege teams_existentes y los contadores en el modo concurrente
+        self._lock = threading.RLock()
+        self.progreso = reportador_actual()
+        self.diario = None  # Checkpoint del archivo en proceso
         
         self.resultados = {
             "total": 0,
@@ -74,18 +88,8 @@ class CreadorEquiposTeamsMultipleOwners:
     
     def obtener_token(self) -> bool:
         """Obtiene token de acceso"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False, timeout=10)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido")
             return True
         except Exception as e:
@@ -96,38 +100,16 @@ class CreadorEquiposTeamsMultipleOwners:
     def cargar_archivo(self, ruta_archivo: str) -> pd.DataFrame:
         """Carga Excel - Detecta automáticamente la hoja"""
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                try:
-                    df = pd.read_excel(ruta_archivo, sheet_name="Grupos de Estudio", dtype=str)
-                    print("✅ Hoja 'Grupos de Estudio' encontrada")
-                except:
-                    print("⚠️ Hoja 'Grupos de Estudio' no encontrada. Detectando hojas disponibles...")
-                    xl_file = pd.ExcelFile(ruta_archivo)
-                    hojas_disponibles = xl_file.sheet_names
-                    
-                    print(f"📋 Hojas disponibles: {hojas_disponibles}")
-                    
-                    if not hojas_disponibles:
-                        raise ValueError("El Excel no tiene hojas")
-                    
-                    df = None
-                    for hoja in hojas_disponibles:
-                        temp_df = pd.read_excel(ruta_archivo, sheet_name=hoja, dtype=str)
-                        if len(temp_df) > 0:
-                            df = temp_df
-                            print(f"✅ Usando hoja: '{hoja}' ({len(df)} filas)")
-                            break
-                    
-                    if df is None:
-                        raise ValueError("Todas las hojas están vacías")
+            # El libro se abre una sola vez: la hoja se elige y se lee en la misma pasada
+            lector = LectorArchivo(ruta_archivo, hojas_preferidas=[self.HOJA_EQUIPOS])
+            df = lector.dataframe()
             
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("Formato no soportado")
-            
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            if lector.es_excel:
+                if lector.hoja == self.HOJA_EQUIPOS:
+                    print(f"✅ Hoja '{self.HOJA_EQUIPOS}' encontrada")
+                else:
+                    print(f"⚠️ Hoja '{self.HOJA_EQUIPOS}' no encontrada")
+                    print(f"✅ Usando hoja: '{lector.hoja}' ({len(df)} filas)")
             
             print(f"✅ {len(df)} equipos cargados")
             self.resultados["total"] = len(df)
@@ -188,7 +170,7 @@ class CreadorEquiposTeamsMultipleOwners:
             url = f"{config.GRAPH_ENDPOINT}/groups?$select=id,displayName&$top=999"
             
             while url:
-                response = requests.get(url, headers=headers, verify=False, timeout=15)
+                response = cliente_graph.get(url, headers=headers, verify=False, timeout=15)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -213,17 +195,13 @@ class CreadorEquiposTeamsMultipleOwners:
     def validar_datos(self, df: pd.DataFrame, col_eq: str, col_doc: str) -> bool:
         """Valida datos básicos"""
         print("\n🔍 Validando datos...")
-        errores = []
+        errores = errores_obligatorios(df, {col_eq: "Equipo", col_doc: "Docente"})
         
-        for idx, row in df.iterrows():
-            eq = str(row[col_eq]).strip() if row[col_eq] else ""
-            doc = str(row[col_doc]).strip() if row[col_doc] else ""
-            
-            if not eq or eq == "nan":
-                errores.append(f"Fila {idx+2}: Equipo vacío")
-            
-            if not doc or doc == "nan":
-                errores.append(f"Fila {idx+2}: Docente vacío")
+        duplicados = filas_duplicadas(df, col_eq, "Equipo")
+        if duplicados:
+            print(f"⚠️  {len(duplicados)} equipos repetidos en el archivo (solo se crea uno):")
+            for aviso in duplicados[:5]:
+                print(f"   {aviso}")
         
         if errores:
             print(f"❌ {len(errores)} errores encontrados")
@@ -245,6 +223,13 @@ class CreadorEquiposTeamsMultipleOwners:
         if upn in self.usuarios_cache:
             return self.usuarios_cache[upn]
         
+        directorio = obtener_directorio()
+        if directorio:
+            user_id = directorio.obtener_user_id(upn)
+            if user_id:
+                self.usuarios_cache[upn] = user_id
+                return user_id
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -252,7 +237,7 @@ class CreadorEquiposTeamsMultipleOwners:
         
         try:
             url = f"{config.GRAPH_ENDPOINT}/users/{upn}?$select=id,displayName"
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 user_id = response.json().get("id")
@@ -263,23 +248,79 @@ class CreadorEquiposTeamsMultipleOwners:
         
         return None
 
+    def resolver_usuarios(self, upns: list):
+        """Resuelve en bloque los IDs de todos los docentes y owners del archivo
+
+        Usa primero el cache y el directorio local; el resto se consulta a
+        Graph en bloques de 15 UPN por petición. Los no encontrados quedan
+        en el cache como None para no volver a buscarlos uno a uno.
+        """
+        pendientes = []
+        directorio = obtener_directorio()
+        
+        for upn in {str(u).strip().lower() for u in upns if self.es_valor_valido(u)}:
+            if upn in self.usuarios_cache:
+                continue
+            user_id = directorio.obtener_user_id(upn) if directorio else None
+            if user_id:
+                self.usuarios_cache[upn] = user_id
+            else:
+                pendientes.append(upn)
+        
+        if not pendientes:
+            return
+        
+        print(f"🔍 Resolviendo {len(pendientes)} docentes/owners en Azure AD...")
+        try:
+            encontrados = cliente_graph.resolver_usuarios(pendientes, select="id")
+        except Exception as e:
+            # Sin resolución en bloque se sigue con la búsqueda individual
+            print(f"⚠️  Error resolviendo usuarios: {e}")
+            return
+        
+        for upn in pendientes:
+            usuario = encontrados.get(upn)
+            self.usuarios_cache[upn] = usuario["id"] if usuario else None
+        print(f"✅ {len(encontrados)}/{len(pendientes)} encontrados")
+
     def equipo_existe(self, nombre_equipo: str) -> bool:
         """ANTI-DUPLICADOS: Verifica si el Team YA EXISTE"""
         nombre_equipo = nombre_equipo.strip()
-        return nombre_equipo in self.teams_existentes
+        with self._lock:
+            return nombre_equipo in self.teams_existentes
+
+    def reservar_equipo(self, nombre_equipo: str) -> bool:
+        """ANTI-DUPLICADOS: Reserva el nombre si nadie lo tiene (atómico)
+
+        Con varias clonaciones en vuelo, dos filas con el mismo equipo no
+        pueden pasar ambas la comprobación: solo la primera obtiene la reserva.
+        """
+        nombre_equipo = nombre_equipo.strip()
+        with self._lock:
+            if nombre_equipo in self.teams_existentes:
+                return False
+            self.teams_existentes[nombre_equipo] = "cloning"
+            return True
+
+    def liberar_equipo(self, nombre_equipo: str):
+        """Quita la reserva de un Team cuya clonación no llegó a iniciarse"""
+        with self._lock:
+            if self.teams_existentes.get(nombre_equipo.strip()) == "cloning":
+                del self.teams_existentes[nombre_equipo.strip()]
 
     def clonar_team(self, display_name: str, description: str, owner_principal_upn: str) -> tuple:
         """Clona Team "Fuente" (sin agregar owners aún)"""
         if not self.token or not self.team_fuente_id:
             return False, None, "Token o Team Fuente no disponible"
         
-        if self.equipo_existe(display_name):
+        if not self.reservar_equipo(display_name):
             print(f"    ⚠️ {display_name}: YA EXISTE (saltando)")
-            self.resultados["equipos_omitidos_duplicado"] += 1
-            self.resultados["equipos_saltados"].append({
-                "Equipo": display_name,
-                "Razon": "Ya existe en el tenant"
-            })
+            with self._lock:
+                self.resultados["equipos_omitidos_duplicado"] += 1
+                self.resultados["equipos_saltados"].append({
+                    "Equipo": display_name,
+                    "Razon": "Ya existe en el tenant"
+                })
             return True, None, "Ya existe (saltado)"
         
         headers = {
@@ -289,6 +330,7 @@ class CreadorEquiposTeamsMultipleOwners:
         
         owner_id = self.obtener_user_id(owner_principal_upn)
         if not owner_id:
+            self.liberar_equipo(display_name)
             return False, None, f"Docente no encontrado: {owner_principal_upn}"
         
         mail_nickname = display_name.replace(" ", "").replace("-", "")[:25]
@@ -303,27 +345,82 @@ class CreadorEquiposTeamsMultipleOwners:
         url = f"{config.GRAPH_ENDPOINT}/teams/{self.team_fuente_id}/clone"
         
         try:
-            response = requests.post(url, json=body, headers=headers, verify=False, timeout=30)
+            response = cliente_graph.post(url, json=body, headers=headers, verify=False, timeout=30)
             
             if response.status_code == 202:
-                print(f"    ✅ Clonado: {display_name}")
-                time.sleep(2)
-                team_id = self.obtener_team_id_por_nombre(display_name)
-                self.teams_existentes[display_name] = "cloning"
+                print(f"    ⏳ Clonación iniciada: {display_name}")
+                
+                location = response.headers.get("Location")
+                if location:
+                    team_id, error = self.esperar_clonacion(location, headers)
+                else:
+                    team_id, error = self.obtener_team_id_por_nombre(display_name), None
+                
+                if error:
+                    return False, None, error
+                if team_id:
+                    with self._lock:
+                        self.teams_existentes[display_name] = team_id
+                    print(f"    ✅ Clonado: {display_name}")
                 return True, team_id, "Clonado"
             
             elif response.status_code == 400:
                 error_detail = response.json().get('error', {}).get('message', '')
                 if "already exists" in error_detail.lower():
                     return True, None, "Rechazado (ya existe)"
+                self.liberar_equipo(display_name)
                 return False, None, f"Error: {error_detail[:50]}"
             
             else:
+                self.liberar_equipo(display_name)
                 return False, None, f"Error {response.status_code}"
         
         except Exception as e:
+            self.liberar_equipo(display_name)
             return False, None, f"Error: {str(e)[:50]}"
 
+    def esperar_clonacion(self, location: str, headers: dict) -> tuple:
+        """Consulta la teamsAsyncOperation del clon hasta que termina
+
+        La espera entre consultas se duplica (respetando Retry-After) desde
+        CLON_ESPERA_INICIAL hasta CLON_ESPERA_MAXIMA.
+
+        Returns:
+            tuple: (team_id, error) — team_id es el targetResourceId si la
+                operación terminó bien; error es None salvo si falló o expiró
+        """
+        url = location if location.startswith("http") else f"{config.GRAPH_ENDPOINT}{location}"
+        espera = config.CLON_ESPERA_INICIAL
+        limite = time.monotonic() + config.CLON_TIEMPO_LIMITE
+        
+        while True:
+            try:
+                response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
+            except Exception as e:
+                response = None
+                print(f"    ⚠️ Error consultando la clonación: {str(e)[:50]}")
+            
+            if response is not None and response.status_code == 200:
+                operacion = response.json()
+                estado = operacion.get("status", "")
+                
+                if estado == "succeeded":
+                    return operacion.get("targetResourceId"), None
+                if estado == "failed":
+                    detalle = (operacion.get("error") or {}).get("message", "sin detalle")
+                    return None, f"Clonación fallida: {detalle[:50]}"
+            
+            elif response is not None and response.status_code not in (404, 429, 503):
+                # 404: la operación aún no es visible; 429/503 ya se reintentaron
+                return None, f"Error consultando clonación: Status {response.status_code}"
+            
+            if time.monotonic() + espera > limite:
+                return None, f"Clonación sin terminar tras {config.CLON_TIEMPO_LIMITE:.0f}s"
+            
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else espera)
+            espera = min(espera * 2, config.CLON_ESPERA_MAXIMA)
+
     def obtener_team_id_por_nombre(self, display_name: str) -> str or None:
         """Obtiene el ID del Team por su nombre"""
         if not self.token:
@@ -335,11 +432,17 @@ class CreadorEquiposTeamsMultipleOwners:
         }
         
         try:
-            if display_name in self.teams_existentes:
+            if self.teams_existentes.get(display_name) not in (None, "cloning"):
                 return self.teams_existentes[display_name]
             
+            directorio = obtener_directorio()
+            if directorio:
+                grupo = directorio.obtener_grupo_por_nombre(display_name)
+                if grupo:
+                    return grupo["id"]
+            
             url = f"{config.GRAPH_ENDPOINT}/groups?$filter=displayName eq '{display_name}'&$select=id"
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -368,7 +471,7 @@ class CreadorEquiposTeamsMultipleOwners:
         url = f"{config.GRAPH_ENDPOINT}/teams/{team_id}/members/{user_id}"
         
         try:
-            response = requests.patch(url, json=body, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.patch(url, json=body, headers=headers, verify=False, timeout=10)
             
             if response.status_code in [200, 204]:
                 print(f"       ✅ ACTUALIZADO A OWNER: {email}")
@@ -399,8 +502,9 @@ class CreadorEquiposTeamsMultipleOwners:
         user_id = self.obtener_user_id(email)
         if not user_id:
             print(f"       ⚠️ NO ENCONTRADO: {email}")
-            self.resultados["errores_agregando_owners"] += 1
-            self.resultados["errores"].append(f"Owner no agregado: {email} - Usuario no encontrado")
+            with self._lock:
+                self.resultados["errores_agregando_owners"] += 1
+                self.resultados["errores"].append(f"Owner no agregado: {email} - Usuario no encontrado")
             return False
         
         body = {
@@ -412,7 +516,7 @@ class CreadorEquiposTeamsMultipleOwners:
         url = f"{config.GRAPH_ENDPOINT}/teams/{team_id}/members"
         
         try:
-            response = requests.post(url, json=body, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.post(url, json=body, headers=headers, verify=False, timeout=10)
             
             if response.status_code in [200, 201]:
                 print(f"       ✅ OWNER AGREGADO: {email}")
@@ -444,98 +548,200 @@ class CreadorEquiposTeamsMultipleOwners:
             return False
         return True
 
-    def procesar(self, df: pd.DataFrame, columnas: dict) -> dict:
-        """Procesa clonación Y AGREGACIÓN DE OWNERS - VERSIÓN FINAL CORREGIDA"""
-        print("\n" + "="*70)
-        print("🔄 CLONANDO TEAMS CON MÚLTIPLES OWNERS")
-        print("="*70)
+    COLUMNAS_OWNERS_ADICIONALES = ("CoordinadorSeccion", "CuentaAcademica", "Owner3", "Owner4")
+
+    def owners_de_fila(self, row: dict, columnas: dict) -> list:
+        """UPN de los owners de la fila, sin repetidos y en minúsculas"""
+        # DOCENTE (siempre) y luego coordinador, cuenta académica, owner 3 y 4
+        owners = [row[columnas['Docente']]]
+        for clave in self.COLUMNAS_OWNERS_ADICIONALES:
+            columna = columnas.get(clave)
+            if columna is not None and self.es_valor_valido(row[columna]):
+                owners.append(row[columna])
+        return list(dict.fromkeys(str(o).strip().lower() for o in owners))
+
+    def agregar_owners_masivo(self, team_id: str, user_ids: dict) -> dict:
+        """Agrega varios owners con una sola acción 'members/add'
+
+        Args:
+            user_ids: {email: user_id}
+
+        Returns:
+            dict: {email: True/False}; vacío si la acción completa falló
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        body = {
+            "values": [
+                {
+                    "@odata.type": "microsoft.graph.aadUserConversationMember",
+                    "roles": ["owner"],
+                    "user@odata.bind": f"https://graph.microsoft.com/v1.0/users('{user_id}')"
+                }
+                for user_id in user_ids.values()
+            ]
+        }
+        url = f"{config.GRAPH_ENDPOINT}/teams/{team_id}/members/add"
         
-        col_eq = columnas.get('Equipo')
-        col_doc = columnas.get('Docente')
-        col_grupo = columnas.get('Grupo')
-        col_asignatura = columnas.get('Asignatura')
-        col_grado = columnas.get('Grado')
-        col_coord_sec = columnas.get('CoordinadorSeccion')
-        col_cuenta_acad = columnas.get('CuentaAcademica')
-        col_owner3 = columnas.get('Owner3')
-        col_owner4 = columnas.get('Owner4')
-        
-        for idx, row in df.iterrows():
-            eq = str(row[col_eq]).strip() if row[col_eq] else ""
-            doc = str(row[col_doc]).strip() if row[col_doc] else ""
-            grupo = str(row[col_grupo]).strip() if col_grupo and row[col_grupo] else ""
-            asignatura = str(row[col_asignatura]).strip() if col_asignatura and row[col_asignatura] else ""
-            grado = str(row[col_grado]).strip() if col_grado and row[col_grado] else ""
-            
-            if not eq or eq == "nan" or not doc or doc == "nan":
-                continue
-            
-            print(f"\n[{idx+1}] Procesando: {eq}")
-            
-            description = f"{asignatura} - {grado} {grupo}".strip()
-            
-            # PASO 1: CLONAR
+        try:
+            response = cliente_graph.post(url, json=body, headers=headers, verify=False, timeout=30)
+        except Exception as e:
+            print(f"       ⚠️ Error en members/add: {str(e)[:50]}")
+            return {}
+        
+        if response.status_code not in (200, 207):
+            print(f"       ⚠️ members/add respondió {response.status_code}")
+            return {}
+        
+        sin_error = {
+            parte.get("userId") for parte in response.json().get("value", [])
+            if not parte.get("error")
+        }
+        return {email: user_id in sin_error for email, user_id in user_ids.items()}
+
+    def agregar_owners(self, team_id: str, row: dict, columnas: dict):
+        """Agrega el docente y los owners adicionales de la fila
+
+        Todos van en una sola acción 'members/add'; los que fallen (o todos,
+        si la acción falla) se reintentan uno a uno con agregar_owner_individual,
+        que además convierte en owner a quien ya era miembro.
+        """
+        print(f"    🔐 Agregando owners...")
+        
+        user_ids = {}
+        for email in self.owners_de_fila(row, columnas):
+            user_id = self.obtener_user_id(email)
+            if user_id:
+                user_ids[email] = user_id
+            else:
+                print(f"       ⚠️ NO ENCONTRADO: {email}")
+                with self._lock:
+                    self.resultados["errores_agregando_owners"] += 1
+                    self.resultados["errores"].append(f"Owner no agregado: {email} - Usuario no encontrado")
+        
+        if not user_ids:
+            return
+        
+        resultados = self.agregar_owners_masivo(team_id, user_ids)
+        agregados = 0
+        for email in user_ids:
+            if resultados.get(email):
+                print(f"       ✅ OWNER AGREGADO: {email}")
+                agregados += 1
+            elif self.agregar_owner_individual(team_id, email):
+                agregados += 1
+        
+        with self._lock:
+            self.resultados["total_owners_agregados"] += agregados
+
+    def procesar_equipo(self, row: dict, columnas: dict, posicion: int):
+        """Clona un Team de la fila y, en cuanto está listo, agrega sus owners"""
+        eq = row[columnas['Equipo']]
+        doc = row[columnas['Docente']]
+        grupo = row[columnas['Grupo']] if columnas.get('Grupo') else ""
+        asignatura = row[columnas['Asignatura']] if columnas.get('Asignatura') else ""
+        grado = row[columnas['Grado']] if columnas.get('Grado') else ""
+        
+        print(f"\n[{posicion}] Procesando: {eq}")
+        self.progreso.actualizar(actual=eq)
+        
+        description = f"{asignatura} - {grado} {grupo}".strip()
+        
+        # PASO 1: CLONAR (espera a que la operación asíncrona termine)
+        clon_previo = self.diario.obtener(f"clon:{eq}") if self.diario else None
+        if clon_previo:
+            # La ejecución anterior clonó el Team pero no terminó de agregar owners
+            exito_clonacion, team_id, msg_clonacion = True, clon_previo["team_id"], "Clonado (reanudado)"
+        else:
             exito_clonacion, team_id, msg_clonacion = self.clonar_team(eq, description, doc)
-            
-            if not exito_clonacion:
-                print(f"    ❌ Error clonando: {msg_clonacion}")
+            if exito_clonacion and team_id:
+                self.marcar(f"clon:{eq}", team_id=team_id)
+        
+        if not exito_clonacion:
+            print(f"    ❌ Error clonando {eq}: {msg_clonacion}")
+            with self._lock:
                 if "Docente no encontrado" in msg_clonacion:
                     self.resultados["docentes_no_encontrados"] += 1
                 else:
                     self.resultados["errores_clonacion"] += 1
                 self.resultados["errores"].append(f"{eq}: {msg_clonacion}")
-            
-            elif "Ya existe" in msg_clonacion or "Rechazado" in msg_clonacion:
+        
+        elif "Ya existe" in msg_clonacion or "Rechazado" in msg_clonacion:
+            with self._lock:
                 self.resultados["equipos_ya_existentes"] += 1
-            
-            else:
-                # PASO 2: AGREGAR MÚLTIPLES OWNERS - CORREGIDO
-                if team_id:
-                    print(f"    🔐 Agregando owners...")
-                    
-                    # DOCENTE (siempre se agrega)
-                    if self.agregar_owner_individual(team_id, doc):
-                        self.resultados["total_owners_agregados"] += 1
-                    
-                    # COORDINADOR DE SECCIÓN - ✅ VALIDACIÓN CORRECTA
-                    if col_coord_sec is not None:
-                        if self.es_valor_valido(row[col_coord_sec]):
-                            coord = str(row[col_coord_sec]).strip()
-                            if self.agregar_owner_individual(team_id, coord):
-                                self.resultados["total_owners_agregados"] += 1
-                    
-                    # CUENTA ACADÉMICA - ✅ VALIDACIÓN CORRECTA
-                    if col_cuenta_acad is not None:
-                        if self.es_valor_valido(row[col_cuenta_acad]):
-                            cuenta = str(row[col_cuenta_acad]).strip()
-                            if self.agregar_owner_individual(team_id, cuenta):
-                                self.resultados["total_owners_agregados"] += 1
-                    
-                    # OWNER 3 - ✅ VALIDACIÓN CORRECTA
-                    if col_owner3 is not None:
-                        if self.es_valor_valido(row[col_owner3]):
-                            owner3 = str(row[col_owner3]).strip()
-                            if self.agregar_owner_individual(team_id, owner3):
-                                self.resultados["total_owners_agregados"] += 1
-                    
-                    # OWNER 4 - ✅ VALIDACIÓN CORRECTA
-                    if col_owner4 is not None:
-                        if self.es_valor_valido(row[col_owner4]):
-                            owner4 = str(row[col_owner4]).strip()
-                            if self.agregar_owner_individual(team_id, owner4):
-                                self.resultados["total_owners_agregados"] += 1
-                    
-                    self.resultados["creados_exitosamente"] += 1
-                else:
-                    self.resultados["creados_exitosamente"] += 1
-            
+            self.marcar(f"equipo:{eq}", resultado="ya_existe")
+        
+        else:
+            # PASO 2: AGREGAR MÚLTIPLES OWNERS
+            if team_id:
+                self.agregar_owners(team_id, row, columnas)
+            with self._lock:
+                self.resultados["creados_exitosamente"] += 1
+            self.marcar(f"equipo:{eq}", resultado="creado")
+        
+        with self._lock:
             self.resultados["equipos_procesados"].append({
                 "Equipo": eq,
                 "Docente": doc,
                 "Resultado": msg_clonacion
             })
-            
-            time.sleep(1)
+        self.progreso.avanzar(
+            actual=eq, exito=exito_clonacion,
+            error=None if exito_clonacion else f"{eq}: {msg_clonacion}"
+        )
+
+    def marcar(self, clave: str, **datos):
+        """Anota en el checkpoint un paso completado ('clon:' o 'equipo:')"""
+        if self.diario:
+            self.diario.registrar(clave, **datos)
+
+    def procesar(self, df: pd.DataFrame, columnas: dict, modo: str = "concurrente") -> dict:
+        """Procesa clonación y agregación de owners
+
+        Args:
+            modo: "serial" (un Team a la vez) o "concurrente" (hasta
+                MAX_CLONES_SIMULTANEOS clonaciones en vuelo; cada Team recibe
+                sus owners apenas termina su clonación)
+        """
+        print("\n" + "="*70)
+        print("🔄 CLONANDO TEAMS CON MÚLTIPLES OWNERS")
+        print("="*70)
+        
+        col_eq = columnas.get('Equipo')
+        col_doc = columnas.get('Docente')
+        filas = [row for row in registros(df) if row[col_eq] and row[col_doc]]
+        
+        if self.diario and self.diario.reanudado:
+            terminados = [self.diario.obtener(f"equipo:{row[col_eq]}") for row in filas]
+            terminados = [entrada for entrada in terminados if entrada is not None]
+            if terminados:
+                print(f"♻️  {len(terminados)} equipos ya terminados en la ejecución anterior (omitidos)")
+                for entrada in terminados:
+                    if entrada.get("resultado") == "ya_existe":
+                        self.resultados["equipos_ya_existentes"] += 1
+                    else:
+                        self.resultados["creados_exitosamente"] += 1
+                filas = [row for row in filas if not self.diario.hecho(f"equipo:{row[col_eq]}")]
+        
+        # Los coordinadores se repiten en cientos de equipos: una sola resolución
+        self.resolver_usuarios([upn for row in filas for upn in self.owners_de_fila(row, columnas)])
+        self.progreso.iniciar(total=len(filas), etapa="Clonando Teams")
+        
+        if modo == "concurrente" and len(filas) > 1:
+            simultaneos = min(config.MAX_CLONES_SIMULTANEOS, len(filas))
+            print(f"⚡ Hasta {simultaneos} clonaciones simultáneas")
+            with ThreadPoolExecutor(max_workers=simultaneos, thread_name_prefix="clon") as pool:
+                futuros = [
+                    pool.submit(self.procesar_equipo, row, columnas, posicion)
+                    for posicion, row in enumerate(filas, 1)
+                ]
+                for futuro in futuros:
+                    futuro.result()
+        else:
+            for posicion, row in enumerate(filas, 1):
+                self.procesar_equipo(row, columnas, posicion)
         
         print("\n" + "="*70)
         return self.resultados
@@ -589,6 +795,8 @@ class CreadorEquiposTeamsMultipleOwners:
                     for error in self.resultados['errores']:
                         f.write(f"  • {error}\n")
             
+            registrar_log(log_file)
+            
             print(f"\n📝 Log guardado: {log_file}")
         
         except Exception as e:
@@ -613,14 +821,22 @@ class CreadorEquiposTeamsMultipleOwners:
             
             self.obtener_todos_teams_existentes()
             
-            df = self.cargar_archivo(ruta_archivo)
+            # Limpieza vectorizada de todas las columnas (nulos y espacios)
+            df = limpiar_columnas(self.cargar_archivo(ruta_archivo))
             
             columnas = self.detectar_columnas(df)
             
             if not self.validar_datos(df, columnas['Equipo'], columnas['Docente']):
                 raise Exception("Validación fallida")
             
-            self.procesar(df, columnas)
+            self.diario = abrir_diario("crear_teams_con_owners", ruta_archivo)
+            try:
+                self.procesar(df, columnas)
+            finally:
+                self.diario.finalizar(all(
+                    self.diario.hecho(f"equipo:{row}")
+                    for row in df[columnas['Equipo']] if row
+                ))
             
             self.mostrar_resumen()
             
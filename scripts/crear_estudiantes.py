@@ -3,14 +3,23 @@
 import pandas as pd
 import requests
 import json
+import asyncio
 import urllib3
 from datetime import datetime
+from typing import Optional
 import os
 import sys
 
 # Añadir la carpeta scripts al path para importar configuración
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.preprocesamiento import limpiar_columnas, errores_obligatorios, filas_duplicadas, registros
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.lotes_graph import EjecutorLotes
+from scripts.progreso import reportador_actual
+from scripts.diario_checkpoint import abrir_diario
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -21,47 +30,34 @@ class CreadorEstudiantes:
         # Validar configuración al inicializar
         config.validar_configuracion()
         self.token = None
+        self.progreso = reportador_actual()
+        self.diario = None  # Checkpoint del archivo en proceso
+        self.por_licenciar = []  # Códigos que seguro necesitan licencia
+        self.licencia_por_verificar = []  # Códigos cuya licencia se desconoce (reanudación)
+        self.existentes = set()  # Códigos cuya cuenta ya existía antes de esta herramienta
+        self.licencias_libres = None  # Puestos libres de LICENSE_STUDENT (None: desconocido)
         self.resultados = {
             "total": 0,
             "creados": 0,
             "licenciados": 0,
+            "ya_existentes": 0,
             "errores": 0,
             "detalles_errores": []
         }
         
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido correctamente")
             return True
         except requests.RequestException as e:
             print(f"❌ Error obteniendo token: {e}")
             return False
 
-    def crear_estudiante(self, estudiante: dict) -> bool:
-        """Crea un estudiante individual en Microsoft 365"""
-        if not self.token:
-            print("❌ Token no disponible")
-            return False
-            
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-
-        # Datos del estudiante usando configuración
-        user_data = {
+    def construir_usuario(self, estudiante: dict) -> dict:
+        """Datos del estudiante usando configuración"""
+        return {
             "accountEnabled": True,
             "displayName": f"Estudiante - {estudiante['CURSO']}: {estudiante['NOMBRES']} {estudiante['APELLIDOS']}",
             "mailNickname": estudiante["CODIGO"],
@@ -78,8 +74,28 @@ class CreadorEstudiantes:
             "city": "Bogotá"
         }
 
+    def construir_licencia(self) -> dict:
+        """Cuerpo de assignLicense para la licencia A1 de estudiante"""
+        return {
+            "addLicenses": [{"skuId": config.LICENSE_STUDENT}],
+            "removeLicenses": []
+        }
+
+    def crear_estudiante(self, estudiante: dict) -> bool:
+        """Crea un estudiante individual en Microsoft 365"""
+        if not self.token:
+            print("❌ Token no disponible")
+            return False
+            
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+
+        user_data = self.construir_usuario(estudiante)
+
         try:
-            response = requests.post(
+            response = cliente_graph.post(
                 f"{config.GRAPH_ENDPOINT}/users", 
                 headers=headers, 
                 json=user_data,
@@ -111,16 +127,13 @@ class CreadorEstudiantes:
             "Content-Type": "application/json"
         }
 
-        data = {
-            "addLicenses": [{"skuId": config.LICENSE_STUDENT}],
-            "removeLicenses": []
-        }
+        data = self.construir_licencia()
 
         user_email = f"{codigo_estudiante}@{config.COLEGIO_DOMINIO}"
         url = f"{config.GRAPH_ENDPOINT}/users/{user_email}/assignLicense"
         
         try:
-            response = requests.post(url, headers=headers, json=data, verify=False)
+            response = cliente_graph.post(url, headers=headers, json=data, verify=False)
             if response.status_code == 200:
                 print(f"✅ Licencia asignada a {codigo_estudiante}")
                 return True
@@ -135,16 +148,7 @@ class CreadorEstudiantes:
     def cargar_archivo(self, ruta_archivo: str) -> pd.DataFrame:
         """Carga estudiantes desde archivo Excel o CSV"""
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("❌ Formato no soportado. Usa .xlsx o .csv")
-            
-            # Limpiar datos
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            df = limpiar_columnas(cargar_dataframe(ruta_archivo))
             
             print(f"✅ Archivo cargado: {len(df)} estudiantes encontrados")
             return df
@@ -161,15 +165,327 @@ class CreadorEstudiantes:
             print(f"❌ Faltan columnas requeridas: {columnas_faltantes}")
             return False
         
+        errores = errores_obligatorios(df, {"CODIGO": "CODIGO"})
+        if errores:
+            print(f"❌ {len(errores)} filas sin CODIGO:")
+            for error in errores[:10]:
+                print(f"   {error}")
+            return False
+        
+        duplicados = filas_duplicadas(df, "CODIGO")
+        if duplicados:
+            print(f"⚠️  {len(duplicados)} códigos repetidos (Graph rechazará el segundo):")
+            for aviso in duplicados[:5]:
+                print(f"   {aviso}")
+        
         print("✅ Datos válidos")
         return True
 
-    def procesar_estudiantes(self, ruta_archivo: str = None, confirmacion: bool = True) -> dict:
+    def procesar_serial(self, df: pd.DataFrame):
+        """Crea estudiantes uno a uno (las licencias van después, en bloque)"""
+        total = len(df)
+        for posicion, estudiante in enumerate(registros(df), 1):
+            try:
+                print(f"\n📝 Procesando {posicion}/{total}: {estudiante['CODIGO']}")
+                self.progreso.actualizar(actual=estudiante['CODIGO'])
+                
+                # Crear estudiante
+                if self.crear_estudiante(estudiante):
+                    self.resultados["creados"] += 1
+                    self.marcar(f"creado:{estudiante['CODIGO']}")
+                    self.por_licenciar.append(estudiante['CODIGO'])
+                    self.progreso.avanzar()
+                else:
+                    self.resultados["errores"] += 1
+                    self.progreso.avanzar(exito=False, error=f"Error creando {estudiante['CODIGO']}")
+                    
+            except Exception as e:
+                error_msg = f"Error procesando {estudiante.get('CODIGO', 'desconocido')}: {e}"
+                print(f"❌ {error_msg}")
+                self.resultados["detalles_errores"].append(error_msg)
+                self.resultados["errores"] += 1
+                self.progreso.avanzar(exito=False, error=error_msg)
+
+    def procesar_lotes(self, df: pd.DataFrame):
+        """Crea estudiantes en peticiones $batch (20 creaciones por viaje)"""
+        ejecutor = EjecutorLotes()
+        operaciones = []
+        
+        for estudiante in registros(df):
+            id_crear = ejecutor.agregar("POST", "/users", self.construir_usuario(estudiante))
+            operaciones.append((estudiante['CODIGO'], id_crear))
+        
+        codigos_por_id = {id_crear: codigo for codigo, id_crear in operaciones}
+        
+        def informar(respuestas_lote):
+            # Solo cuentan las creaciones con respuesta definitiva (no las que se reintentan)
+            for id_op, respuesta in respuestas_lote.items():
+                if id_op in codigos_por_id and respuesta["status"] not in EjecutorLotes.STATUS_REINTENTABLES:
+                    exito = respuesta["status"] == 201
+                    error = None if exito else f"Error creando {codigos_por_id[id_op]}: {EjecutorLotes.mensaje_error(respuesta)}"
+                    self.progreso.avanzar(actual=codigos_por_id[id_op], exito=exito, error=error)
+        
+        respuestas = ejecutor.ejecutar(al_responder=informar)
+        
+        for codigo, id_crear in operaciones:
+            creacion = respuestas.get(id_crear, {"status": 0})
+            if creacion["status"] == 201:
+                print(f"✅ Estudiante creado: {codigo}")
+                self.resultados["creados"] += 1
+                self.marcar(f"creado:{codigo}")
+                self.por_licenciar.append(codigo)
+            else:
+                error_msg = f"Error creando {codigo}: {EjecutorLotes.mensaje_error(creacion)}"
+                print(f"❌ {error_msg}")
+                self.resultados["detalles_errores"].append(error_msg)
+                self.resultados["errores"] += 1
+
+    async def _procesar_estudiante_async(self, semaforo: asyncio.Semaphore, estudiante, posicion: int, total: int):
+        """Crea un estudiante (la licencia se asigna después, en bloque)"""
+        codigo = estudiante.get('CODIGO', 'desconocido')
+        try:
+            async with semaforo:
+                print(f"\n📝 Procesando {posicion}/{total}: {codigo}")
+                creado = await asyncio.to_thread(self.crear_estudiante, estudiante)
+            
+            if not creado:
+                self.resultados["errores"] += 1
+                self.progreso.avanzar(actual=codigo, exito=False, error=f"Error creando {codigo}")
+                return
+            self.resultados["creados"] += 1
+            self.marcar(f"creado:{codigo}")
+            self.por_licenciar.append(codigo)
+            self.progreso.avanzar(actual=codigo)
+                
+        except Exception as e:
+            error_msg = f"Error procesando {codigo}: {e}"
+            print(f"❌ {error_msg}")
+            self.resultados["detalles_errores"].append(error_msg)
+            self.resultados["errores"] += 1
+            self.progreso.avanzar(actual=codigo, exito=False, error=error_msg)
+
+    async def _procesar_async(self, df: pd.DataFrame, concurrencia: int):
+        semaforo = asyncio.Semaphore(concurrencia)
+        total = len(df)
+        await asyncio.gather(*[
+            self._procesar_estudiante_async(semaforo, estudiante, posicion, total)
+            for posicion, estudiante in enumerate(registros(df), 1)
+        ])
+
+    def procesar_async(self, df: pd.DataFrame, concurrencia: int = None):
+        """Crea estudiantes de forma concurrente (asyncio)
+
+        Un semáforo limita las llamadas simultáneas a Graph. Los contadores
+        se actualizan solo desde el bucle de eventos, por lo que coinciden
+        con los del modo serial.
+        """
+        asyncio.run(self._procesar_async(df, concurrencia or config.CONCURRENCIA_MAXIMA))
+
+    def marcar(self, clave: str, **datos):
+        """Anota en el checkpoint un paso completado ('creado:' o 'licencia:')"""
+        if self.diario:
+            self.diario.registrar(clave, **datos)
+
+    def marcar_licencia(self, codigo: str, asignada: bool):
+        """Anota una licencia resuelta y si la cuenta ya existía, para recontar al reanudar"""
+        if codigo in self.existentes:
+            self.marcar(f"licencia:{codigo}", existente=True, asignada=asignada)
+        else:
+            self.marcar(f"licencia:{codigo}")
+
+    def omitir_completados(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Aplica el checkpoint: devuelve solo los estudiantes sin crear
+
+        Los ya creados y licenciados se cuentan sin tocar Graph (las cuentas
+        que ya existían vuelven a 'ya_existentes', como en una ejecución
+        nueva); los creados sin licencia registrada (la ejecución anterior se
+        cortó entre ambos pasos) pasan directamente a la etapa de licencias.
+        """
+        if not self.diario or not self.diario.reanudado:
+            return df
+        
+        licenciados = df["CODIGO"].map(lambda c: self.diario.hecho(f"licencia:{c}"))
+        solo_creados = df["CODIGO"].map(lambda c: self.diario.hecho(f"creado:{c}")) & ~licenciados
+        
+        completos = int(licenciados.sum())
+        if completos:
+            print(f"♻️  {completos} estudiantes ya creados y licenciados (omitidos)")
+            for codigo in df.loc[licenciados, "CODIGO"]:
+                entrada = self.diario.obtener(f"licencia:{codigo}")
+                if entrada.get("existente"):
+                    self.resultados["ya_existentes"] += 1
+                    if entrada.get("asignada"):
+                        self.resultados["licenciados"] += 1
+                else:
+                    self.resultados["creados"] += 1
+                    self.resultados["licenciados"] += 1
+            self.progreso.avanzar(exito=True, cantidad=completos)
+        
+        pendientes = df.loc[solo_creados, "CODIGO"].tolist()
+        if pendientes:
+            print(f"♻️  {len(pendientes)} estudiantes ya creados con licencia pendiente")
+            self.resultados["creados"] += len(pendientes)
+            self.licencia_por_verificar.extend(pendientes)
+            self.progreso.avanzar(exito=True, cantidad=len(pendientes))
+        
+        return df[~licenciados & ~solo_creados]
+
+    def tiene_licencia(self, usuario: dict) -> bool:
+        """True si el usuario ya tiene la licencia de estudiante"""
+        return any(
+            licencia.get("skuId") == config.LICENSE_STUDENT
+            for licencia in usuario.get("assignedLicenses") or []
+        )
+
+    def verificar_existentes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Fase previa a las escrituras: separa crear / solo licenciar / omitir
+
+        Todos los UPN se consultan en Graph en bloque ('userPrincipalName
+        in (...)', 15 por petición). El directorio local no basta: no ve las
+        cuentas creadas desde su última sincronización ni fuera de esta
+        herramienta.
+
+        Returns:
+            pd.DataFrame: Solo los estudiantes que hay que crear
+        """
+        if df.empty:
+            return df
+        
+        upns = (df["CODIGO"] + f"@{config.COLEGIO_DOMINIO}").str.lower()
+        consultar = upns.tolist()
+        
+        print(f"\n🔍 Verificando {len(consultar)} cuentas existentes antes de crear...")
+        try:
+            existentes = cliente_graph.resolver_usuarios(consultar, select="id,assignedLicenses") if consultar else {}
+        except Exception as e:
+            print(f"⚠️  No se pudo verificar cuentas existentes ({e}); se intentará crear todas")
+            return df
+        
+        existe = upns.isin(existentes.keys())
+        licenciado = upns.map(lambda upn: upn in existentes and self.tiene_licencia(existentes[upn]))
+        omitir = existe & licenciado
+        solo_licencia = existe & ~licenciado
+        
+        print(f"   ➕ Crear: {int((~existe).sum())} | 🎯 Solo licencia: {int(solo_licencia.sum())} | "
+              f"⏭️  Ya completos: {int(omitir.sum())}")
+        
+        self.existentes.update(df.loc[existe, "CODIGO"])
+        
+        omitidos = int(omitir.sum())
+        if omitidos:
+            self.resultados["ya_existentes"] += omitidos
+            self.progreso.avanzar(exito=True, cantidad=omitidos)
+            for codigo in df.loc[omitir, "CODIGO"]:
+                self.marcar_licencia(codigo, asignada=False)
+        
+        solo_licencia_codigos = df.loc[solo_licencia, "CODIGO"].tolist()
+        if solo_licencia_codigos:
+            self.resultados["ya_existentes"] += len(solo_licencia_codigos)
+            self.por_licenciar.extend(solo_licencia_codigos)
+            self.progreso.avanzar(exito=True, cantidad=len(solo_licencia_codigos))
+        
+        return df[~existe]
+
+    def consultar_licencias_libres(self) -> Optional[int]:
+        """Puestos libres de LICENSE_STUDENT según subscribedSkus (una sola lectura)
+
+        Returns:
+            int o None si no se pudo consultar (entonces no se limita nada)
+        """
+        try:
+            url = f"{config.GRAPH_ENDPOINT}/subscribedSkus?$select=skuId,skuPartNumber,prepaidUnits,consumedUnits"
+            for sku in cliente_graph.listar(url, verify=False):
+                if sku.get("skuId") == config.LICENSE_STUDENT:
+                    libres = (sku.get("prepaidUnits") or {}).get("enabled", 0) - sku.get("consumedUnits", 0)
+                    print(f"🎫 Licencias {sku.get('skuPartNumber', config.LICENSE_STUDENT)}: {libres} libres")
+                    return max(libres, 0)
+            print(f"⚠️  La licencia {config.LICENSE_STUDENT} no aparece en subscribedSkus")
+        except Exception as e:
+            print(f"⚠️  No se pudo consultar la capacidad de licencias: {e}")
+        return None
+
+    def hay_licencias_suficientes(self, necesarias: int) -> bool:
+        """Falla rápido si no alcanzan los puestos, antes de crear a nadie"""
+        self.licencias_libres = self.consultar_licencias_libres()
+        if self.licencias_libres is None or necesarias <= self.licencias_libres:
+            return True
+        
+        error_msg = (f"Licencias insuficientes: se necesitan {necesarias} y quedan "
+                     f"{self.licencias_libres} libres de {config.LICENSE_STUDENT}")
+        print(f"❌ {error_msg}. No se creó ningún estudiante.")
+        self.resultados["detalles_errores"].append(error_msg)
+        self.resultados["errores"] += 1
+        return False
+
+    def licenciar_pendientes(self):
+        """Etapa única de licencias: omite a quien ya la tiene y envía el resto en $batch"""
+        if self.licencia_por_verificar:
+            upns = {f"{codigo}@{config.COLEGIO_DOMINIO}".lower(): codigo for codigo in self.licencia_por_verificar}
+            try:
+                estado = cliente_graph.resolver_usuarios(list(upns), select="id,assignedLicenses")
+            except Exception as e:
+                print(f"⚠️  No se pudo leer el estado de licencias: {e}")
+                estado = {}
+            for upn, codigo in upns.items():
+                if upn in estado and self.tiene_licencia(estado[upn]):
+                    self.resultados["licenciados"] += 1
+                    self.marcar_licencia(codigo, asignada=True)
+                else:
+                    self.por_licenciar.append(codigo)
+            self.licencia_por_verificar = []
+        
+        pendientes, self.por_licenciar = self.por_licenciar, []
+        if not pendientes:
+            return
+        
+        if self.licencias_libres is not None and len(pendientes) > self.licencias_libres:
+            # Otro proceso consumió puestos durante la creación
+            sin_puesto = pendientes[self.licencias_libres:]
+            pendientes = pendientes[:self.licencias_libres]
+            error_msg = f"Sin licencias libres para {len(sin_puesto)} estudiantes: {', '.join(sin_puesto[:10])}"
+            print(f"❌ {error_msg}")
+            self.resultados["detalles_errores"].append(error_msg)
+        
+        print(f"\n🎯 Asignando {len(pendientes)} licencias en lotes...")
+        self.progreso.iniciar(len(pendientes), etapa="Asignando licencias")
+        
+        ejecutor = EjecutorLotes()
+        ids = {
+            ejecutor.agregar(
+                "POST", f"/users/{codigo}@{config.COLEGIO_DOMINIO}/assignLicense", self.construir_licencia()
+            ): codigo
+            for codigo in pendientes
+        }
+        
+        def informar(respuestas_lote):
+            for id_op, respuesta in respuestas_lote.items():
+                if id_op in ids and respuesta["status"] not in EjecutorLotes.STATUS_REINTENTABLES:
+                    self.progreso.avanzar(actual=ids[id_op], exito=respuesta["status"] == 200)
+        
+        respuestas = ejecutor.ejecutar(al_responder=informar)
+        
+        for id_op, codigo in ids.items():
+            respuesta = respuestas.get(id_op, {"status": 0})
+            if respuesta["status"] == 200:
+                self.resultados["licenciados"] += 1
+                self.marcar_licencia(codigo, asignada=True)
+            else:
+                error_msg = f"Error asignando licencia a {codigo}: {EjecutorLotes.mensaje_error(respuesta)}"
+                print(f"❌ {error_msg}")
+                self.resultados["detalles_errores"].append(error_msg)
+        
+        if self.licencias_libres is not None:
+            self.licencias_libres -= len(pendientes)
+        print(f"✅ Licencias asignadas: {self.resultados['licenciados']}")
+
+    def procesar_estudiantes(self, ruta_archivo: str = None, confirmacion: bool = True, modo: str = "serial") -> dict:
         """Procesa la creación masiva de estudiantes
         
         Args:
             ruta_archivo (str, optional): Ruta al archivo a procesar. Defaults to None.
             confirmacion (bool, optional): Si True, pide confirmación por consola. Si False, ejecuta directamente. Defaults to True.
+            modo (str, optional): "serial" (una petición por llamada), "lotes" ($batch de 20)
+                o "async" (creación concurrente con asyncio). Defaults to "serial".
             
         Returns:
             dict: Resultados del proceso
@@ -208,26 +524,29 @@ class CreadorEstudiantes:
             # Procesar estudiantes
             print(f"\n🚀 Iniciando creación de {len(df)} estudiantes...")
             print("="*50)
+            self.progreso.iniciar(len(df), etapa="Creando estudiantes")
             
-            for index, estudiante in df.iterrows():
-                try:
-                    print(f"\n📝 Procesando {index + 1}/{len(df)}: {estudiante['CODIGO']}")
-                    
-                    # Crear estudiante
-                    if self.crear_estudiante(estudiante):
-                        self.resultados["creados"] += 1
-                        
-                        # Asignar licencia
-                        if self.asignar_licencia(estudiante['CODIGO']):
-                            self.resultados["licenciados"] += 1
+            self.diario = abrir_diario("crear_estudiantes", ruta_archivo)
+            codigos = df["CODIGO"].tolist()
+            try:
+                df = self.omitir_completados(df)
+                df = self.verificar_existentes(df)
+                
+                necesarias = len(df) + len(self.por_licenciar) + len(self.licencia_por_verificar)
+                if not necesarias or self.hay_licencias_suficientes(necesarias):
+                    if modo == "lotes":
+                        self.procesar_lotes(df)
+                    elif modo == "async":
+                        self.procesar_async(df)
                     else:
-                        self.resultados["errores"] += 1
-                        
-                except Exception as e:
-                    error_msg = f"Error procesando {estudiante.get('CODIGO', 'desconocido')}: {e}"
-                    print(f"❌ {error_msg}")
-                    self.resultados["detalles_errores"].append(error_msg)
-                    self.resultados["errores"] += 1
+                        self.procesar_serial(df)
+                    
+                    self.licenciar_pendientes()
+            finally:
+                self.diario.finalizar(
+                    self.resultados["errores"] == 0
+                    and all(self.diario.hecho(f"licencia:{codigo}") for codigo in codigos)
+                )
             
             # Mostrar resumen
             self.mostrar_resumen()
@@ -249,6 +568,7 @@ class CreadorEstudiantes:
         print(f"📊 Total procesados: {self.resultados['total']}")
         print(f"✅ Estudiantes creados: {self.resultados['creados']}")
         print(f"🎯 Licencias asignadas: {self.resultados['licenciados']}")
+        print(f"⏭️  Ya existían: {self.resultados['ya_existentes']}")
         print(f"❌ Errores: {self.resultados['errores']}")
         
         if self.resultados['errores'] > 0:
@@ -272,6 +592,7 @@ class CreadorEstudiantes:
                 f.write(f"Total procesados: {self.resultados['total']}\n")
                 f.write(f"Estudiantes creados: {self.resultados['creados']}\n")
                 f.write(f"Licencias asignadas: {self.resultados['licenciados']}\n")
+                f.write(f"Ya existían: {self.resultados['ya_existentes']}\n")
                 f.write(f"Errores: {self.resultados['errores']}\n\n")
                 
                 if self.resultados['detalles_errores']:
@@ -280,6 +601,8 @@ class CreadorEstudiantes:
                     for error in self.resultados['detalles_errores']:
                         f.write(f"- {error}\n")
             
+            registrar_log(log_file)
+            
             print(f"📝 Log guardado en: {log_file}")
             
         except Exception as e:
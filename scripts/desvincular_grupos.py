@@ -1,4 +1,3 @@
-import pandas as pd
 import requests
 import urllib3
 from datetime import datetime
@@ -9,6 +8,11 @@ import time
 # Añadir la carpeta scripts al path para importar configuración
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import LectorArchivo
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -18,6 +22,7 @@ class DesvinculadorGrupos:
     def __init__(self):
         config.validar_configuracion()
         self.token = None
+        self.progreso = reportador_actual()
         self.resultados = {
             "total": 0,
             "total_grupos": 0,
@@ -29,18 +34,8 @@ class DesvinculadorGrupos:
 
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             return True
         except requests.RequestException as e:
             self.resultados["detalles"].append(f"Error obteniendo token: {e}")
@@ -51,6 +46,12 @@ class DesvinculadorGrupos:
         if not self.token:
             return None
 
+        directorio = obtener_directorio()
+        if directorio:
+            grupo = directorio.obtener_grupo_por_mail(email_grupo)
+            if grupo:
+                return grupo["id"]
+
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -60,7 +61,7 @@ class DesvinculadorGrupos:
         url = f"{config.GRAPH_ENDPOINT}/groups?$filter=mail eq '{email_grupo}' or proxyAddresses/any(x:x eq 'smtp:{email_grupo}')&$select=id,displayName"
 
         try:
-            response = requests.get(url, headers=headers, verify=False)
+            response = cliente_graph.get(url, headers=headers, verify=False)
             response.raise_for_status()
             data = response.json()
             
@@ -79,7 +80,7 @@ class DesvinculadorGrupos:
 
         while url:
             try:
-                response = requests.get(url, headers=headers, verify=False)
+                response = cliente_graph.get(url, headers=headers, verify=False)
                 if response.status_code == 200:
                     data = response.json()
                     miembros.extend(data.get('value', []))
@@ -97,7 +98,7 @@ class DesvinculadorGrupos:
         headers = {"Authorization": f"Bearer {self.token}"}
         
         try:
-            response = requests.delete(url, headers=headers, verify=False)
+            response = cliente_graph.delete(url, headers=headers, verify=False)
             if response.status_code == 204:
                 return True, ""
             else:
@@ -112,22 +113,16 @@ class DesvinculadorGrupos:
 
         # Cargar archivo
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("Formato no soportado")
-            
-            # Buscar columna de email
-            columna_email = next((col for col in df.columns if col.lower() in ['primarysmtpaddress', 'email', 'correo']), None)
+            # Buscar columna de email (lectura en streaming: solo se guarda esa columna)
+            columna_email, grupos = LectorArchivo(ruta_archivo).valores_columna(
+                lambda columnas: next((col for col in columnas if col.lower() in ['primarysmtpaddress', 'email', 'correo']), None)
+            )
             
             if not columna_email:
                 self.resultados["errores"] += 1
                 self.resultados["detalles"].append("No se encontró columna 'PrimarySmtpAddress' o equivalente")
                 return self.resultados
 
-            grupos = df[columna_email].dropna().unique().tolist()
             self.resultados["total_grupos"] = len(grupos)
             self.resultados["total"] = len(grupos)
 
@@ -137,10 +132,13 @@ class DesvinculadorGrupos:
             return self.resultados
 
         print(f"🔄 Iniciando desvinculación para {len(grupos)} grupos...")
+        # El total crece con los miembros de cada grupo a medida que se listan
+        self.progreso.iniciar(0, etapa=f"Desvinculando {len(grupos)} grupos")
         
         for email in grupos:
             email = email.strip()
             print(f"🔍 Procesando grupo: {email}")
+            self.progreso.actualizar(actual=email)
             
             group_id = self.obtener_id_grupo(email)
             
@@ -149,11 +147,14 @@ class DesvinculadorGrupos:
                 print(f"❌ {msg}")
                 self.resultados["detalles"].append(msg)
                 self.resultados["errores"] += 1
+                self.progreso.agregar_total(1)
+                self.progreso.avanzar(exito=False, error=msg)
                 continue
                 
             # Obtener miembros
             miembros = self.obtener_miembros_grupo(group_id)
             print(f"   👥 Encontrados {len(miembros)} miembros")
+            self.progreso.agregar_total(len(miembros))
             
             count_removed = 0
             for miembro in miembros:
@@ -163,9 +164,12 @@ class DesvinculadorGrupos:
                 exito, error_msg = self.eliminar_miembro(group_id, member_id)
                 if exito:
                     count_removed += 1
+                    self.progreso.avanzar(actual=f"{email}: {member_upn}")
                     # print(f"      - Desvinculado: {member_upn}") # Verbose
                 else:
                     self.resultados["detalles"].append(f"Error desvinculando {member_upn} de {email}: {error_msg}")
+                    self.progreso.avanzar(actual=f"{email}: {member_upn}", exito=False,
+                                          error=f"{member_upn} ({email}): {error_msg}")
             
             self.resultados["miembros_eliminados"] += count_removed
             self.resultados["grupos_procesados"] += 1
@@ -192,6 +196,8 @@ class DesvinculadorGrupos:
                 f.write("DETALLES:\n")
                 for detalle in self.resultados["detalles"]:
                     f.write(f"- {detalle}\n")
+            
+            registrar_log(log_file)
                     
         except Exception as e:
             print(f"Error guardando log: {e}")
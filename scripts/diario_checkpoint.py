@@ -0,0 +1,206 @@
+# scripts/diario_checkpoint.py
+"""
+Diario de checkpoint de solo anexado para reanudar operaciones largas.
+
+Cada trabajo terminado (un equipo vaciado, un miembro eliminado...) se
+escribe como una línea JSON al final del archivo; nunca se reescribe lo
+ya guardado. Las escrituras se sincronizan a disco (fsync) por lotes.
+La primera línea guarda la huella del archivo de entrada: si el archivo
+cambia, el diario anterior se descarta y se empieza de cero.
+
+Todos los procesadores masivos abren su diario con abrir_diario(), que lo
+ubica por tipo de operación y huella de la entrada; al reanudar, los
+elementos ya completados se omiten sin consultar a Graph.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+
+TAMANO_BLOQUE_HASH = 1024 * 1024  # Bytes leídos por vez al calcular la huella
+
+
+def huella_archivo(ruta_archivo: str) -> str:
+    """SHA-256 del archivo leído por bloques (sin cargarlo entero en memoria)"""
+    resumen = hashlib.sha256()
+    with open(ruta_archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b""):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def huella_valores(valores: list) -> str:
+    """SHA-256 de una lista de valores (entradas que no vienen de un archivo)"""
+    resumen = hashlib.sha256()
+    for valor in valores:
+        resumen.update(str(valor).encode("utf-8") + b"\n")
+    return resumen.hexdigest()
+
+
+class DiarioCheckpoint:
+    """Registro de claves completadas, persistido como JSON Lines"""
+
+    def __init__(self, ruta: str, operacion: str, huella: str, archivo: str = None,
+                 fsync_lote: int = None, fsync_segundos: float = None):
+        """
+        Args:
+            ruta: Archivo del diario (.jsonl)
+            operacion: Tipo de operación (p. ej. "vaciar_equipos")
+            huella: Huella del archivo de entrada (ver huella_archivo)
+            archivo: Ruta original, solo informativa
+            fsync_lote: Entradas pendientes que fuerzan un fsync
+            fsync_segundos: Tiempo máximo sin fsync con entradas pendientes
+        """
+        self.ruta = ruta
+        self.operacion = operacion
+        self.huella = huella
+        self.archivo = archivo
+        self.fsync_lote = fsync_lote or config.CHECKPOINT_FSYNC_LOTE
+        self.fsync_segundos = fsync_segundos if fsync_segundos is not None else config.CHECKPOINT_FSYNC_SEGUNDOS
+
+        self.completadas = {}  # clave → datos de la entrada
+        self.reanudado = False
+        self._pendientes = 0
+        self._ultimo_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        self._f = None
+
+    # ------------------------------------------------------------------
+    # Apertura
+    # ------------------------------------------------------------------
+
+    def _leer_existente(self) -> bool:
+        """Carga las claves de un diario previo de la misma operación y archivo"""
+        if not os.path.exists(self.ruta):
+            return False
+
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            try:
+                cabecera = json.loads(f.readline() or "{}")
+            except json.JSONDecodeError:
+                return False
+            if cabecera.get("operacion") != self.operacion or cabecera.get("huella") != self.huella:
+                return False
+
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir por una caída: se ignora
+                    continue
+                self.completadas[entrada.pop("clave")] = entrada
+        return True
+
+    def abrir(self) -> "DiarioCheckpoint":
+        """Reanuda el diario existente si corresponde al mismo archivo; si no, lo reinicia"""
+        carpeta = os.path.dirname(self.ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+        self.reanudado = self._leer_existente()
+        if self.reanudado:
+            self._f = open(self.ruta, 'a', encoding='utf-8')
+            # Si la caída dejó una línea incompleta, la siguiente entrada empieza en línea nueva
+            if self._f.tell() > 0:
+                with open(self.ruta, 'rb') as lectura:
+                    lectura.seek(-1, os.SEEK_END)
+                    if lectura.read(1) != b"\n":
+                        self._f.write("\n")
+        else:
+            self.completadas = {}
+            self._f = open(self.ruta, 'w', encoding='utf-8')
+            self._f.write(json.dumps({
+                "operacion": self.operacion,
+                "huella": self.huella,
+                "archivo": self.archivo,
+                "fecha_inicio": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }, ensure_ascii=False) + "\n")
+            self._sincronizar()
+        return self
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+
+    def hecho(self, clave: str) -> bool:
+        """True si la clave ya se completó (O(1))"""
+        return clave in self.completadas
+
+    def obtener(self, clave: str) -> dict or None:
+        """Datos guardados con la clave (None si no se completó)"""
+        return self.completadas.get(clave)
+
+    def contar(self, prefijo: str) -> int:
+        """Entradas completadas cuya clave empieza por 'prefijo'"""
+        return sum(1 for clave in self.completadas if clave.startswith(prefijo))
+
+    def registrar(self, clave: str, **datos):
+        """Anexa una entrada completada; el fsync se hace por lotes"""
+        with self._lock:
+            if clave in self.completadas or self._f is None:
+                return
+            self.completadas[clave] = datos
+            self._f.write(json.dumps({"clave": clave, **datos}, ensure_ascii=False) + "\n")
+            self._pendientes += 1
+            if (self._pendientes >= self.fsync_lote
+                    or time.monotonic() - self._ultimo_fsync >= self.fsync_segundos):
+                self._sincronizar()
+
+    def _sincronizar(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pendientes = 0
+        self._ultimo_fsync = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Cierre
+    # ------------------------------------------------------------------
+
+    def cerrar(self):
+        """Sincroniza lo pendiente y cierra (el diario queda para reanudar)"""
+        with self._lock:
+            if self._f is None:
+                return
+            self._sincronizar()
+            self._f.close()
+            self._f = None
+
+    def completar(self):
+        """Cierra y elimina el diario: la operación terminó sin pendientes"""
+        self.cerrar()
+        try:
+            os.remove(self.ruta)
+        except OSError:
+            pass
+
+    def finalizar(self, completo: bool):
+        """Elimina el diario si no quedó nada pendiente; si no, lo conserva"""
+        if completo:
+            self.completar()
+        else:
+            self.cerrar()
+            print(f"💾 Checkpoint conservado para reanudar: {self.ruta}")
+
+
+def abrir_diario(operacion: str, ruta_archivo: str = None, valores: list = None) -> DiarioCheckpoint:
+    """Diario de la operación para esta entrada, reanudado si ya existía
+
+    Args:
+        operacion: Tipo de operación (crear_estudiantes, vaciar_equipos...)
+        ruta_archivo: Archivo de entrada (se usa su huella)
+        valores: Alternativa a ruta_archivo cuando la entrada es una lista
+    """
+    huella = huella_archivo(ruta_archivo) if ruta_archivo else huella_valores(valores or [])
+    ruta = os.path.join(config.CARPETA_CHECKPOINTS, f"{operacion}_{huella[:16]}.jsonl")
+    diario = DiarioCheckpoint(ruta, operacion, huella, ruta_archivo).abrir()
+    if diario.reanudado:
+        print(f"♻️  Reanudando {operacion}: {len(diario.completadas)} elementos ya completados")
+    return diario
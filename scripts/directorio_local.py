@@ -0,0 +1,335 @@
+# scripts/directorio_local.py
+"""
+Espejo local (SQLite) del directorio: usuarios, grupos, teams y membresías.
+
+La primera sincronización recorre el directorio completo con consultas
+'delta' paginadas y $select; las siguientes usan el deltaLink guardado y
+solo traen los cambios. Así las búsquedas por UPN, nombre o correo se
+resuelven con tablas indexadas en lugar de una petición a Graph por fila.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+from scripts.cliente_graph import cliente_graph
+
+
+class DirectorioLocal:
+    """Espejo SQLite de usuarios, grupos, teams y membresías del tenant"""
+
+    SELECT_USUARIOS = "id,userPrincipalName,displayName,mail,jobTitle,department,givenName,surname,city"
+    SELECT_GRUPOS = "id,displayName,mail,members"
+
+    # Columna local ← propiedad de Graph
+    COLUMNAS_USUARIO = {
+        "upn": "userPrincipalName",
+        "display_name": "displayName",
+        "mail": "mail",
+        "job_title": "jobTitle",
+        "department": "department",
+        "given_name": "givenName",
+        "surname": "surname",
+        "city": "city"
+    }
+    COLUMNAS_GRUPO = {
+        "display_name": "displayName",
+        "mail": "mail"
+    }
+
+    def __init__(self, ruta_db: str = None):
+        self.ruta_db = ruta_db or config.DIRECTORIO_LOCAL_DB
+        carpeta = os.path.dirname(self.ruta_db)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.ruta_db, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._crear_tablas()
+
+    def _crear_tablas(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS usuarios (
+                    id TEXT PRIMARY KEY,
+                    upn TEXT COLLATE NOCASE,
+                    display_name TEXT,
+                    mail TEXT COLLATE NOCASE,
+                    job_title TEXT,
+                    department TEXT,
+                    given_name TEXT,
+                    surname TEXT,
+                    city TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_usuarios_upn ON usuarios(upn);
+
+                CREATE TABLE IF NOT EXISTS grupos (
+                    id TEXT PRIMARY KEY,
+                    display_name TEXT,
+                    mail TEXT COLLATE NOCASE,
+                    es_team INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_grupos_nombre ON grupos(display_name);
+                CREATE INDEX IF NOT EXISTS idx_grupos_mail ON grupos(mail);
+
+                CREATE TABLE IF NOT EXISTS miembros (
+                    grupo_id TEXT,
+                    usuario_id TEXT,
+                    PRIMARY KEY (grupo_id, usuario_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_miembros_usuario ON miembros(usuario_id);
+
+                CREATE TABLE IF NOT EXISTS estado (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+            """)
+
+    # ------------------------------------------------------------------
+    # Sincronización
+    # ------------------------------------------------------------------
+
+    def _leer_estado(self, clave: str) -> str:
+        with self._lock:
+            fila = self._conn.execute("SELECT valor FROM estado WHERE clave = ?", (clave,)).fetchone()
+            return fila["valor"] if fila else None
+
+    def _guardar_estado(self, clave: str, valor: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO estado (clave, valor) VALUES (?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+                (clave, valor)
+            )
+
+    def _upsert(self, tabla: str, id_objeto: str, columnas: dict, item: dict):
+        """Inserta o actualiza solo las propiedades presentes en 'item'
+
+        En las rondas incrementales Graph puede devolver solo las
+        propiedades que cambiaron; las demás se conservan.
+        """
+        valores = {col: item[prop] for col, prop in columnas.items() if prop in item}
+        nombres = ["id"] + list(valores)
+        marcadores = ", ".join("?" for _ in nombres)
+        actualizar = ", ".join(f"{c} = excluded.{c}" for c in valores) or "id = excluded.id"
+        self._conn.execute(
+            f"INSERT INTO {tabla} ({', '.join(nombres)}) VALUES ({marcadores}) "
+            f"ON CONFLICT(id) DO UPDATE SET {actualizar}",
+            [id_objeto] + list(valores.values())
+        )
+
+    def _aplicar_usuario(self, item: dict):
+        if "@removed" in item:
+            self._conn.execute("DELETE FROM usuarios WHERE id = ?", (item["id"],))
+            self._conn.execute("DELETE FROM miembros WHERE usuario_id = ?", (item["id"],))
+        else:
+            self._upsert("usuarios", item["id"], self.COLUMNAS_USUARIO, item)
+
+    def _aplicar_grupo(self, item: dict):
+        if "@removed" in item:
+            self._conn.execute("DELETE FROM grupos WHERE id = ?", (item["id"],))
+            self._conn.execute("DELETE FROM miembros WHERE grupo_id = ?", (item["id"],))
+            return
+
+        self._upsert("grupos", item["id"], self.COLUMNAS_GRUPO, item)
+        for miembro in item.get("members@delta", []):
+            if "@removed" in miembro:
+                self._conn.execute(
+                    "DELETE FROM miembros WHERE grupo_id = ? AND usuario_id = ?",
+                    (item["id"], miembro["id"])
+                )
+            else:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO miembros (grupo_id, usuario_id) VALUES (?, ?)",
+                    (item["id"], miembro["id"])
+                )
+
+    def _reiniciar_recurso(self, recurso: str):
+        """Vacía las tablas de 'users' o 'groups' y olvida su deltaLink
+
+        Los objetos eliminados mientras el delta estaba caducado nunca
+        llegarán como '@removed', así que la resincronización parte de cero.
+        Las membresías solo llegan con el delta de grupos: si se reinician
+        los usuarios, los grupos se reinician también. Todo en una transacción.
+        """
+        tablas = ("usuarios", "grupos", "miembros") if recurso == "users" else ("grupos", "miembros")
+        deltas = ("delta_users", "delta_groups") if recurso == "users" else ("delta_groups",)
+        with self._lock, self._conn:
+            for tabla in tablas:
+                self._conn.execute(f"DELETE FROM {tabla}")
+            self._conn.executemany(
+                "INSERT INTO estado (clave, valor) VALUES (?, '') "
+                "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+                [(clave,) for clave in deltas]
+            )
+
+    def _sincronizar_recurso(self, recurso: str, select: str, aplicar) -> int:
+        """Recorre la consulta delta de 'users' o 'groups' hasta el deltaLink
+
+        Returns:
+            int: Número de cambios aplicados
+        """
+        clave = f"delta_{recurso}"
+        url = self._leer_estado(clave) or f"{config.GRAPH_ENDPOINT}/{recurso}/delta?$select={select}"
+        cambios = 0
+
+        while url:
+            response = cliente_graph.get(url)
+
+            if response.status_code == 410:
+                # El deltaLink caducó: se reinicia la sincronización completa
+                print(f"⚠️ Delta de {recurso} caducado, resincronizando desde cero...")
+                self._reiniciar_recurso(recurso)
+                cambios = 0
+                url = f"{config.GRAPH_ENDPOINT}/{recurso}/delta?$select={select}"
+                continue
+
+            response.raise_for_status()
+            data = response.json()
+
+            with self._lock, self._conn:
+                for item in data.get("value", []):
+                    aplicar(item)
+                    cambios += 1
+
+            if "@odata.deltaLink" in data:
+                self._guardar_estado(clave, data["@odata.deltaLink"])
+                break
+            url = data.get("@odata.nextLink")
+
+        return cambios
+
+    def _sincronizar_teams(self) -> int:
+        """Marca qué grupos son Teams (listado paginado solo de ids)"""
+        url = (
+            f"{config.GRAPH_ENDPOINT}/groups?"
+            f"$filter=resourceProvisioningOptions/Any(x:x eq 'Team')&$select=id&$top=999"
+        )
+        ids = [item["id"] for item in cliente_graph.listar(url)]
+
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE grupos SET es_team = 0")
+            self._conn.executemany("UPDATE grupos SET es_team = 1 WHERE id = ?", [(i,) for i in ids])
+        return len(ids)
+
+    def sincronizar(self) -> dict:
+        """Sincroniza el espejo con Graph (completa la primera vez, delta después)"""
+        inicio = time.monotonic()
+        completa = not self.esta_cargado()
+        print(f"🔄 Sincronizando directorio local ({'completa' if completa else 'incremental'})...")
+
+        resumen = {
+            "usuarios": self._sincronizar_recurso("users", self.SELECT_USUARIOS, self._aplicar_usuario),
+            "grupos": self._sincronizar_recurso("groups", self.SELECT_GRUPOS, self._aplicar_grupo),
+            "teams": self._sincronizar_teams()
+        }
+        self._guardar_estado("ultima_sincronizacion", datetime.now().isoformat())
+        self._guardar_estado("ultima_sincronizacion_ts", str(time.time()))
+
+        print(
+            f"✅ Directorio sincronizado en {time.monotonic() - inicio:.1f}s "
+            f"({resumen['usuarios']} cambios de usuarios, {resumen['grupos']} de grupos, {resumen['teams']} teams)"
+        )
+        return resumen
+
+    def esta_cargado(self) -> bool:
+        return bool(self._leer_estado("delta_users")) and bool(self._leer_estado("delta_groups"))
+
+    def antiguedad(self) -> float:
+        """Segundos desde la última sincronización (infinito si nunca)"""
+        valor = self._leer_estado("ultima_sincronizacion_ts")
+        return time.time() - float(valor) if valor else float("inf")
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _uno(self, consulta: str, parametros: tuple) -> dict:
+        with self._lock:
+            fila = self._conn.execute(consulta, parametros).fetchone()
+            return dict(fila) if fila else None
+
+    def _todos(self, consulta: str, parametros: tuple) -> list:
+        with self._lock:
+            return [dict(f) for f in self._conn.execute(consulta, parametros).fetchall()]
+
+    def obtener_usuario(self, upn: str) -> dict or None:
+        return self._uno("SELECT * FROM usuarios WHERE upn = ?", (upn.strip(),))
+
+    def obtener_user_id(self, upn: str) -> str or None:
+        usuario = self.obtener_usuario(upn)
+        return usuario["id"] if usuario else None
+
+    def obtener_grupo_por_nombre(self, nombre: str) -> dict or None:
+        return self._uno("SELECT * FROM grupos WHERE display_name = ?", (nombre.strip(),))
+
+    def obtener_grupo_por_mail(self, mail: str) -> dict or None:
+        return self._uno("SELECT * FROM grupos WHERE mail = ?", (mail.strip(),))
+
+    def buscar_grupo(self, identificador: str) -> dict or None:
+        """Busca un grupo por id, nombre o correo (en ese orden)"""
+        identificador = identificador.strip()
+        return (
+            self._uno("SELECT * FROM grupos WHERE id = ?", (identificador,))
+            or self.obtener_grupo_por_nombre(identificador)
+            or self.obtener_grupo_por_mail(identificador)
+        )
+
+    def buscar_team(self, nombre: str) -> dict or None:
+        return self._uno("SELECT * FROM grupos WHERE display_name = ? AND es_team = 1", (nombre.strip(),))
+
+    def grupos_por_prefijo(self, prefijo: str) -> list:
+        return self._todos(
+            "SELECT * FROM grupos WHERE display_name LIKE ? ESCAPE '\\' ORDER BY display_name",
+            (prefijo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+        )
+
+    def miembros_grupo(self, grupo_id: str) -> list:
+        return self._todos(
+            "SELECT u.* FROM miembros m JOIN usuarios u ON u.id = m.usuario_id WHERE m.grupo_id = ?",
+            (grupo_id,)
+        )
+
+    def grupos_usuario(self, usuario_id: str) -> list:
+        return self._todos(
+            "SELECT g.* FROM miembros m JOIN grupos g ON g.id = m.grupo_id WHERE m.usuario_id = ?",
+            (usuario_id,)
+        )
+
+
+_directorio = None
+_directorio_lock = threading.Lock()
+_ultimo_fallo = 0.0
+REINTENTO_TRAS_FALLO = 60  # Segundos sin reintentar la sincronización tras un fallo
+
+
+def obtener_directorio() -> DirectorioLocal or None:
+    """Devuelve el espejo compartido, sincronizado si está desactualizado
+
+    Devuelve None si el espejo está deshabilitado (USAR_DIRECTORIO_LOCAL)
+    o si la sincronización falla, para que el llamador consulte Graph.
+    """
+    global _directorio, _ultimo_fallo
+    if not config.USAR_DIRECTORIO_LOCAL:
+        return None
+
+    with _directorio_lock:
+        if time.monotonic() - _ultimo_fallo < REINTENTO_TRAS_FALLO:
+            return None
+        try:
+            if _directorio is None:
+                _directorio = DirectorioLocal()
+            if _directorio.antiguedad() > config.DIRECTORIO_MAX_ANTIGUEDAD:
+                _directorio.sincronizar()
+            return _directorio
+        except Exception as e:
+            _ultimo_fallo = time.monotonic()
+            print(f"⚠️ Directorio local no disponible, se consultará Graph: {e}")
+            return None
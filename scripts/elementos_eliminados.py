@@ -0,0 +1,390 @@
+"""
+Módulo para RESTAURAR o PURGAR elementos eliminados del tenant
+
+Los usuarios y grupos (Teams) eliminados quedan 30 días en
+directory/deletedItems. Este módulo los recupera o los borra
+definitivamente en bloque:
+
+Flujo:
+1. Carga Excel con los elementos (CODIGO de estudiante o GroupId/DisplayName/Mail)
+2. Lista una sola vez la papelera de usuarios o grupos (paginada)
+3. Cruza el archivo con la papelera sin consultar a Graph por fila
+4. Restaura o purga los encontrados en peticiones $batch concurrentes
+5. Registra logs detallados de cada operación
+"""
+
+import re
+import requests
+import urllib3
+from datetime import datetime
+import os
+import sys
+
+# Añadir la carpeta scripts al path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.preprocesamiento import limpiar_columnas
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.lotes_graph import EjecutorLotes
+from scripts.estadisticas import registrar_log
+from scripts.diario_checkpoint import abrir_diario
+from scripts.progreso import reportador_actual
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Al eliminar un usuario, Graph antepone su id (sin guiones) al UPN
+PREFIJO_UPN_ELIMINADO = re.compile(r"^[0-9a-f]{32}")
+
+
+class GestorElementosEliminados:
+    """Clase para restaurar o purgar usuarios y grupos de la papelera del directorio"""
+
+    ACCIONES = ("restaurar", "purgar")
+    SELECT = {
+        "usuarios": "id,userPrincipalName,mailNickname,displayName,deletedDateTime",
+        "grupos": "id,displayName,mail,deletedDateTime"
+    }
+    TIPO_GRAPH = {"usuarios": "microsoft.graph.user", "grupos": "microsoft.graph.group"}
+    COLUMNAS_GRUPO = [
+        'GroupId', 'Id', 'GROUP_ID', 'GROUPID',
+        'DisplayName', 'Name', 'Equipo', 'Team', 'Mail',
+        'id', 'groupid', 'displayname', 'name', 'equipo', 'team', 'mail'
+    ]
+
+    def __init__(self):
+        config.validar_configuracion()
+        self.token = None
+        self.diario = None  # Checkpoint del archivo en proceso
+        self.progreso = reportador_actual()
+        self.resultados = {
+            "total": 0,
+            "encontrados": 0,
+            "restaurados": 0,
+            "purgados": 0,
+            "no_encontrados": 0,
+            "errores": 0,
+            "detalles": [],
+            "detalles_errores": []
+        }
+
+    def obtener_token(self) -> bool:
+        """Obtiene token de acceso a Microsoft Graph API"""
+        try:
+            self.token = proveedor_token.obtener_token()
+            print("✅ Token obtenido correctamente")
+            return True
+        except requests.RequestException as e:
+            print(f"❌ Error obteniendo token: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Entrada
+    # ------------------------------------------------------------------
+
+    def cargar_identificadores(self, ruta_archivo: str) -> tuple:
+        """Lee el archivo y decide si son usuarios (CODIGO) o grupos
+
+        Returns:
+            tuple: (tipo, identificadores sin repetir en orden de archivo)
+        """
+        df = limpiar_columnas(cargar_dataframe(ruta_archivo))
+
+        if "CODIGO" in df.columns:
+            tipo, columna = "usuarios", "CODIGO"
+        else:
+            columna = next((c for c in self.COLUMNAS_GRUPO if c in df.columns), None)
+            if columna is None:
+                raise ValueError("El archivo debe tener la columna CODIGO (usuarios) o GroupId/DisplayName/Mail (grupos)")
+            tipo = "grupos"
+
+        identificadores = [valor for valor in dict.fromkeys(df[columna]) if valor]
+        print(f"✅ Archivo cargado: {len(identificadores)} {tipo} (columna '{columna}')")
+        return tipo, identificadores
+
+    # ------------------------------------------------------------------
+    # Papelera
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def claves_usuario(usuario: dict) -> set:
+        """Claves por las que se puede buscar un usuario eliminado"""
+        upn = (usuario.get("userPrincipalName") or "").lower()
+        claves = {upn, PREFIJO_UPN_ELIMINADO.sub("", upn)}
+        if usuario.get("mailNickname"):
+            claves.add(usuario["mailNickname"].lower())
+        return claves - {""}
+
+    @staticmethod
+    def claves_grupo(grupo: dict) -> set:
+        """Claves por las que se puede buscar un grupo eliminado"""
+        claves = {(grupo.get(campo) or "").lower() for campo in ("id", "displayName", "mail")}
+        return claves - {""}
+
+    def indexar_eliminados(self, tipo: str) -> dict:
+        """Recorre la papelera una sola vez y la indexa por sus claves
+
+        Returns:
+            dict: {clave: [elementos eliminados, más reciente primero]}
+        """
+        url = (
+            f"{config.GRAPH_ENDPOINT}/directory/deletedItems/{self.TIPO_GRAPH[tipo]}"
+            f"?$select={self.SELECT[tipo]}&$top=999"
+        )
+        claves = self.claves_usuario if tipo == "usuarios" else self.claves_grupo
+
+        print(f"\n🔍 Listando {tipo} eliminados...")
+        indice = {}
+        total = 0
+        for elemento in cliente_graph.listar(url, verify=False):
+            total += 1
+            for clave in claves(elemento):
+                indice.setdefault(clave, []).append(elemento)
+
+        for candidatos in indice.values():
+            candidatos.sort(key=lambda e: e.get("deletedDateTime") or "", reverse=True)
+        print(f"✅ {total} {tipo} en la papelera")
+        return indice
+
+    def buscar(self, tipo: str, identificador: str, indice: dict) -> list:
+        """Elementos eliminados que corresponden a una fila del archivo"""
+        clave = identificador.lower()
+        if tipo == "usuarios" and "@" not in clave:
+            # Un CODIGO se busca como UPN del colegio y, si no, como mailNickname
+            return indice.get(f"{clave}@{config.COLEGIO_DOMINIO}".lower()) or indice.get(clave, [])
+        return indice.get(clave, [])
+
+    # ------------------------------------------------------------------
+    # Restaurar / purgar
+    # ------------------------------------------------------------------
+
+    def ejecutar_accion(self, accion: str, objetivos: list):
+        """Restaura o purga los elementos en $batch concurrentes
+
+        Args:
+            objetivos: [(identificador, elemento eliminado)]
+        """
+        contador = "restaurados" if accion == "restaurar" else "purgados"
+        status_ok = 200 if accion == "restaurar" else 204
+
+        ejecutor = EjecutorLotes()
+        ids = {}
+        for identificador, elemento in objetivos:
+            if accion == "restaurar":
+                id_op = ejecutor.agregar("POST", f"/directory/deletedItems/{elemento['id']}/restore", {})
+            else:
+                id_op = ejecutor.agregar("DELETE", f"/directory/deletedItems/{elemento['id']}")
+            ids[id_op] = (identificador, elemento)
+
+        self.progreso.iniciar(len(ids), etapa=f"{accion.capitalize()} elementos eliminados")
+
+        def informar(respuestas_lote):
+            for id_op, respuesta in respuestas_lote.items():
+                if id_op in ids and respuesta["status"] not in EjecutorLotes.STATUS_REINTENTABLES:
+                    self.progreso.avanzar(actual=ids[id_op][0], exito=respuesta["status"] == status_ok)
+
+        respuestas = ejecutor.ejecutar(al_responder=informar, max_simultaneos=config.ELIMINACION_LOTES_SIMULTANEOS)
+
+        for id_op, (identificador, elemento) in ids.items():
+            nombre = elemento.get("displayName") or identificador
+            respuesta = respuestas.get(id_op, {"status": 0})
+            if respuesta["status"] == status_ok:
+                mensaje = f"{nombre} {contador[:-1]}"
+                self.resultados[contador] += 1
+                self.diario.registrar(f"objeto:{elemento['id']}", identificador=identificador, aplicado=True)
+                print(f"✅ {mensaje}")
+            elif respuesta["status"] == 404:
+                # Ya no está en la papelera (purgado o restaurado por otra vía)
+                mensaje = f"{nombre} ya no está en la papelera"
+                self.diario.registrar(f"objeto:{elemento['id']}", identificador=identificador, aplicado=False)
+                print(f"⚪ {mensaje}")
+            else:
+                mensaje = f"Error al {accion} {nombre}: {EjecutorLotes.mensaje_error(respuesta)}"
+                self.resultados["errores"] += 1
+                self.resultados["detalles_errores"].append(mensaje)
+                print(f"❌ {mensaje}")
+            self.resultados["detalles"].append(f"{identificador}: {mensaje}")
+
+    def contar_encontrados(self, identificadores: list, en_papelera: set):
+        """Clasifica cada identificador del archivo como encontrado o no (una sola vez)
+
+        Cuenta como encontrado si estaba en la papelera o si una ejecución
+        anterior ya le aplicó la acción; si todas sus copias respondieron
+        404, cuenta como no encontrado.
+        """
+        aplicados, ausentes = set(), set()
+        for entrada in self.diario.completadas.values():
+            (aplicados if entrada.get("aplicado") else ausentes).add(entrada.get("identificador"))
+        encontrados = (set(en_papelera) | aplicados) - (ausentes - aplicados)
+
+        for identificador in identificadores:
+            if identificador not in encontrados:
+                self.resultados["detalles"].append(f"{identificador}: no está en la papelera")
+        self.resultados["encontrados"] = sum(1 for i in identificadores if i in encontrados)
+        self.resultados["no_encontrados"] = len(identificadores) - self.resultados["encontrados"]
+
+    def procesar(self, ruta_archivo: str, accion: str = "restaurar", confirmacion: bool = True) -> dict:
+        """
+        Proceso principal: carga, cruza con la papelera y restaura o purga
+
+        Args:
+            ruta_archivo: Ruta al archivo Excel/CSV
+            accion: "restaurar" o "purgar" (purgar es irreversible)
+            confirmacion: Si pedir confirmación antes de escribir
+
+        Returns:
+            dict: Resultados del proceso
+        """
+        if accion not in self.ACCIONES:
+            raise ValueError(f"Acción no válida: {accion}. Use {', '.join(self.ACCIONES)}")
+
+        print("\n" + "=" * 70)
+        print(f"♻️  ELEMENTOS ELIMINADOS ({accion.upper()}) - {config.COLEGIO_NOMBRE}")
+        print("=" * 70)
+
+        try:
+            tipo, identificadores = self.cargar_identificadores(ruta_archivo)
+            self.resultados["total"] = len(identificadores)
+
+            if not self.obtener_token():
+                return self.resultados
+
+            self.diario = abrir_diario(f"{accion}_eliminados", ruta_archivo)
+            en_papelera = set()
+            try:
+                indice = self.indexar_eliminados(tipo)
+
+                # Lo ya aplicado en una ejecución anterior ya no está en la papelera
+                ya_procesados = {entrada.get("identificador") for entrada in self.diario.completadas.values()}
+                self.resultados["restaurados" if accion == "restaurar" else "purgados"] += sum(
+                    1 for entrada in self.diario.completadas.values() if entrada.get("aplicado")
+                )
+
+                objetivos = {}  # id del elemento → (identificador, elemento)
+                for identificador in identificadores:
+                    if accion == "restaurar" and identificador in ya_procesados:
+                        # Su copia más reciente ya se restauró: las más antiguas chocarían con ella
+                        continue
+                    candidatos = self.buscar(tipo, identificador, indice)
+                    if not candidatos:
+                        continue
+                    en_papelera.add(identificador)
+                    # Restaurar solo la eliminación más reciente; purgar todas las copias
+                    for elemento in candidatos[:1] if accion == "restaurar" else candidatos:
+                        if not self.diario.hecho(f"objeto:{elemento['id']}"):
+                            objetivos.setdefault(elemento["id"], (identificador, elemento))
+                objetivos = list(objetivos.values())
+
+                print(f"✅ Encontrados en la papelera: {len(en_papelera)} de {self.resultados['total']}")
+
+                if objetivos and confirmacion and accion == "purgar":
+                    print("\n⚠️  ADVERTENCIA: purgar elimina los elementos DEFINITIVAMENTE")
+                    respuesta = input(
+                        f"\n¿Purgar {len(objetivos)} elementos? (escriba 'PURGAR' para confirmar): "
+                    ).strip()
+                    if respuesta != "PURGAR":
+                        print("❌ Operación cancelada")
+                        return self.resultados
+                elif objetivos and confirmacion:
+                    respuesta = input(f"\n¿Restaurar {len(objetivos)} elementos? (si/no): ").strip().lower()
+                    if respuesta not in ['si', 's', 'yes', 'y']:
+                        print("❌ Operación cancelada")
+                        return self.resultados
+
+                if objetivos:
+                    print(f"\n📦 {accion.capitalize()} {len(objetivos)} elementos en lotes...")
+                    self.ejecutar_accion(accion, objetivos)
+            finally:
+                self.contar_encontrados(identificadores, en_papelera)
+                self.diario.finalizar(self.resultados["errores"] == 0)
+
+            self.mostrar_resumen(accion)
+            self.guardar_log(accion)
+
+            return self.resultados
+
+        except Exception as e:
+            print(f"❌ Error general: {e}")
+            self.resultados["errores"] += 1
+            self.resultados["detalles_errores"].append(str(e))
+            return self.resultados
+
+    def mostrar_resumen(self, accion: str):
+        """Muestra resumen de la operación"""
+        print("\n" + "=" * 70)
+        print(f"📊 RESUMEN ({accion.upper()} ELEMENTOS ELIMINADOS)")
+        print("=" * 70)
+        print(f"Total en archivo: {self.resultados['total']}")
+        print(f"Encontrados en la papelera: {self.resultados['encontrados']}")
+        print(f"Restaurados: {self.resultados['restaurados']}")
+        print(f"Purgados: {self.resultados['purgados']}")
+        print(f"No encontrados: {self.resultados['no_encontrados']}")
+        print(f"Errores: {self.resultados['errores']}")
+        print("=" * 70)
+
+    def guardar_log(self, accion: str):
+        """Guarda log detallado de la operación"""
+        try:
+            os.makedirs(config.CARPETA_LOGS, exist_ok=True)
+
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            log_file = os.path.join(config.CARPETA_LOGS, f'{accion}_eliminados_{timestamp}.log')
+
+            with open(log_file, 'w', encoding='utf-8') as f:
+                f.write(f"{accion.upper()} ELEMENTOS ELIMINADOS - {config.COLEGIO_NOMBRE}\n")
+                f.write(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write("=" * 70 + "\n")
+                f.write(f"Total en archivo: {self.resultados['total']}\n")
+                f.write(f"Encontrados en la papelera: {self.resultados['encontrados']}\n")
+                f.write(f"Restaurados: {self.resultados['restaurados']}\n")
+                f.write(f"Purgados: {self.resultados['purgados']}\n")
+                f.write(f"No encontrados: {self.resultados['no_encontrados']}\n")
+                f.write(f"Errores: {self.resultados['errores']}\n\n")
+
+                f.write("DETALLES:\n")
+                f.write("-" * 70 + "\n")
+                for detalle in self.resultados["detalles"]:
+                    f.write(f"{detalle}\n")
+
+            registrar_log(log_file)
+
+            print(f"\n📝 Log guardado en: {log_file}")
+
+        except Exception as e:
+            print(f"❌ Error guardando log: {e}")
+
+
+def main():
+    """Función principal"""
+    print("♻️  GESTOR DE ELEMENTOS ELIMINADOS")
+    print(f"🏫 {config.COLEGIO_NOMBRE}")
+    print("=" * 70)
+
+    try:
+        gestor = GestorElementosEliminados()
+
+        print("\nOpciones:")
+        print("1. Restaurar desde archivo Excel/CSV")
+        print("2. Purgar definitivamente desde archivo Excel/CSV")
+        print("3. Cancelar")
+
+        opcion = input("\nSeleccione una opción (1-3): ").strip()
+        if opcion not in ("1", "2"):
+            print("❌ Operación cancelada")
+            return
+
+        ruta_archivo = input("\n📁 Ruta del archivo (Excel/CSV): ").strip()
+        if not os.path.exists(ruta_archivo):
+            print(f"❌ Archivo no encontrado: {ruta_archivo}")
+            return
+
+        gestor.procesar(ruta_archivo, accion="restaurar" if opcion == "1" else "purgar")
+
+    except KeyboardInterrupt:
+        print("\n❌ Proceso interrumpido por el usuario")
+    except Exception as e:
+        print(f"❌ Error inesperado: {e}")
+
+
+if __name__ == "__main__":
+    main()
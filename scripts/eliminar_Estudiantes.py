@@ -1,4 +1,3 @@
-import pandas as pd
 import requests
 import urllib3
 from datetime import datetime
@@ -8,6 +7,13 @@ import sys
 # Añadir la carpeta scripts al path para importar configuración
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import LectorArchivo
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.diario_checkpoint import abrir_diario
+from scripts.lotes_graph import EjecutorLotes
+from scripts.directorio_local import obtener_directorio
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -18,28 +24,20 @@ class EliminadorEstudiantes:
         # Validar configuración al inicializar
         config.validar_configuracion()
         self.token = None
+        self.progreso = reportador_actual()
         self.resultados = {
             "total": 0,
             "eliminados": 0,
             "no_encontrados": 0,
+            "por_eliminar": 0,  # Solo en simulación
             "errores": 0,
             "detalles": []
         }
         
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido correctamente")
             return True
         except requests.RequestException as e:
@@ -60,13 +58,13 @@ class EliminadorEstudiantes:
         url = f"{config.GRAPH_ENDPOINT}/users/{user_email}"
         
         try:
-            response = requests.get(url, headers=headers, verify=False)
+            response = cliente_graph.get(url, headers=headers, verify=False)
             return response.status_code == 200
         except requests.RequestException:
             return False
 
     def eliminar_estudiante(self, codigo_estudiante: str) -> tuple[bool, str]:
-        """Elimina un estudiante del tenant"""
+        """Elimina un estudiante del tenant (un 404 del DELETE indica que no existe)"""
         if not self.token:
             return False, "Token no disponible"
             
@@ -79,15 +77,12 @@ class EliminadorEstudiantes:
         url = f"{config.GRAPH_ENDPOINT}/users/{user_email}"
         
         try:
-            # Primero verificar si existe
-            if not self.verificar_usuario_existe(codigo_estudiante):
-                return False, f"Usuario {codigo_estudiante} no encontrado"
-            
-            # Eliminar usuario
-            response = requests.delete(url, headers=headers, verify=False)
+            response = cliente_graph.delete(url, headers=headers, verify=False)
             
             if response.status_code == 204:
                 return True, f"Usuario {codigo_estudiante} eliminado exitosamente"
+            elif response.status_code == 404:
+                return False, f"Usuario {codigo_estudiante} no encontrado"
             else:
                 return False, f"Error eliminando {codigo_estudiante}: {response.text}"
                 
@@ -100,17 +95,11 @@ class EliminadorEstudiantes:
         
         if ruta_archivo and os.path.exists(ruta_archivo):
             try:
-                if ruta_archivo.endswith(".xlsx"):
-                    df = pd.read_excel(ruta_archivo, dtype=str)
-                elif ruta_archivo.endswith(".csv"):
-                    df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-                else:
-                    raise ValueError("❌ Formato no soportado. Usa .xlsx o .csv")
-                
                 # Obtener códigos de estudiantes
-                if 'CODIGO' in df.columns:
-                    estudiantes = df['CODIGO'].astype(str).tolist()
-                else:
+                columna, estudiantes = LectorArchivo(ruta_archivo).valores_columna(
+                    lambda columnas: 'CODIGO' if 'CODIGO' in columnas else None, unicos=False
+                )
+                if not columna:
                     print("❌ No se encontró columna 'CODIGO' en el archivo")
                     return []
                     
@@ -126,18 +115,133 @@ class EliminadorEstudiantes:
         
         return estudiantes
 
-    def eliminar_masivo_con_confirmacion(self, codigos_estudiantes: list, confirmacion: bool = True) -> dict:
+    def simular_eliminacion(self, codigos_estudiantes: list) -> dict:
+        """Informa qué códigos existen sin eliminar nada
+
+        La existencia se resuelve en bloque: con el directorio local, desde
+        el espejo; si no, con filtros 'userPrincipalName in (...)'.
+        """
+        upns = {f"{codigo}@{config.COLEGIO_DOMINIO}".lower(): codigo for codigo in codigos_estudiantes}
+        
+        directorio = obtener_directorio()
+        if directorio:
+            print("🔍 Resolviendo existencia desde el directorio local...")
+            existentes = {upn for upn in upns if directorio.obtener_user_id(upn)}
+        else:
+            print("🔍 Resolviendo existencia en bloque con Graph...")
+            try:
+                existentes = set(cliente_graph.resolver_usuarios(list(upns)))
+            except Exception as e:
+                error_msg = f"No se pudo resolver la existencia de los usuarios: {e}"
+                print(f"❌ {error_msg}")
+                self.resultados["errores"] += 1
+                self.resultados["detalles"].append(error_msg)
+                return self.resultados
+        
+        for upn, codigo in upns.items():
+            if upn in existentes:
+                self.resultados["por_eliminar"] += 1
+                self.resultados["detalles"].append(f"{codigo}: se eliminaría")
+            else:
+                self.resultados["no_encontrados"] += 1
+                self.resultados["detalles"].append(f"{codigo}: no encontrado")
+        
+        print(f"🧪 Simulación: {self.resultados['por_eliminar']} se eliminarían, "
+              f"{self.resultados['no_encontrados']} no existen")
+        return self.resultados
+
+    def eliminar_en_lotes(self, codigos: list, diario):
+        """Envía los DELETE en peticiones $batch y clasifica 204/404 directamente"""
+        ejecutor = EjecutorLotes()
+        ids = {
+            ejecutor.agregar("DELETE", f"/users/{codigo}@{config.COLEGIO_DOMINIO}"): codigo
+            for codigo in codigos
+        }
+        
+        def informar(respuestas_lote):
+            for id_op, respuesta in respuestas_lote.items():
+                if id_op in ids and respuesta["status"] not in EjecutorLotes.STATUS_REINTENTABLES:
+                    exito = respuesta["status"] in (204, 404)
+                    error = None if exito else f"Error eliminando {ids[id_op]}"
+                    self.progreso.avanzar(actual=ids[id_op], exito=exito, error=error)
+        
+        respuestas = ejecutor.ejecutar(al_responder=informar, max_simultaneos=config.ELIMINACION_LOTES_SIMULTANEOS)
+        
+        for id_op, codigo in ids.items():
+            respuesta = respuestas.get(id_op, {"status": 0})
+            if respuesta["status"] == 204:
+                mensaje = f"Usuario {codigo} eliminado exitosamente"
+                self.resultados["eliminados"] += 1
+                diario.registrar(f"estudiante:{codigo}", eliminado=True)
+                print(f"✅ {mensaje}")
+            elif respuesta["status"] == 404:
+                mensaje = f"Usuario {codigo} no encontrado"
+                self.resultados["no_encontrados"] += 1
+                diario.registrar(f"estudiante:{codigo}", eliminado=False)
+                print(f"⚪ {mensaje}")
+            else:
+                mensaje = f"Error eliminando {codigo}: {EjecutorLotes.mensaje_error(respuesta)}"
+                self.resultados["errores"] += 1
+                print(f"❌ {mensaje}")
+            self.resultados["detalles"].append(f"{codigo}: {mensaje}")
+
+    def eliminar_serial(self, codigos_estudiantes: list, diario):
+        """Elimina usuarios uno a uno (un DELETE por código)"""
+        for index, codigo in enumerate(codigos_estudiantes, 1):
+            if diario.hecho(f"estudiante:{codigo}"):
+                continue
+            
+            print(f"\n🔍 Procesando {index}/{len(codigos_estudiantes)}: {codigo}")
+            self.progreso.actualizar(actual=codigo)
+            
+            try:
+                exito, mensaje = self.eliminar_estudiante(codigo)
+                
+                if exito:
+                    self.resultados["eliminados"] += 1
+                    diario.registrar(f"estudiante:{codigo}", eliminado=True)
+                    self.progreso.avanzar()
+                    print(f"✅ {mensaje}")
+                elif "no encontrado" in mensaje.lower():
+                    self.resultados["no_encontrados"] += 1
+                    diario.registrar(f"estudiante:{codigo}", eliminado=False)
+                    self.progreso.avanzar()
+                    print(f"⚪ {mensaje}")
+                else:
+                    self.resultados["errores"] += 1
+                    self.progreso.avanzar(exito=False, error=mensaje)
+                    print(f"❌ {mensaje}")
+                
+                self.resultados["detalles"].append(f"{codigo}: {mensaje}")
+                
+            except Exception as e:
+                error_msg = f"Error inesperado procesando {codigo}: {e}"
+                print(f"❌ {error_msg}")
+                self.resultados["errores"] += 1
+                self.resultados["detalles"].append(f"{codigo}: {error_msg}")
+                self.progreso.avanzar(exito=False, error=error_msg)
+
+    def eliminar_masivo_con_confirmacion(self, codigos_estudiantes: list, confirmacion: bool = True,
+                                         modo: str = "serial", simulacion: bool = False) -> dict:
         """Elimina estudiantes con confirmaciones de seguridad
         
         Args:
             codigos_estudiantes (list): Lista de códigos.
             confirmacion (bool, optional): Pedir confirmación. Defaults to True.
+            modo (str, optional): "serial" (un DELETE por usuario) o "lotes"
+                (DELETE agrupados en $batch). Defaults to "serial".
+            simulacion (bool, optional): Solo informar qué se eliminaría. Defaults to False.
             
         Returns:
             dict: Resultados del proceso
         """
         self.resultados["total"] = len(codigos_estudiantes)
         
+        if simulacion:
+            self.simular_eliminacion(codigos_estudiantes)
+            self.mostrar_resumen()
+            return self.resultados
+        
         if confirmacion:
             print(f"\n⚠️  ADVERTENCIA IMPORTANTE ⚠️")
             print("="*60)
@@ -167,30 +271,23 @@ class EliminadorEstudiantes:
         print(f"\n🗑️  Iniciando eliminación de usuarios...")
         print("="*50)
         
-        # Procesar eliminaciones
-        for index, codigo in enumerate(codigos_estudiantes, 1):
-            print(f"\n🔍 Procesando {index}/{len(codigos_estudiantes)}: {codigo}")
-            
-            try:
-                exito, mensaje = self.eliminar_estudiante(codigo)
-                
-                if exito:
-                    self.resultados["eliminados"] += 1
-                    print(f"✅ {mensaje}")
-                elif "no encontrado" in mensaje.lower():
-                    self.resultados["no_encontrados"] += 1
-                    print(f"⚪ {mensaje}")
-                else:
-                    self.resultados["errores"] += 1
-                    print(f"❌ {mensaje}")
-                
-                self.resultados["detalles"].append(f"{codigo}: {mensaje}")
-                
-            except Exception as e:
-                error_msg = f"Error inesperado procesando {codigo}: {e}"
-                print(f"❌ {error_msg}")
-                self.resultados["errores"] += 1
-                self.resultados["detalles"].append(f"{codigo}: {error_msg}")
+        # Checkpoint: los códigos ya resueltos en una ejecución anterior no se consultan
+        diario = abrir_diario("eliminar_estudiantes", valores=codigos_estudiantes)
+        self.progreso.iniciar(len(codigos_estudiantes), etapa="Eliminando estudiantes")
+        for codigo in codigos_estudiantes:
+            entrada = diario.obtener(f"estudiante:{codigo}")
+            if entrada:
+                self.resultados["eliminados" if entrada.get("eliminado") else "no_encontrados"] += 1
+                self.progreso.avanzar()
+        
+        if modo == "lotes":
+            pendientes = [codigo for codigo in codigos_estudiantes if not diario.hecho(f"estudiante:{codigo}")]
+            print(f"📦 Eliminando {len(pendientes)} usuarios en lotes...")
+            self.eliminar_en_lotes(pendientes, diario)
+        else:
+            self.eliminar_serial(codigos_estudiantes, diario)
+        
+        diario.finalizar(self.resultados["errores"] == 0)
         
         # Mostrar resumen final
         self.mostrar_resumen()
@@ -206,6 +303,8 @@ class EliminadorEstudiantes:
         print(f"🏫 Colegio: {config.COLEGIO_NOMBRE}")
         print(f"📅 Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"📊 Total procesados: {self.resultados['total']}")
+        if self.resultados['por_eliminar']:
+            print(f"🧪 Se eliminarían (simulación): {self.resultados['por_eliminar']}")
         print(f"✅ Usuarios eliminados: {self.resultados['eliminados']}")
         print(f"⚪ Usuarios no encontrados: {self.resultados['no_encontrados']}")
         print(f"❌ Errores: {self.resultados['errores']}")
@@ -233,6 +332,8 @@ class EliminadorEstudiantes:
                 for detalle in self.resultados["detalles"]:
                     f.write(f"{detalle}\n")
             
+            registrar_log(log_file)
+            
             print(f"📝 Log detallado guardado en: {log_file}")
             
         except Exception as e:
@@ -256,9 +357,10 @@ def main():
         print("\nOpciones de eliminación:")
         print("1. Eliminar rango de códigos de prueba (40302001-40302200)")
         print("2. Eliminar desde archivo Excel/CSV")
-        print("3. Cancelar")
+        print("3. Simular eliminación desde archivo (no elimina)")
+        print("4. Cancelar")
         
-        opcion = input("\nSeleccione una opción (1-3): ").strip()
+        opcion = input("\nSeleccione una opción (1-4): ").strip()
         
         if opcion == "1":
             # Eliminar rango de prueba
@@ -271,9 +373,16 @@ def main():
             ruta_archivo = input("Ruta del archivo (.xlsx o .csv): ").strip()
             codigos = eliminador.cargar_lista_estudiantes(ruta_archivo)
             if codigos:
-                eliminador.eliminar_masivo_con_confirmacion(codigos)
+                eliminador.eliminar_masivo_con_confirmacion(codigos, modo="lotes")
         
         elif opcion == "3":
+            # Simulación: solo informa qué usuarios existen
+            ruta_archivo = input("Ruta del archivo (.xlsx o .csv): ").strip()
+            codigos = eliminador.cargar_lista_estudiantes(ruta_archivo)
+            if codigos:
+                eliminador.eliminar_masivo_con_confirmacion(codigos, simulacion=True)
+        
+        elif opcion == "4":
             print("❌ Operación cancelada")
         
         else:
@@ -20,6 +20,12 @@ import sys
 # Añadir la carpeta scripts al path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.diario_checkpoint import abrir_diario
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -34,6 +40,8 @@ class EliminadorTeams:
             pass
         
         self.token = None
+        self.diario = None  # Checkpoint del archivo en proceso
+        self.progreso = reportador_actual()
         self.resultados = {
             "total": 0,
             "encontrados": 0,
@@ -48,18 +56,8 @@ class EliminadorTeams:
     
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido correctamente")
             return True
         except requests.RequestException as e:
@@ -76,16 +74,7 @@ class EliminadorTeams:
         - Cualquier combinación
         """
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("❌ Formato no soportado. Usa .xlsx o .csv")
-            
-            # Limpiar datos
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            df = cargar_dataframe(ruta_archivo)
             
             print(f"✅ Archivo cargado: {len(df)} Teams encontrados")
             return df
@@ -126,6 +115,18 @@ class EliminadorTeams:
             return None
         
         identificador = str(identificador).strip()
+        
+        # Buscar en el directorio local (ID, nombre o correo)
+        directorio = obtener_directorio()
+        if directorio:
+            grupo = directorio.buscar_grupo(identificador)
+            if grupo:
+                return {
+                    "GroupId": grupo["id"],
+                    "DisplayName": grupo["display_name"],
+                    "Mail": grupo["mail"]
+                }
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -134,7 +135,7 @@ class EliminadorTeams:
         # Primero intentar como GroupId (ID directo)
         try:
             url = f"{config.GRAPH_ENDPOINT}/groups/{identificador}?$select=id,displayName,mail"
-            response = requests.get(url, headers=headers, verify=False)
+            response = cliente_graph.get(url, headers=headers, verify=False)
             
             if response.status_code == 200:
                 data = response.json()
@@ -156,7 +157,7 @@ class EliminadorTeams:
                 f"or mail eq '{nombre_escapado}'"
                 f"&$select=id,displayName,mail"
             )
-            response = requests.get(url, headers=headers, verify=False)
+            response = cliente_graph.get(url, headers=headers, verify=False)
             
             if response.status_code == 200:
                 data = response.json()
@@ -191,16 +192,25 @@ class EliminadorTeams:
         
         print("\n🔍 Buscando Teams en el tenant...")
         print("=" * 70)
+        self.progreso.iniciar(len(df), etapa="Buscando Teams")
         
         for idx, identificador in enumerate(df[col_identificador], 1):
             identificador = str(identificador).strip()
             if not identificador:
+                self.progreso.avanzar()
+                continue
+            
+            if self.diario and self.diario.hecho(f"equipo:{identificador}"):
+                # Eliminado en una ejecución anterior: no se vuelve a buscar
+                self.resultados["eliminados"] += 1
+                self.progreso.avanzar(actual=identificador)
                 continue
             
             print(f"\n[{idx}] Buscando: {identificador}")
             
             # Buscar el Team
             team = self.buscar_team(identificador)
+            self.progreso.avanzar(actual=identificador)
             
             if team:
                 equipos_a_eliminar.append({
@@ -252,7 +262,7 @@ class EliminadorTeams:
         url = f"{config.GRAPH_ENDPOINT}/groups/{group_id}"
         
         try:
-            response = requests.delete(url, headers=headers, verify=False)
+            response = cliente_graph.delete(url, headers=headers, verify=False)
             
             if response.status_code == 204:
                 return True, f"Team '{display_name}' eliminado correctamente"
@@ -309,9 +319,11 @@ class EliminadorTeams:
         print("\n" + "=" * 70)
         print("🗑️  INICIANDO ELIMINACIÓN DE TEAMS...")
         print("=" * 70)
+        self.progreso.iniciar(len(equipos_encontrados), etapa="Eliminando Teams")
         
         for idx, equipo in enumerate(equipos_encontrados, 1):
             print(f"\n[{idx}/{len(equipos_encontrados)}] Eliminando: {equipo['DisplayName']}")
+            self.progreso.actualizar(actual=equipo["DisplayName"])
             
             exito, mensaje = self.eliminar_team(equipo["GroupId"], equipo["DisplayName"])
             
@@ -319,9 +331,13 @@ class EliminadorTeams:
                 print(f"✅ {mensaje}")
                 self.resultados["eliminados"] += 1
                 self.resultados["equipos_eliminados"].append(equipo)
+                if self.diario:
+                    self.diario.registrar(f"equipo:{equipo['Identificador']}")
+                self.progreso.avanzar()
             else:
                 print(f"❌ {mensaje}")
                 self.resultados["errores"] += 1
+                self.progreso.avanzar(exito=False, error=f"{equipo['DisplayName']}: {mensaje}")
                 self.resultados["equipos_errores"].append({
                     **equipo,
                     "error": mensaje
@@ -379,6 +395,8 @@ class EliminadorTeams:
                         f.write(f"❌ {equipo['DisplayName'] or equipo['Identificador']}\n")
                         f.write(f"   Error: {equipo.get('error', 'Desconocido')}\n\n")
             
+            registrar_log(log_file)
+            
             print(f"\n📝 Log guardado en: {log_file}")
             
         except Exception as e:
@@ -400,11 +418,15 @@ class EliminadorTeams:
         print("=" * 70)
         
         try:
-            # 1. Obtener lista de Teams a eliminar
-            equipos = self.obtener_lista_equipos_a_eliminar(ruta_archivo)
-            
-            # 2. Procesar eliminación
-            self.procesar_equipos(equipos, confirmacion=confirmacion)
+            self.diario = abrir_diario("eliminar_teams", ruta_archivo)
+            try:
+                # 1. Obtener lista de Teams a eliminar
+                equipos = self.obtener_lista_equipos_a_eliminar(ruta_archivo)
+                
+                # 2. Procesar eliminación
+                self.procesar_equipos(equipos, confirmacion=confirmacion)
+            finally:
+                self.diario.finalizar(self.resultados["errores"] == 0)
             
             return self.resultados
             
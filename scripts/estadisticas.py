@@ -1,17 +1,194 @@
+import copy
 import os
 import re
+import sqlite3
+import threading
 from datetime import datetime, timedelta
 from collections import defaultdict
 from scripts.configuracion import config
 
+
+class IndiceEstadisticas:
+    """Índice SQLite con el resumen de cada log ya analizado
+    
+    Cada log se analiza una sola vez (al guardarse o, para logs antiguos,
+    la primera vez que se consulta el índice); el dashboard agrega sobre
+    la tabla en lugar de releer los archivos.
+    """
+    
+    CAMPOS = ('creados', 'actualizados', 'eliminados', 'equipos', 'miembros', 'owners', 'errores')
+    
+    def __init__(self, ruta_db=None, carpeta_logs=None):
+        self.ruta_db = ruta_db or config.ESTADISTICAS_DB
+        self.carpeta_logs = carpeta_logs or config.CARPETA_LOGS
+        carpeta = os.path.dirname(self.ruta_db)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.ruta_db, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    archivo TEXT PRIMARY KEY,
+                    tipo TEXT,
+                    dia TEXT,
+                    fecha TEXT,
+                    creados INTEGER DEFAULT 0,
+                    actualizados INTEGER DEFAULT 0,
+                    eliminados INTEGER DEFAULT 0,
+                    equipos INTEGER DEFAULT 0,
+                    miembros INTEGER DEFAULT 0,
+                    owners INTEGER DEFAULT 0,
+                    errores INTEGER DEFAULT 0,
+                    resumen TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_logs_tipo ON logs(tipo);
+                CREATE INDEX IF NOT EXISTS idx_logs_dia ON logs(dia);
+                CREATE INDEX IF NOT EXISTS idx_logs_fecha ON logs(fecha);
+            """)
+    
+    def registrar(self, ruta_archivo):
+        """Analiza un log y guarda (o reemplaza) su resumen en el índice
+        
+        Los logs de tipos que el dashboard no contabiliza se guardan con
+        tipo NULL para no volver a analizarlos.
+        """
+        nombre = os.path.basename(ruta_archivo)
+        tipo, datos = AnalizadorEstadisticas.analizar_log(ruta_archivo, nombre)
+        
+        fecha_match = re.search(r'(\d{8})_', nombre)
+        fila = {
+            'archivo': nombre,
+            'tipo': tipo,
+            'dia': fecha_match.group(1) if fecha_match else None,
+            'fecha': datos.get('fecha'),
+            'resumen': datos.get('resumen', '')
+        }
+        fila.update({campo: datos.get(campo, 0) for campo in self.CAMPOS})
+        
+        columnas = ', '.join(fila)
+        marcadores = ', '.join('?' for _ in fila)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO logs ({columnas}) VALUES ({marcadores})",
+                tuple(fila.values())
+            )
+    
+    def sincronizar(self):
+        """Pone el índice al día con la carpeta de logs
+        
+        Indexa los logs que aún no están y descarta las filas de los logs
+        borrados de la carpeta, para que no sigan sumando en el dashboard.
+        """
+        en_disco = set()
+        if os.path.exists(self.carpeta_logs):
+            en_disco = {f for f in os.listdir(self.carpeta_logs) if f.endswith('.log')}
+        
+        with self._lock:
+            indexados = {fila['archivo'] for fila in self._conn.execute("SELECT archivo FROM logs")}
+            borrados = indexados - en_disco
+            if borrados:
+                with self._conn:
+                    self._conn.executemany("DELETE FROM logs WHERE archivo = ?", [(f,) for f in borrados])
+        nuevos = sorted(en_disco - indexados)
+        for archivo in nuevos:
+            self.registrar(os.path.join(self.carpeta_logs, archivo))
+        return len(nuevos)
+    
+    def consultar(self, sql, parametros=()):
+        with self._lock:
+            return self._conn.execute(sql, parametros).fetchall()
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def _indice_compartido():
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceEstadisticas()
+        return _indice
+
+
+def obtener_indice():
+    """Índice compartido, al día con la carpeta de logs"""
+    indice = _indice_compartido()
+    indice.sincronizar()
+    return indice
+
+
+def registrar_log(ruta_archivo):
+    """Añade un log recién guardado al índice de estadísticas
+    
+    Nunca interrumpe al proceso que guardó el log; si falla, el log se
+    indexará en la próxima consulta del dashboard.
+    """
+    try:
+        _indice_compartido().registrar(ruta_archivo)
+    except Exception as e:
+        print(f"⚠️  No se pudo indexar el log {ruta_archivo}: {e}")
+
+
+# Última instantánea calculada en este proceso: {'firma': ..., 'stats': ...}
+_cache_estadisticas = {'firma': None, 'stats': None}
+_cache_lock = threading.Lock()
+
+
 class AnalizadorEstadisticas:
     """Analiza logs para generar estadísticas y métricas"""
     
     def __init__(self):
         self.carpeta_logs = config.CARPETA_LOGS
-        
+    
+    def _firma_logs(self):
+        """Nombres y mtime de los logs: cambia si aparece o se modifica uno"""
+        if not os.path.exists(self.carpeta_logs):
+            return frozenset()
+        with os.scandir(self.carpeta_logs) as entradas:
+            return frozenset(
+                (entrada.name, entrada.stat().st_mtime_ns)
+                for entrada in entradas if entrada.name.endswith('.log')
+            )
+    
     def obtener_estadisticas_generales(self):
-        """Obtiene estadísticas generales de todos los logs"""
+        """Obtiene estadísticas generales de todo el historial de logs
+        
+        El resultado se reutiliza mientras la carpeta de logs no cambie.
+        """
+        firma = self._firma_logs()
+        with _cache_lock:
+            if _cache_estadisticas['firma'] == firma and _cache_estadisticas['stats'] is not None:
+                return copy.deepcopy(_cache_estadisticas['stats'])
+            
+            anterior = _cache_estadisticas['firma']
+            if anterior and firma:
+                # Logs reescritos desde la última instantánea: reindexar
+                nombres_anteriores = {nombre for nombre, _ in anterior}
+                indice = _indice_compartido()
+                for nombre, _ in firma - anterior:
+                    if nombre in nombres_anteriores:
+                        indice.registrar(os.path.join(self.carpeta_logs, nombre))
+            
+            stats = self._calcular_estadisticas()
+            _cache_estadisticas['firma'] = firma
+            _cache_estadisticas['stats'] = stats
+            return copy.deepcopy(stats)
+    
+    def obtener_datos_graficos(self, dias=30):
+        """Datos de los tres gráficos a partir de una sola instantánea"""
+        stats = self.obtener_estadisticas_generales()
+        return {
+            'lineas': self.obtener_datos_grafico_lineas(dias, stats=stats),
+            'barras': self.obtener_datos_grafico_barras(stats=stats),
+            'dona': self.obtener_datos_grafico_dona(stats=stats)
+        }
+    
+    def _calcular_estadisticas(self):
+        """Agrega el índice de logs en una instantánea de estadísticas"""
         stats = {
             'total_operaciones': 0,
             'estudiantes_creados': 0,
@@ -29,48 +206,51 @@ class AnalizadorEstadisticas:
         
         if not os.path.exists(self.carpeta_logs):
             return stats
+        
+        indice = obtener_indice()
+        
+        for fila in indice.consultar("""
+            SELECT tipo, COUNT(*) AS operaciones, SUM(creados) AS creados,
+                   SUM(actualizados) AS actualizados, SUM(eliminados) AS eliminados,
+                   SUM(equipos) AS equipos, SUM(miembros) AS miembros,
+                   SUM(owners) AS owners, SUM(errores) AS errores
+            FROM logs WHERE tipo IS NOT NULL GROUP BY tipo
+        """):
+            tipo_operacion = fila['tipo']
+            stats['total_operaciones'] += fila['operaciones']
+            stats['operaciones_por_tipo'][tipo_operacion] += fila['operaciones']
             
-        archivos_log = sorted(
-            [f for f in os.listdir(self.carpeta_logs) if f.endswith('.log')],
-            reverse=True
-        )
-        
-        for archivo in archivos_log[:50]:  # Últimos 50 logs
-            ruta = os.path.join(self.carpeta_logs, archivo)
-            tipo_operacion, datos = self._analizar_log(ruta, archivo)
+            # Acumular datos específicos
+            if tipo_operacion == 'crear_estudiantes':
+                stats['estudiantes_creados'] += fila['creados']
+            elif tipo_operacion == 'actualizar_estudiantes':
+                stats['estudiantes_actualizados'] += fila['actualizados']
+            elif tipo_operacion == 'eliminar_estudiantes':
+                stats['estudiantes_eliminados'] += fila['eliminados']
+            elif tipo_operacion == 'vaciar_equipos':
+                stats['teams_procesados'] += fila['equipos']
+                stats['miembros_eliminados'] += fila['miembros']
+                stats['owners_eliminados'] += fila['owners']
             
-            if tipo_operacion:
-                stats['total_operaciones'] += 1
-                stats['operaciones_por_tipo'][tipo_operacion] += 1
-                
-                # Extraer fecha del nombre del archivo
-                fecha_match = re.search(r'(\d{8})_', archivo)
-                if fecha_match:
-                    fecha_str = fecha_match.group(1)
-                    stats['operaciones_por_dia'][fecha_str] += 1
-                
-                # Acumular datos específicos
-                if tipo_operacion == 'crear_estudiantes':
-                    stats['estudiantes_creados'] += datos.get('creados', 0)
-                elif tipo_operacion == 'actualizar_estudiantes':
-                    stats['estudiantes_actualizados'] += datos.get('actualizados', 0)
-                elif tipo_operacion == 'eliminar_estudiantes':
-                    stats['estudiantes_eliminados'] += datos.get('eliminados', 0)
-                elif tipo_operacion == 'vaciar_equipos':
-                    stats['teams_procesados'] += datos.get('equipos', 0)
-                    stats['miembros_eliminados'] += datos.get('miembros', 0)
-                    stats['owners_eliminados'] += datos.get('owners', 0)
-                
-                stats['total_errores'] += datos.get('errores', 0)
-                
-                # Actividad reciente (últimas 10)
-                if len(stats['actividad_reciente']) < 10:
-                    stats['actividad_reciente'].append({
-                        'tipo': tipo_operacion,
-                        'fecha': datos.get('fecha', 'N/A'),
-                        'exito': datos.get('errores', 0) == 0,
-                        'detalles': datos.get('resumen', '')
-                    })
+            stats['total_errores'] += fila['errores']
+        
+        for fila in indice.consultar(
+            "SELECT dia, COUNT(*) AS operaciones FROM logs "
+            "WHERE tipo IS NOT NULL AND dia IS NOT NULL GROUP BY dia"
+        ):
+            stats['operaciones_por_dia'][fila['dia']] += fila['operaciones']
+        
+        # Actividad reciente (últimas 10)
+        for fila in indice.consultar(
+            "SELECT tipo, fecha, errores, resumen FROM logs "
+            "WHERE tipo IS NOT NULL ORDER BY fecha DESC, archivo DESC LIMIT 10"
+        ):
+            stats['actividad_reciente'].append({
+                'tipo': fila['tipo'],
+                'fecha': fila['fecha'] or 'N/A',
+                'exito': fila['errores'] == 0,
+                'detalles': fila['resumen'] or ''
+            })
         
         # Calcular tasa de éxito
         if stats['total_operaciones'] > 0:
@@ -79,14 +259,15 @@ class AnalizadorEstadisticas:
         
         return stats
     
-    def _analizar_log(self, ruta_archivo, nombre_archivo):
+    @classmethod
+    def analizar_log(cls, ruta_archivo, nombre_archivo):
         """Analiza un archivo de log individual"""
         try:
             with open(ruta_archivo, 'r', encoding='utf-8') as f:
                 contenido = f.read()
             
             datos = {
-                'fecha': self._extraer_fecha(contenido, nombre_archivo),
+                'fecha': cls._extraer_fecha(contenido, nombre_archivo),
                 'errores': 0,
                 'resumen': ''
             }
@@ -94,28 +275,28 @@ class AnalizadorEstadisticas:
             # Determinar tipo de operación
             if 'crear_estudiantes' in nombre_archivo or 'CREACIÓN DE ESTUDIANTES' in contenido:
                 tipo = 'crear_estudiantes'
-                datos['creados'] = self._extraer_numero(contenido, r'Estudiantes Creados:\s*(\d+)')
-                datos['errores'] = self._extraer_numero(contenido, r'Errores:\s*(\d+)')
+                datos['creados'] = cls._extraer_numero(contenido, r'Estudiantes Creados:\s*(\d+)')
+                datos['errores'] = cls._extraer_numero(contenido, r'Errores:\s*(\d+)')
                 datos['resumen'] = f"{datos['creados']} estudiantes creados"
                 
             elif 'actualizacion_estudiantes' in nombre_archivo or 'ACTUALIZACIÓN DE ESTUDIANTES' in contenido:
                 tipo = 'actualizar_estudiantes'
-                datos['actualizados'] = self._extraer_numero(contenido, r'Estudiantes Actualizados:\s*(\d+)')
-                datos['errores'] = self._extraer_numero(contenido, r'Errores:\s*(\d+)')
+                datos['actualizados'] = cls._extraer_numero(contenido, r'Estudiantes Actualizados:\s*(\d+)')
+                datos['errores'] = cls._extraer_numero(contenido, r'Errores:\s*(\d+)')
                 datos['resumen'] = f"{datos['actualizados']} estudiantes actualizados"
                 
             elif 'eliminacion_estudiantes' in nombre_archivo or 'ELIMINACIÓN DE ESTUDIANTES' in contenido:
                 tipo = 'eliminar_estudiantes'
-                datos['eliminados'] = self._extraer_numero(contenido, r'Estudiantes Eliminados:\s*(\d+)')
-                datos['errores'] = self._extraer_numero(contenido, r'Errores:\s*(\d+)')
+                datos['eliminados'] = cls._extraer_numero(contenido, r'Estudiantes Eliminados:\s*(\d+)')
+                datos['errores'] = cls._extraer_numero(contenido, r'Errores:\s*(\d+)')
                 datos['resumen'] = f"{datos['eliminados']} estudiantes eliminados"
                 
             elif 'vaciado_equipos' in nombre_archivo or 'VACIADO DE EQUIPOS' in contenido:
                 tipo = 'vaciar_equipos'
-                datos['equipos'] = self._extraer_numero(contenido, r'Equipos Procesados:\s*(\d+)')
-                datos['miembros'] = self._extraer_numero(contenido, r'Miembros Eliminados:\s*(\d+)')
-                datos['owners'] = self._extraer_numero(contenido, r'Owners Eliminados:\s*(\d+)')
-                datos['errores'] = self._extraer_numero(contenido, r'Errores:\s*(\d+)')
+                datos['equipos'] = cls._extraer_numero(contenido, r'Equipos Procesados:\s*(\d+)')
+                datos['miembros'] = cls._extraer_numero(contenido, r'Miembros Eliminados:\s*(\d+)')
+                datos['owners'] = cls._extraer_numero(contenido, r'Owners Eliminados:\s*(\d+)')
+                datos['errores'] = cls._extraer_numero(contenido, r'Errores:\s*(\d+)')
                 datos['resumen'] = f"{datos['equipos']} teams procesados"
             else:
                 return None, {}
@@ -126,12 +307,14 @@ class AnalizadorEstadisticas:
             print(f"Error analizando {nombre_archivo}: {e}")
             return None, {}
     
-    def _extraer_numero(self, texto, patron):
+    @staticmethod
+    def _extraer_numero(texto, patron):
         """Extrae un número usando regex"""
         match = re.search(patron, texto)
         return int(match.group(1)) if match else 0
     
-    def _extraer_fecha(self, contenido, nombre_archivo):
+    @staticmethod
+    def _extraer_fecha(contenido, nombre_archivo):
         """Extrae la fecha del contenido o nombre del archivo"""
         # Intentar extraer del contenido
         match = re.search(r'Fecha:\s*(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})', contenido)
@@ -147,9 +330,9 @@ class AnalizadorEstadisticas:
         
         return 'N/A'
     
-    def obtener_datos_grafico_lineas(self, dias=30):
+    def obtener_datos_grafico_lineas(self, dias=30, stats=None):
         """Obtiene datos para gráfico de líneas (operaciones por día)"""
-        stats = self.obtener_estadisticas_generales()
+        stats = stats or self.obtener_estadisticas_generales()
         
         # Generar últimos N días
         hoy = datetime.now()
@@ -165,9 +348,9 @@ class AnalizadorEstadisticas:
         
         return datos
     
-    def obtener_datos_grafico_barras(self):
+    def obtener_datos_grafico_barras(self, stats=None):
         """Obtiene datos para gráfico de barras (operaciones por tipo)"""
-        stats = self.obtener_estadisticas_generales()
+        stats = stats or self.obtener_estadisticas_generales()
         
         tipos_nombres = {
             'crear_estudiantes': 'Crear',
@@ -186,9 +369,9 @@ class AnalizadorEstadisticas:
         
         return datos
     
-    def obtener_datos_grafico_dona(self):
+    def obtener_datos_grafico_dona(self, stats=None):
         """Obtiene datos para gráfico de dona (éxito vs errores)"""
-        stats = self.obtener_estadisticas_generales()
+        stats = stats or self.obtener_estadisticas_generales()
         
         total = stats['total_operaciones']
         errores = stats['total_errores']
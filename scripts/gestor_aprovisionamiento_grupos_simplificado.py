@@ -7,6 +7,14 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.preprocesamiento import limpiar_columnas, normalizar_upn, errores_obligatorios, filas_duplicadas, registros
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.control_concurrencia import controlador_concurrencia
+from scripts.lotes_graph import EjecutorLotes
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -14,6 +22,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 class GestorAprovisionamientoGruposSimplificado:
     """Gestor simplificado: Solo UPN + Curso_2026"""
     
+    PREFIJO_GRUPO_CURSO = "Estudiantes Curso -"
+    
     def __init__(self):
         """Inicializa el gestor"""
         try:
@@ -24,6 +34,7 @@ class GestorAprovisionamientoGruposSimplificado:
         self.token = None
         self.grupos_cache = {}  # Cache de grupos
         self.usuarios_cache = {}  # Cache de usuarios
+        self.progreso = reportador_actual()
         
         self.resultados = {
             "total": 0,
@@ -42,18 +53,8 @@ class GestorAprovisionamientoGruposSimplificado:
     
     def obtener_token(self) -> bool:
         """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido correctamente")
             return True
         except requests.RequestException as e:
@@ -67,16 +68,7 @@ class GestorAprovisionamientoGruposSimplificado:
         UserPrincipalName | Curso_2026
         """
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("❌ Formato no soportado. Usa .xlsx o .csv")
-            
-            # Limpiar datos
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            df = cargar_dataframe(ruta_archivo)
             
             print(f"✅ Archivo cargado: {len(df)} estudiantes encontrados")
             self.resultados["total"] = len(df)
@@ -142,21 +134,15 @@ class GestorAprovisionamientoGruposSimplificado:
           • Curso_2026 no puede estar vacío
         """
         print("\n🔍 Validando datos...")
-        errores = []
+        errores = errores_obligatorios(
+            df, {col_upn: "UPN", col_curso: "Curso_2026"}, referencia=col_upn, excluyentes=True
+        )
         
-        for idx, row in df.iterrows():
-            upn = str(row[col_upn]).strip() if row[col_upn] else ""
-            curso = str(row[col_curso]).strip() if row[col_curso] else ""
-            
-            # Validar UPN
-            if not upn or upn == "nan":
-                errores.append(f"Fila {idx+2}: UPN vacío")
-                continue
-            
-            # Validar Curso
-            if not curso or curso == "nan":
-                errores.append(f"Fila {idx+2} ({upn}): Curso_2026 vacío")
-                continue
+        duplicados = filas_duplicadas(df, col_upn, "UPN")
+        if duplicados:
+            print(f"⚠️  {len(duplicados)} UPN repetidos (se usa la última fila de cada uno):")
+            for aviso in duplicados[:5]:
+                print(f"   {aviso}")
         
         if errores:
             print(f"❌ Se encontraron {len(errores)} errores:")
@@ -181,6 +167,19 @@ class GestorAprovisionamientoGruposSimplificado:
         if nombre_grupo in self.grupos_cache:
             return self.grupos_cache[nombre_grupo]
         
+        # Buscar en el directorio local
+        directorio = obtener_directorio()
+        if directorio:
+            grupo = directorio.obtener_grupo_por_nombre(nombre_grupo)
+            if grupo:
+                resultado = {
+                    "GroupId": grupo["id"],
+                    "DisplayName": grupo["display_name"],
+                    "Mail": grupo["mail"]
+                }
+                self.grupos_cache[nombre_grupo] = resultado
+                return resultado
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -192,7 +191,7 @@ class GestorAprovisionamientoGruposSimplificado:
                 f"$filter=displayName eq '{nombre_grupo}'"
                 f"&$select=id,displayName,mail"
             )
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -219,6 +218,13 @@ class GestorAprovisionamientoGruposSimplificado:
         if not self.token:
             return []
         
+        # Buscar en el directorio local
+        directorio = obtener_directorio()
+        if directorio:
+            grupos = directorio.grupos_usuario(user_id)
+            if grupos:
+                return [{"id": g["id"], "displayName": g["display_name"]} for g in grupos]
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -226,7 +232,7 @@ class GestorAprovisionamientoGruposSimplificado:
         
         try:
             url = f"{config.GRAPH_ENDPOINT}/users/{user_id}/memberOf?$select=id,displayName"
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 datos = response.json()
@@ -273,6 +279,14 @@ class GestorAprovisionamientoGruposSimplificado:
         if upn in self.usuarios_cache:
             return self.usuarios_cache[upn]
         
+        # Buscar en el directorio local
+        directorio = obtener_directorio()
+        if directorio:
+            user_id = directorio.obtener_user_id(upn)
+            if user_id:
+                self.usuarios_cache[upn] = user_id
+                return user_id
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -280,7 +294,7 @@ class GestorAprovisionamientoGruposSimplificado:
         
         try:
             url = f"{config.GRAPH_ENDPOINT}/users/{upn}?$select=id"
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 user_id = response.json().get("id")
@@ -305,7 +319,7 @@ class GestorAprovisionamientoGruposSimplificado:
         url = f"{config.GRAPH_ENDPOINT}/groups/{group_id}/members/{user_id}/$ref"
         
         try:
-            response = requests.delete(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.delete(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 204:
                 return True, "Removido exitosamente"
@@ -330,7 +344,7 @@ class GestorAprovisionamientoGruposSimplificado:
         body = {"@odata.id": f"{config.GRAPH_ENDPOINT}/directoryObjects/{user_id}"}
         
         try:
-            response = requests.post(url, json=body, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.post(url, json=body, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 204:
                 return True, "Agregado exitosamente"
@@ -362,18 +376,20 @@ class GestorAprovisionamientoGruposSimplificado:
         print("\n" + "="*70)
         print("🔄 PROCESANDO ESTUDIANTES")
         print("="*70)
+        self.progreso.iniciar(len(df), etapa="Aprovisionando grupos")
         
-        for idx, row in df.iterrows():
-            upn = str(row[col_upn]).strip()
-            curso_nuevo = str(row[col_curso]).strip()
+        for idx, row in zip(df.index, registros(df, [col_upn, col_curso])):
+            upn = row[col_upn]
+            curso_nuevo = row[col_curso]
             
             # Validar datos básicos
-            if not upn or upn == "nan":
-                continue
-            if not curso_nuevo or curso_nuevo == "nan":
+            if not upn or not curso_nuevo:
+                self.progreso.avanzar()
                 continue
             
             print(f"\n[{idx+1}] Procesando: {upn}")
+            self.progreso.actualizar(actual=upn)
+            fallos_previos = self.resultados["removidos_fallidos"] + self.resultados["agregados_fallidos"]
             
             # Obtener ID del usuario
             user_id = self.obtener_user_id(upn)
@@ -381,6 +397,7 @@ class GestorAprovisionamientoGruposSimplificado:
                 print(f"    ❌ Usuario no encontrado en Azure AD")
                 self.resultados["usuario_no_encontrado"] += 1
                 self.resultados["errores"].append(f"{upn}: Usuario no encontrado")
+                self.progreso.avanzar(exito=False, error=f"{upn}: Usuario no encontrado")
                 continue
             
             # Obtener curso actual del usuario
@@ -455,6 +472,218 @@ class GestorAprovisionamientoGruposSimplificado:
                 "Curso_Nuevo": curso_nuevo,
                 "UserID": user_id
             })
+            fallo = self.resultados["removidos_fallidos"] + self.resultados["agregados_fallidos"] > fallos_previos
+            self.progreso.avanzar(exito=not fallo, error=f"{upn}: error cambiando de curso" if fallo else None)
+        
+        print("\n" + "="*70)
+        return self.resultados
+
+    def cargar_membresias_cursos(self) -> tuple:
+        """
+        Descarga UNA sola vez todos los grupos "Estudiantes Curso - *"
+        y sus miembros.
+        
+        Returns: (grupos_por_curso, usuarios_por_upn)
+          • grupos_por_curso: {curso: {"GroupId", "DisplayName", "Mail"}}
+          • usuarios_por_upn: {upn_minusculas: {"id", "cursos": set}}
+        """
+        print("\n🔍 Descargando membresías de los grupos de curso...")
+        
+        url = (
+            f"{config.GRAPH_ENDPOINT}/groups?"
+            f"$filter=startsWith(displayName, '{self.PREFIJO_GRUPO_CURSO}')"
+            f"&$select=id,displayName,mail&$top=999"
+        )
+        grupos_por_curso = {}
+        for grupo in cliente_graph.listar(url):
+            nombre = grupo.get("displayName", "")
+            curso = nombre.replace(self.PREFIJO_GRUPO_CURSO, "").strip()
+            if curso:
+                grupos_por_curso[curso] = {
+                    "GroupId": grupo.get("id"),
+                    "DisplayName": nombre,
+                    "Mail": grupo.get("mail")
+                }
+                self.grupos_cache[nombre] = grupos_por_curso[curso]
+        
+        def miembros(curso):
+            url_miembros = (
+                f"{config.GRAPH_ENDPOINT}/groups/{grupos_por_curso[curso]['GroupId']}"
+                f"/members/microsoft.graph.user?$select=id,userPrincipalName&$top=999"
+            )
+            return curso, list(cliente_graph.listar(url_miembros))
+        
+        usuarios_por_upn = {}
+        for curso, lista in controlador_concurrencia.ejecutar(miembros, list(grupos_por_curso), "grupos"):
+            for usuario in lista:
+                upn = (usuario.get("userPrincipalName") or "").lower()
+                if not upn:
+                    continue
+                entrada = usuarios_por_upn.setdefault(upn, {"id": usuario.get("id"), "cursos": set()})
+                entrada["cursos"].add(curso)
+                self.usuarios_cache[upn] = usuario.get("id")
+        
+        print(f"✅ {len(grupos_por_curso)} grupos de curso, {len(usuarios_por_upn)} estudiantes con curso")
+        return grupos_por_curso, usuarios_por_upn
+
+    def planificar_cambios(self, df: pd.DataFrame, col_upn: str, col_curso: str) -> list:
+        """
+        Calcula en memoria la diferencia entre el curso deseado (archivo)
+        y los cursos actuales (Azure AD) de cada estudiante.
+        
+        Returns: Lista de dicts con UPN, UserID, Cursos_Actuales,
+        Curso_Nuevo, Remover (cursos) y Agregar (curso o None)
+        """
+        grupos_por_curso, usuarios_por_upn = self.cargar_membresias_cursos()
+        
+        # Estudiantes del archivo (si un UPN se repite, gana la última fila)
+        completos = df[(df[col_upn] != "") & (df[col_curso] != "")]
+        deseados = {
+            upn.lower(): (upn, curso_nuevo)
+            for upn, curso_nuevo in zip(completos[col_upn].tolist(), completos[col_curso].tolist())
+        }
+        
+        # Los que no están en ningún grupo de curso se resuelven en bloque
+        sin_curso = [u for u in deseados if u not in usuarios_por_upn]
+        if sin_curso:
+            print(f"🔍 Resolviendo {len(sin_curso)} estudiantes sin grupo de curso...")
+            for upn, usuario in cliente_graph.resolver_usuarios(sin_curso).items():
+                usuarios_por_upn[upn] = {"id": usuario["id"], "cursos": set()}
+                self.usuarios_cache[upn] = usuario["id"]
+        
+        plan = []
+        for upn_clave, (upn, curso_nuevo) in deseados.items():
+            usuario = usuarios_por_upn.get(upn_clave)
+            actuales = usuario["cursos"] if usuario else set()
+            plan.append({
+                "UPN": upn,
+                "UserID": usuario["id"] if usuario else None,
+                "Cursos_Actuales": sorted(actuales),
+                "Curso_Nuevo": curso_nuevo,
+                "Remover": sorted(actuales - {curso_nuevo}),
+                "Agregar": curso_nuevo if curso_nuevo not in actuales else None,
+                "Grupo_Nuevo": grupos_por_curso.get(curso_nuevo),
+                "Grupos_Actuales": {c: grupos_por_curso.get(c) for c in actuales}
+            })
+        return plan
+
+    def mostrar_plan(self, plan: list):
+        """Muestra el resumen del plan antes de aplicar cambios"""
+        no_encontrados = sum(1 for p in plan if not p["UserID"])
+        sin_cambio = sum(1 for p in plan if p["UserID"] and not p["Remover"] and not p["Agregar"])
+        nuevos = sum(1 for p in plan if p["UserID"] and not p["Cursos_Actuales"])
+        cambios = sum(1 for p in plan if p["UserID"] and p["Cursos_Actuales"] and (p["Remover"] or p["Agregar"]))
+        grupos_faltantes = sorted({p["Curso_Nuevo"] for p in plan if p["UserID"] and p["Agregar"] and not p["Grupo_Nuevo"]})
+        
+        print("\n" + "="*70)
+        print("📋 PLAN DE CAMBIOS")
+        print("="*70)
+        print(f"Estudiantes en archivo: {len(plan)}")
+        print(f"  • Sin cambio: {sin_cambio}")
+        print(f"  • Nuevo ingreso (solo agregar): {nuevos}")
+        print(f"  • Cambio de curso: {cambios}")
+        print(f"  • No encontrados en Azure AD: {no_encontrados}")
+        print(f"Remociones a aplicar: {sum(len(p['Remover']) for p in plan if p['UserID'])}")
+        print(f"Adiciones a aplicar: {sum(1 for p in plan if p['UserID'] and p['Agregar'] and p['Grupo_Nuevo'])}")
+        if grupos_faltantes:
+            print(f"⚠️  Cursos sin grupo en Azure AD: {', '.join(grupos_faltantes)}")
+        print("="*70)
+
+    def aplicar_plan(self, plan: list):
+        """Aplica solo las remociones y adiciones necesarias, en lotes $batch"""
+        ejecutor = EjecutorLotes()
+        operaciones = []  # (tipo, entrada, curso, id_operacion)
+        
+        for entrada in plan:
+            upn = entrada["UPN"]
+            user_id = entrada["UserID"]
+            
+            if not user_id:
+                self.resultados["usuario_no_encontrado"] += 1
+                self.resultados["errores"].append(f"{upn}: Usuario no encontrado")
+                continue
+            
+            if not entrada["Remover"] and not entrada["Agregar"]:
+                self.resultados["sin_cambios"] += 1
+            
+            for curso in entrada["Remover"]:
+                grupo = entrada["Grupos_Actuales"].get(curso)
+                id_op = ejecutor.agregar("DELETE", f"/groups/{grupo['GroupId']}/members/{user_id}/$ref")
+                operaciones.append(("remover", entrada, curso, id_op))
+            
+            if entrada["Agregar"]:
+                grupo = entrada["Grupo_Nuevo"]
+                if grupo:
+                    id_op = ejecutor.agregar(
+                        "POST", f"/groups/{grupo['GroupId']}/members/$ref",
+                        {"@odata.id": f"{config.GRAPH_ENDPOINT}/directoryObjects/{user_id}"}
+                    )
+                    operaciones.append(("agregar", entrada, entrada["Agregar"], id_op))
+                else:
+                    print(f"    ❌ {upn}: Grupo nuevo no encontrado: {self.PREFIJO_GRUPO_CURSO} {entrada['Agregar']}")
+                    self.resultados["agregados_fallidos"] += 1
+            
+            self.resultados["procesados"] += 1
+            self.resultados["estudiantes_procesados"].append({
+                "UPN": upn,
+                "Curso_Actual": ", ".join(entrada["Cursos_Actuales"]) or None,
+                "Curso_Nuevo": entrada["Curso_Nuevo"],
+                "UserID": user_id
+            })
+        
+        if not operaciones:
+            print("\n✅ No hay cambios que aplicar")
+            return
+        
+        print(f"\n🚀 Aplicando {len(operaciones)} cambios...")
+        self.progreso.iniciar(len(operaciones), etapa="Aplicando cambios de curso")
+        por_id = {id_op: (tipo, entrada) for tipo, entrada, curso, id_op in operaciones}
+        
+        def informar(respuestas_lote):
+            for id_op, respuesta in respuestas_lote.items():
+                if id_op in por_id and respuesta["status"] not in EjecutorLotes.STATUS_REINTENTABLES:
+                    tipo, entrada = por_id[id_op]
+                    # 400 al agregar = ya estaba en el grupo
+                    exito = respuesta["status"] == 204 or (tipo == "agregar" and respuesta["status"] == 400)
+                    error = None if exito else f"{entrada['UPN']}: error al {tipo}"
+                    self.progreso.avanzar(actual=entrada["UPN"], exito=exito, error=error)
+        
+        respuestas = ejecutor.ejecutar(al_responder=informar)
+        
+        for tipo, entrada, curso, id_op in operaciones:
+            respuesta = respuestas.get(id_op, {"status": 0})
+            status = respuesta["status"]
+            if tipo == "remover":
+                if status == 204:
+                    print(f"    ✅ {entrada['UPN']}: Removido de Curso {curso}")
+                    self.resultados["removidos_exitosos"] += 1
+                else:
+                    print(f"    ⚠️  {entrada['UPN']}: Error remover de Curso {curso}: {EjecutorLotes.mensaje_error(respuesta)}")
+                    self.resultados["removidos_fallidos"] += 1
+            else:
+                # 400 = ya estaba en el grupo (mismo criterio que agregar_a_grupo)
+                if status in (204, 400):
+                    print(f"    ✅ {entrada['UPN']}: Agregado a Curso {curso}")
+                    self.resultados["agregados_exitosos"] += 1
+                else:
+                    print(f"    ❌ {entrada['UPN']}: Error agregar a Curso {curso}: {EjecutorLotes.mensaje_error(respuesta)}")
+                    self.resultados["agregados_fallidos"] += 1
+
+    def procesar_estudiantes_masivo(self, df: pd.DataFrame, col_upn: str, col_curso: str) -> dict:
+        """
+        Procesa todos los estudiantes comparando en bloque
+        
+        En lugar de consultar usuario y grupos de cada estudiante (N+1),
+        descarga una vez las membresías de los grupos de curso, calcula
+        el plan completo en memoria y aplica solo los cambios necesarios.
+        """
+        print("\n" + "="*70)
+        print("🔄 PROCESANDO ESTUDIANTES (MODO MASIVO)")
+        print("="*70)
+        
+        plan = self.planificar_cambios(df, col_upn, col_curso)
+        self.mostrar_plan(plan)
+        self.aplicar_plan(plan)
         
         print("\n" + "="*70)
         return self.resultados
@@ -515,13 +744,21 @@ class GestorAprovisionamientoGruposSimplificado:
                 for est in self.resultados['estudiantes_procesados'][:100]:
                     f.write(f"  {est['UPN']}: {est['Curso_Actual']} → {est['Curso_Nuevo']}\n")
             
+            registrar_log(log_file)
+            
             print(f"\n📝 Log guardado en: {log_file}")
             
         except Exception as e:
             print(f"❌ Error guardando log: {e}")
 
-    def procesar(self, ruta_archivo: str) -> dict:
-        """Proceso principal"""
+    def procesar(self, ruta_archivo: str, modo: str = "individual") -> dict:
+        """Proceso principal
+        
+        Args:
+            ruta_archivo: Ruta al archivo Excel/CSV
+            modo: "individual" (consulta cada estudiante) o "masivo"
+                  (descarga membresías una vez y aplica solo el diff)
+        """
         print("\n" + "="*70)
         print("🏫 APROVISIONAMIENTO SIMPLIFICADO - " + config.COLEGIO_NOMBRE)
         print("="*70)
@@ -533,6 +770,10 @@ class GestorAprovisionamientoGruposSimplificado:
             # 2. Detectar columnas
             col_upn, col_curso = self.detectar_columnas(df)
             
+            # Limpieza vectorizada: nulos, espacios y UPN en minúsculas con dominio
+            df = limpiar_columnas(df, [col_upn, col_curso])
+            df[col_upn] = normalizar_upn(df[col_upn], config.COLEGIO_DOMINIO)
+            
             # 3. Validar datos
             if not self.validar_datos(df, col_upn, col_curso):
                 raise Exception("Validación de datos fallida")
@@ -542,7 +783,10 @@ class GestorAprovisionamientoGruposSimplificado:
                 raise Exception("No se pudo obtener token de acceso")
             
             # 5. Procesar estudiantes
-            self.procesar_estudiantes(df, col_upn, col_curso)
+            if modo == "masivo":
+                self.procesar_estudiantes_masivo(df, col_upn, col_curso)
+            else:
+                self.procesar_estudiantes(df, col_upn, col_curso)
             
             # 6. Mostrar resumen
             self.mostrar_resumen()
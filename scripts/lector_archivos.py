@@ -0,0 +1,222 @@
+# scripts/lector_archivos.py
+"""
+Lectura en streaming de los archivos de entrada (.xlsx y .csv).
+
+Los Excel se abren con openpyxl en modo read_only (las filas se leen del
+XML a medida que se recorren) y los CSV se leen por bloques con pandas.
+Todas las celdas se devuelven como texto sin espacios sobrantes y las
+vacías como "", igual que el antiguo read_excel(dtype=str) + fillna("").
+En los DataFrames el índice es la fila del archivo menos 2 (encabezado en
+la fila 1), de modo que "Fila {idx+2}" sigue señalando la fila real.
+"""
+
+from datetime import datetime, date
+
+import openpyxl
+import pandas as pd
+
+
+class LectorArchivo:
+    """Lector perezoso de filas de un archivo Excel o CSV"""
+
+    FORMATOS = (".xlsx", ".csv")
+    TAMANO_BLOQUE = 5000  # Filas por bloque (CSV y DataFrames parciales)
+
+    def __init__(self, ruta_archivo: str, hoja: str = None, hojas_preferidas: list = None,
+                 sep: str = ",", encoding: str = "utf-8", tamano_bloque: int = None):
+        """
+        Args:
+            ruta_archivo: Ruta al .xlsx o .csv
+            hoja: Hoja exacta a leer (solo Excel)
+            hojas_preferidas: Hojas a buscar en orden; si ninguna existe se usa
+                la primera hoja con datos (solo Excel)
+            sep: Separador del CSV
+            encoding: Codificación del CSV
+        """
+        if not ruta_archivo.endswith(self.FORMATOS):
+            raise ValueError("Formato no soportado. Usa .xlsx o .csv")
+
+        self.ruta_archivo = ruta_archivo
+        self.hoja = hoja
+        self.hojas_preferidas = hojas_preferidas or []
+        self.sep = sep
+        self.encoding = encoding
+        self.tamano_bloque = tamano_bloque or self.TAMANO_BLOQUE
+        self.columnas = None
+
+    @property
+    def es_excel(self) -> bool:
+        return self.ruta_archivo.endswith(".xlsx")
+
+    # ------------------------------------------------------------------
+    # Normalización
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _texto(valor) -> str:
+        """Celda → texto (los enteros guardados como float pierden el '.0')"""
+        if valor is None:
+            return ""
+        if isinstance(valor, bool):
+            return str(valor).upper()
+        if isinstance(valor, float):
+            if valor != valor:  # NaN
+                return ""
+            if valor.is_integer():
+                return str(int(valor))
+        if isinstance(valor, datetime):
+            return valor.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(valor, date):
+            return valor.isoformat()
+        return str(valor).strip()
+
+    @staticmethod
+    def _encabezados(fila) -> list:
+        """Nombres de columna limpios y únicos (como pandas: 'X', 'X.1'...)"""
+        columnas = []
+        vistos = {}
+        for i, valor in enumerate(fila):
+            nombre = LectorArchivo._texto(valor) or f"Unnamed: {i}"
+            if nombre in vistos:
+                vistos[nombre] += 1
+                nombre = f"{nombre}.{vistos[nombre]}"
+            else:
+                vistos[nombre] = 0
+            columnas.append(nombre)
+        return columnas
+
+    # ------------------------------------------------------------------
+    # Excel
+    # ------------------------------------------------------------------
+
+    def _elegir_hoja(self, libro) -> str:
+        """Elige la hoja con el libro ya abierto (una sola apertura)"""
+        if self.hoja:
+            if self.hoja not in libro.sheetnames:
+                raise ValueError(f"La hoja '{self.hoja}' no existe. Disponibles: {libro.sheetnames}")
+            return self.hoja
+
+        for preferida in self.hojas_preferidas:
+            if preferida in libro.sheetnames:
+                return preferida
+
+        if not libro.sheetnames:
+            raise ValueError("El Excel no tiene hojas")
+
+        if not self.hojas_preferidas:
+            return libro.sheetnames[0]
+
+        # Primera hoja con al menos una fila de datos bajo el encabezado
+        for nombre in libro.sheetnames:
+            for fila in libro[nombre].iter_rows(min_row=2, values_only=True):
+                if any(self._texto(v) for v in fila):
+                    return nombre
+        raise ValueError("Todas las hojas están vacías")
+
+    def _filas_excel(self):
+        """Genera (indice, fila) saltando las filas vacías"""
+        libro = openpyxl.load_workbook(self.ruta_archivo, read_only=True, data_only=True)
+        try:
+            self.hoja = self._elegir_hoja(libro)
+            filas = libro[self.hoja].iter_rows(values_only=True)
+
+            encabezado = next(filas, None)
+            self.columnas = self._encabezados(encabezado or [])
+            total_columnas = len(self.columnas)
+
+            for indice, fila in enumerate(filas):
+                valores = [self._texto(v) for v in fila[:total_columnas]]
+                if not any(valores):
+                    continue
+                valores += [""] * (total_columnas - len(valores))
+                yield indice, dict(zip(self.columnas, valores))
+        finally:
+            libro.close()
+
+    # ------------------------------------------------------------------
+    # CSV
+    # ------------------------------------------------------------------
+
+    def _bloques_csv(self):
+        lector = pd.read_csv(
+            self.ruta_archivo, dtype=str, encoding=self.encoding,
+            sep=self.sep, chunksize=self.tamano_bloque, keep_default_na=False
+        )
+        with lector:
+            for bloque in lector:
+                bloque.columns = bloque.columns.str.strip()
+                self.columnas = list(bloque.columns)
+                yield bloque.apply(lambda columna: columna.str.strip())
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def filas(self):
+        """Genera cada fila como dict {columna: texto}"""
+        if self.es_excel:
+            for _, fila in self._filas_excel():
+                yield fila
+        else:
+            for bloque in self._bloques_csv():
+                yield from bloque.to_dict("records")
+
+    def bloques(self):
+        """Genera DataFrames de hasta 'tamano_bloque' filas (todo texto)"""
+        if not self.es_excel:
+            yield from self._bloques_csv()
+            return
+
+        bloque = []
+        indices = []
+        enviados = 0
+        for indice, fila in self._filas_excel():
+            bloque.append(fila)
+            indices.append(indice)
+            if len(bloque) >= self.tamano_bloque:
+                yield pd.DataFrame(bloque, index=indices, columns=self.columnas, dtype=str)
+                enviados += 1
+                bloque = []
+                indices = []
+        if bloque or not enviados:
+            yield pd.DataFrame(bloque, index=indices, columns=self.columnas, dtype=str)
+
+    def dataframe(self) -> pd.DataFrame:
+        """Todo el archivo en un DataFrame de texto (para procesos que lo necesitan completo)"""
+        partes = [bloque for bloque in self.bloques()]
+        if not partes:
+            return pd.DataFrame(columns=self.columnas or [], dtype=str)
+        return pd.concat(partes) if len(partes) > 1 else partes[0]
+
+    def valores_columna(self, elegir_columna, unicos: bool = True) -> tuple:
+        """Recorre el archivo guardando solo los valores de una columna
+
+        Args:
+            elegir_columna: Callable(lista_columnas) → nombre de columna o None
+            unicos: Si True, descarta repetidos conservando el orden
+
+        Returns:
+            tuple: (columna, valores) — columna None si no se encontró
+        """
+        columna = None
+        valores = []
+        vistos = set()
+        for fila in self.filas():
+            if columna is None:
+                columna = elegir_columna(self.columnas)
+                if columna is None:
+                    return None, []
+            valor = fila.get(columna, "")
+            if not valor or (unicos and valor in vistos):
+                continue
+            vistos.add(valor)
+            valores.append(valor)
+
+        if columna is None and self.columnas is not None:
+            columna = elegir_columna(self.columnas)
+        return columna, valores
+
+
+def cargar_dataframe(ruta_archivo: str, **opciones) -> pd.DataFrame:
+    """Atajo: DataFrame de texto leído en streaming"""
+    return LectorArchivo(ruta_archivo, **opciones).dataframe()
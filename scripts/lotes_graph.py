@@ -0,0 +1,233 @@
+# scripts/lotes_graph.py
+"""
+Ejecución de operaciones Graph en lotes JSON ($batch).
+Agrupa hasta 20 peticiones por viaje de red, respeta el orden 'dependsOn'
+(p. ej. crear usuario → asignar licencia) y devuelve el resultado de cada
+operación por su id.
+"""
+
+import json
+import os
+import sys
+
+# Añadir la carpeta scripts al path para importar configuración
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scripts.configuracion import config
+from scripts.cliente_graph import cliente_graph
+from scripts.control_concurrencia import controlador_concurrencia
+
+
+class EjecutorLotes:
+    """Cola de operaciones Graph que se envían en peticiones $batch"""
+
+    TAMANO_LOTE = 20  # Máximo permitido por Graph
+    MAX_REINTENTOS = 3  # Reintentos de operaciones limitadas (429/503)
+    STATUS_REINTENTABLES = (429, 503, 504)
+
+    def __init__(self, cliente=None, tamano_lote: int = None, controlador=None):
+        self.cliente = cliente or cliente_graph
+        self.controlador = controlador or controlador_concurrencia
+        self.tamano_lote = min(tamano_lote or self.TAMANO_LOTE, self.TAMANO_LOTE)
+        self.operaciones = []
+        self._contador = 0
+
+    def _url_relativa(self, url: str) -> str:
+        """$batch solo acepta URLs relativas al endpoint (ej: /users)"""
+        if url.startswith(config.GRAPH_ENDPOINT):
+            url = url[len(config.GRAPH_ENDPOINT):]
+        return url if url.startswith("/") else f"/{url}"
+
+    def agregar(self, metodo: str, url: str, body: dict = None,
+                depende_de: list = None, id_operacion: str = None) -> str:
+        """Encola una operación y devuelve su id dentro del lote
+
+        Args:
+            metodo: GET, POST, PATCH, DELETE...
+            url: URL absoluta o relativa al endpoint de Graph
+            body: Cuerpo JSON de la petición
+            depende_de: Ids de operaciones que deben completarse antes
+            id_operacion: Id propio (por defecto uno secuencial)
+        """
+        self._contador += 1
+        id_operacion = str(id_operacion or self._contador)
+
+        operacion = {
+            "id": id_operacion,
+            "method": metodo.upper(),
+            "url": self._url_relativa(url)
+        }
+        if body is not None:
+            operacion["body"] = body
+            operacion["headers"] = {"Content-Type": "application/json"}
+        if depende_de:
+            operacion["dependsOn"] = [str(d) for d in depende_de]
+
+        self.operaciones.append(operacion)
+        return id_operacion
+
+    def _agrupar_dependencias(self, operaciones: list) -> list:
+        """Agrupa operaciones encadenadas por 'dependsOn'
+
+        Graph exige que una operación y sus dependencias viajen en el mismo
+        lote, así que cada cadena se trata como una unidad indivisible. Si una
+        operación depende de varias cadenas, estas se fusionan en una sola.
+        """
+        orden = {op["id"]: posicion for posicion, op in enumerate(operaciones)}
+        grupo_de = {}
+        grupos = []
+        for op in operaciones:
+            grupo = None
+            for dep in op.get("dependsOn", []):
+                otro = grupo_de.get(dep)
+                if otro is None or otro is grupo:
+                    continue
+                if grupo is None:
+                    grupo = otro
+                    continue
+                # Fusionar 'otro' en 'grupo' conservando el orden de envío
+                grupo.extend(otro)
+                grupo.sort(key=lambda o: orden[o["id"]])
+                for miembro in otro:
+                    grupo_de[miembro["id"]] = grupo
+                grupos = [g for g in grupos if g is not otro]
+            if grupo is None:
+                grupo = []
+                grupos.append(grupo)
+            grupo.append(op)
+            grupo_de[op["id"]] = grupo
+        return grupos
+
+    def _armar_lotes(self, operaciones: list) -> list:
+        """Empaqueta las unidades de dependencia en lotes de hasta 20"""
+        lotes = []
+        actual = []
+        for grupo in self._agrupar_dependencias(operaciones):
+            if len(grupo) > self.tamano_lote:
+                raise ValueError(f"Cadena de dependencias demasiado larga ({len(grupo)} operaciones)")
+            if len(actual) + len(grupo) > self.tamano_lote:
+                lotes.append(actual)
+                actual = []
+            actual.extend(grupo)
+        if actual:
+            lotes.append(actual)
+        return lotes
+
+    def enviar_lote(self, lote: list) -> dict:
+        """Envía un único $batch y devuelve {id: respuesta}
+
+        Si falla la petición completa, todas las operaciones quedan con
+        status 0 y el error en 'body'.
+        """
+        try:
+            response = self.cliente.post(
+                f"{config.GRAPH_ENDPOINT}/$batch",
+                json={"requests": lote}
+            )
+            if response.status_code != 200:
+                error = {"error": {"message": f"Error {response.status_code} en $batch: {response.text[:200]}"}}
+                return {op["id"]: {"status": 0, "headers": {}, "body": error} for op in lote}
+
+            respuestas = {}
+            for item in response.json().get("responses", []):
+                respuestas[str(item.get("id"))] = {
+                    "status": item.get("status", 0),
+                    "headers": item.get("headers") or {},
+                    "body": item.get("body")
+                }
+            return respuestas
+
+        except Exception as e:
+            error = {"error": {"message": f"Error de conexión en $batch: {str(e)[:200]}"}}
+            return {op["id"]: {"status": 0, "headers": {}, "body": error} for op in lote}
+
+    def _clase_lote(self, lote: list) -> str:
+        """Clase de endpoint predominante en el lote (para el controlador)"""
+        clases = [self.controlador.clasificar(op["url"]) for op in lote]
+        return max(set(clases), key=clases.count)
+
+    def ejecutar(self, al_responder=None, max_simultaneos: int = None) -> dict:
+        """Envía todas las operaciones encoladas
+
+        Los lotes se envían en paralelo bajo el controlador de concurrencia;
+        las operaciones limitadas (429/503) pausan su clase de endpoint
+        según Retry-After y se reintentan.
+
+        Args:
+            al_responder: Callable({id: respuesta}) invocado tras cada lote
+                (desde los hilos de envío), útil para informar progreso
+            max_simultaneos: Tope de lotes en vuelo (además del límite adaptativo)
+
+        Returns:
+            dict: {id_operacion: {"status", "headers", "body"}}
+        """
+        pendientes = self.operaciones
+        self.operaciones = []
+        resultados = {}
+
+        for intento in range(self.MAX_REINTENTOS + 1):
+            if not pendientes:
+                break
+
+            lotes = self._armar_lotes(pendientes)
+            if len(lotes) > 1:
+                print(f"   📦 Enviando {len(pendientes)} operaciones en {len(lotes)} lotes...")
+            clase = self._clase_lote(pendientes)
+            def enviar_y_avisar(lote):
+                respuestas = self.enviar_lote(lote)
+                al_responder(respuestas)
+                return respuestas
+            enviar = enviar_y_avisar if al_responder else self.enviar_lote
+            for respuestas in self.controlador.ejecutar(enviar, lotes, clase, max_trabajadores=max_simultaneos):
+                resultados.update(respuestas)
+
+            # Reintentar operaciones limitadas y las que fallaron por depender de ellas
+            reintentar = set()
+            limitadas = {}  # clase → (espera, status, headers) con el mayor Retry-After
+            for op in pendientes:
+                respuesta = resultados.get(op["id"], {})
+                status = respuesta.get("status")
+                if status in self.STATUS_REINTENTABLES:
+                    reintentar.add(op["id"])
+                    if status in self.controlador.STATUS_LIMITACION:
+                        clase_op = self.controlador.clasificar(op["url"])
+                        espera = self.controlador.leer_retry_after(respuesta.get("headers"), intento)
+                        if clase_op not in limitadas or espera > limitadas[clase_op][0]:
+                            limitadas[clase_op] = (espera, status, respuesta.get("headers"))
+                elif status == 424 and any(d in reintentar for d in op.get("dependsOn", [])):
+                    reintentar.add(op["id"])
+
+            # Una sola limitación por clase: 20 operaciones limitadas no son 20 reducciones
+            for clase_op, (_, status, headers) in limitadas.items():
+                self.controlador.registrar_respuesta(clase_op, status, headers, intento)
+
+            if not reintentar or intento == self.MAX_REINTENTOS:
+                break
+
+            print(f"   ⏳ {len(reintentar)} operaciones limitadas por Graph, reintentando...")
+
+            siguientes = []
+            for op in pendientes:
+                if op["id"] not in reintentar:
+                    continue
+                op = dict(op)
+                # Las dependencias ya resueltas no se reenvían
+                dependencias = [d for d in op.get("dependsOn", []) if d in reintentar]
+                if dependencias:
+                    op["dependsOn"] = dependencias
+                else:
+                    op.pop("dependsOn", None)
+                siguientes.append(op)
+            pendientes = siguientes
+
+        return resultados
+
+    @staticmethod
+    def mensaje_error(respuesta: dict) -> str:
+        """Extrae el mensaje de error de la respuesta de una operación"""
+        body = respuesta.get("body")
+        if isinstance(body, dict):
+            mensaje = body.get("error", {}).get("message")
+            if mensaje:
+                return mensaje
+            return json.dumps(body, ensure_ascii=False)[:200]
+        return f"Status {respuesta.get('status')}"
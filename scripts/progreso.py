@@ -0,0 +1,189 @@
+# scripts/progreso.py
+"""
+Progreso estructurado de las operaciones largas.
+
+Los procesadores informan avance (procesados/total, elemento actual,
+errores) a un ReportadorProgreso; este calcula la tasa de operaciones por
+segundo y el tiempo restante estimado. La aplicación web se suscribe a los
+cambios del reportador de cada trabajo y los envía al navegador como
+Server-Sent Events.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class ReportadorProgreso:
+    """Acumula el avance de una operación y notifica a sus suscriptores"""
+
+    VENTANA_TASA = 10.0  # Segundos considerados para la tasa reciente
+    MAX_ERRORES = 20  # Últimos errores conservados en el estado
+
+    def __init__(self, trabajo_id: str = None):
+        self.trabajo_id = trabajo_id
+        self.total = 0
+        self.procesados = 0
+        self.exitosos = 0
+        self.fallidos = 0
+        self.etapa = ""
+        self.actual = ""
+        self.errores = deque(maxlen=self.MAX_ERRORES)
+        self.finalizado = False
+        self.inicio = None
+        self._marcas = deque()  # (time.monotonic(), procesados) dentro de la ventana
+        self._version = 0
+        self._cond = threading.Condition()
+
+    def _notificar(self):
+        self._version += 1
+        self._cond.notify_all()
+
+    def iniciar(self, total: int = 0, etapa: str = ""):
+        """Comienza (o reinicia) el conteo para una etapa"""
+        with self._cond:
+            self.total = total
+            self.procesados = 0
+            self.exitosos = 0
+            self.fallidos = 0
+            self.etapa = etapa
+            self.actual = ""
+            self.inicio = time.monotonic()
+            self._marcas.clear()
+            self._marcas.append((self.inicio, 0))
+            self._notificar()
+
+    def agregar_total(self, cantidad: int):
+        """Amplía el total cuando se descubre más trabajo (p. ej. miembros de un equipo)"""
+        with self._cond:
+            self.total += cantidad
+            self._notificar()
+
+    def actualizar(self, actual: str = None, etapa: str = None):
+        """Cambia el elemento o la etapa en curso sin contar avance"""
+        with self._cond:
+            if actual is not None:
+                self.actual = actual
+            if etapa is not None:
+                self.etapa = etapa
+            self._notificar()
+
+    def avanzar(self, actual: str = None, exito: bool = True, error: str = None, cantidad: int = 1):
+        """Registra 'cantidad' elementos procesados"""
+        with self._cond:
+            if self.inicio is None:
+                self.inicio = time.monotonic()
+                self._marcas.append((self.inicio, 0))
+            self.procesados += cantidad
+            if exito:
+                self.exitosos += cantidad
+            else:
+                self.fallidos += cantidad
+                if error:
+                    self.errores.append(error)
+            if actual is not None:
+                self.actual = actual
+
+            ahora = time.monotonic()
+            self._marcas.append((ahora, self.procesados))
+            while len(self._marcas) > 2 and ahora - self._marcas[0][0] > self.VENTANA_TASA:
+                self._marcas.popleft()
+            self._notificar()
+
+    def finalizar(self):
+        with self._cond:
+            self.finalizado = True
+            self._notificar()
+
+    def estado(self) -> dict:
+        """Instantánea con tasas (ops/s) y ETA en segundos"""
+        with self._cond:
+            return self._estado()
+
+    def _estado(self) -> dict:
+        ahora = time.monotonic()
+        transcurrido = ahora - self.inicio if self.inicio else 0.0
+        tasa_media = self.procesados / transcurrido if transcurrido > 0 else 0.0
+
+        tasa_reciente = tasa_media
+        if len(self._marcas) >= 2:
+            t0, p0 = self._marcas[0]
+            if ahora - t0 > 0:
+                tasa_reciente = (self.procesados - p0) / (ahora - t0)
+
+        restantes = max(self.total - self.procesados, 0)
+        tasa_eta = tasa_reciente or tasa_media
+        eta = restantes / tasa_eta if tasa_eta > 0 and restantes else None
+
+        return {
+            "trabajo_id": self.trabajo_id,
+            "etapa": self.etapa,
+            "actual": self.actual,
+            "total": self.total,
+            "procesados": self.procesados,
+            "exitosos": self.exitosos,
+            "fallidos": self.fallidos,
+            "porcentaje": round(100.0 * self.procesados / self.total, 1) if self.total else 0.0,
+            "tasa_media": round(tasa_media, 2),
+            "tasa_reciente": round(tasa_reciente, 2),
+            "transcurrido": round(transcurrido, 1),
+            "eta": round(eta, 1) if eta is not None else None,
+            "errores": list(self.errores),
+            "finalizado": self.finalizado
+        }
+
+    def esperar_cambio(self, version: int, timeout: float = 15.0) -> tuple:
+        """Bloquea hasta que haya un estado posterior a 'version' (o timeout)
+
+        Returns:
+            tuple: (version_actual, estado)
+        """
+        with self._cond:
+            if self._version == version and not self.finalizado:
+                self._cond.wait(timeout)
+            return self._version, self._estado()
+
+
+# Reportadores de los trabajos en curso, por id de trabajo
+_reportadores = {}
+_reportadores_lock = threading.Lock()
+# Reportador activo del hilo que ejecuta un trabajo
+_contexto = threading.local()
+
+
+def registrar_reportador(trabajo_id: str) -> ReportadorProgreso:
+    """Crea el reportador de un trabajo para que se pueda suscribir desde ya"""
+    reportador = ReportadorProgreso(trabajo_id)
+    with _reportadores_lock:
+        _reportadores[trabajo_id] = reportador
+    return reportador
+
+
+def obtener_reportador(trabajo_id: str) -> ReportadorProgreso or None:
+    with _reportadores_lock:
+        return _reportadores.get(trabajo_id)
+
+
+def activar_reportador(reportador: ReportadorProgreso):
+    """Asocia el reportador al hilo actual (lo usa reportador_actual)"""
+    _contexto.reportador = reportador
+
+
+def desactivar_reportador():
+    """Finaliza el reportador del hilo actual y lo retira del registro"""
+    reportador = getattr(_contexto, "reportador", None)
+    _contexto.reportador = None
+    if reportador:
+        reportador.finalizar()
+        with _reportadores_lock:
+            _reportadores.pop(reportador.trabajo_id, None)
+
+
+def reportador_actual() -> ReportadorProgreso:
+    """Reportador del trabajo en curso
+
+    Fuera de un trabajo (ejecución por consola) devuelve uno nuevo sin
+    suscriptores, así los procesadores informan avance sin comprobaciones.
+    Debe llamarse desde el hilo del trabajo, no desde hilos auxiliares.
+    """
+    return getattr(_contexto, "reportador", None) or ReportadorProgreso()
@@ -1,16 +1,22 @@
 import pandas as pd
 import requests
 import urllib3
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 import sys
 import time
-import json
-import hashlib
+import threading
 
 # Añadir la carpeta scripts al path para importar configuración
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import LectorArchivo
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.progreso import reportador_actual
+from scripts.control_concurrencia import controlador_concurrencia
+from scripts.diario_checkpoint import abrir_diario
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -19,16 +25,20 @@ class VaciadorEquipos:
 
     CUENTA_CAP = "cap@calasanzsuba.edu.co"
     MAX_REINTENTOS = 3  # Número máximo de reintentos por operación
+    ESPERA_REINTENTO = 0.25  # Segundos antes del primer reintento (se duplica en cada uno)
 
     def __init__(self):
         config.validar_configuracion()
         self.token = None
         self.token_expiracion = None  # Timestamp de expiración del token
         self.token_renovaciones = 0  # Contador de renovaciones
-        self.checkpoint_file = os.path.join(config.CARPETA_RESULTADOS, 'checkpoint_vaciar_equipos.json')
-        self.equipos_procesados_ids = set()  # IDs de equipos ya procesados
+        self.diario = None  # DiarioCheckpoint del archivo en proceso
         self.archivo_actual = None
-        self.hash_archivo = None
+        self.eliminaciones_pendientes = {}  # ident → eliminaciones sin terminar
+        self.equipos_con_error = set()
+        self.progreso = reportador_actual()
+        # Protege token y contadores: las eliminaciones corren en varios hilos
+        self._lock = threading.RLock()
         self.resultados = {
             "total": 0,
             "total_equipos": 0,
@@ -42,25 +52,11 @@ class VaciadorEquipos:
         }
 
     def obtener_token(self) -> bool:
-        """Obtiene token de acceso a Microsoft Graph API"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-
+        """Obtiene token de acceso a Microsoft Graph API (compartido por el proceso)"""
         try:
-            response = requests.post(url, data=data, verify=False)
-            response.raise_for_status()
-            token_data = response.json()
-            self.token = token_data["access_token"]
-            
-            # Calcular tiempo de expiración (normalmente 3600 segundos = 1 hora)
-            # Renovamos 5 minutos antes para estar seguros
-            expires_in = token_data.get("expires_in", 3600)
-            self.token_expiracion = datetime.now() + timedelta(seconds=expires_in - 300)
+            self.token = proveedor_token.obtener_token()
+            # El proveedor renueva 5 minutos antes de 'expires_in'
+            self.token_expiracion = proveedor_token.expiracion
             
             if self.token_renovaciones > 0:
                 msg = f"✓ Token renovado exitosamente (renovación #{self.token_renovaciones})"
@@ -74,18 +70,21 @@ class VaciadorEquipos:
 
     def token_valido(self) -> bool:
         """Verifica si el token actual sigue siendo válido"""
-        if not self.token or not self.token_expiracion:
+        if not self.token:
             return False
-        return datetime.now() < self.token_expiracion
+        return proveedor_token.token_valido()
 
     def renovar_token_si_necesario(self) -> bool:
         """Renueva el token si está próximo a expirar o ya expiró"""
-        if not self.token_valido():
-            print("⚠️ Token expirado o próximo a expirar, renovando...")
-            self.token_renovaciones += 1
-            self.resultados["token_renovaciones"] = self.token_renovaciones
-            return self.obtener_token()
-        return True
+        with self._lock:
+            if not self.token_valido():
+                print("⚠️ Token expirado o próximo a expirar, renovando...")
+                self.token_renovaciones += 1
+                self.resultados["token_renovaciones"] = self.token_renovaciones
+                return self.obtener_token()
+            # El proveedor pudo renovarlo en segundo plano
+            self.token = proveedor_token.obtener_token()
+            return True
 
     def obtener_id_equipo(self, identificador: str) -> tuple[str, str]:
         """Busca el ID de un equipo por Email o ID
@@ -106,6 +105,14 @@ class VaciadorEquipos:
                 print(f"   ℹ️ Usando Team ID directamente: {identificador[:8]}...")
                 return identificador, None
 
+        # Buscar en el directorio local
+        directorio = obtener_directorio()
+        if directorio:
+            grupo = directorio.obtener_grupo_por_mail(identificador)
+            if grupo:
+                print(f"   ✓ Equipo encontrado: {grupo['display_name'] or 'N/A'}")
+                return grupo["id"], None
+
         # Renovar token si es necesario antes de hacer la búsqueda
         if not self.renovar_token_si_necesario():
             return None, "No se pudo renovar el token"
@@ -115,7 +122,7 @@ class VaciadorEquipos:
         url = f"{config.GRAPH_ENDPOINT}/groups?$filter=mail eq '{identificador}'&$select=id,displayName"
 
         try:
-            response = requests.get(url, headers=headers, verify=False)
+            response = cliente_graph.get(url, headers=headers, verify=False)
             
             # Manejar error 401 específicamente
             if response.status_code == 401:
@@ -123,7 +130,7 @@ class VaciadorEquipos:
                 if self.renovar_token_si_necesario():
                     # Reintentar con nuevo token
                     headers = {"Authorization": f"Bearer {self.token}"}
-                    response = requests.get(url, headers=headers, verify=False)
+                    response = cliente_graph.get(url, headers=headers, verify=False)
                 else:
                     return None, "No se pudo renovar token después de error 401"
             
@@ -144,38 +151,19 @@ class VaciadorEquipos:
             return None, f"Error inesperado: {str(e)}"
 
     def obtener_usuarios_grupo(self, group_id: str, rol: str = 'members') -> list:
-        """Obtiene miembros u owners de un grupo"""
-        # Renovar token si es necesario
+        """Obtiene miembros u owners de un grupo
+
+        Lanza requests.RequestException si alguna página falla (el cliente ya
+        reintentó 401 y 429/503): una lista parcial haría que el equipo se
+        diera por vaciado en el checkpoint.
+        """
         if not self.renovar_token_si_necesario():
-            return []
-            
-        usuarios = []
+            raise requests.RequestException("No se pudo renovar el token")
+
         # Endpoint para owners es /owners, para miembros es /members
         endpoint = "owners" if rol == 'owners' else "members"
         url = f"{config.GRAPH_ENDPOINT}/groups/{group_id}/{endpoint}?$select=id,userPrincipalName,mail"
-        headers = {"Authorization": f"Bearer {self.token}"}
-
-        while url:
-            try:
-                response = requests.get(url, headers=headers, verify=False)
-                
-                # Manejar token expirado
-                if response.status_code == 401:
-                    if self.renovar_token_si_necesario():
-                        headers = {"Authorization": f"Bearer {self.token}"}
-                        response = requests.get(url, headers=headers, verify=False)
-                    else:
-                        break
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    usuarios.extend(data.get('value', []))
-                    url = data.get('@odata.nextLink')
-                else:
-                    break
-            except Exception:
-                break
-        return usuarios
+        return list(cliente_graph.listar(url, verify=False))
 
     def eliminar_miembro(self, group_id: str, user_id: str, es_owner: bool = False) -> tuple[bool, str]:
         """Elimina un usuario del grupo (endpoint cambia si es owner)
@@ -193,17 +181,20 @@ class VaciadorEquipos:
             headers = {"Authorization": f"Bearer {self.token}"}
             
             try:
-                response = requests.delete(url, headers=headers, verify=False)
+                response = cliente_graph.delete(url, headers=headers, verify=False)
                 
                 if response.status_code == 204:
                     return True, ""
                 elif response.status_code == 401:
                     # Token expirado, forzar renovación
                     print(f"   ⚠️ Error 401 en intento {intento + 1}/{self.MAX_REINTENTOS}, renovando token...")
-                    self.token = None  # Forzar renovación
-                    self.token_expiracion = None
+                    with self._lock:
+                        # Solo se invalida el token usado: otro hilo pudo renovarlo ya
+                        proveedor_token.invalidar(headers["Authorization"][len("Bearer "):])
+                        self.token = None
+                        self.token_expiracion = None
                     if intento < self.MAX_REINTENTOS - 1:
-                        time.sleep(1)  # Pequeña pausa antes de reintentar
+                        time.sleep(self.ESPERA_REINTENTO * 2 ** intento)
                         continue
                     else:
                         return False, f"Error 401 persistente después de {self.MAX_REINTENTOS} intentos"
@@ -215,7 +206,7 @@ class VaciadorEquipos:
                     
             except Exception as e:
                 if intento < self.MAX_REINTENTOS - 1:
-                    time.sleep(1)
+                    time.sleep(self.ESPERA_REINTENTO * 2 ** intento)
                     continue
                 return False, str(e)
         
@@ -228,22 +219,16 @@ class VaciadorEquipos:
 
         # Cargar archivo
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("Formato no soportado")
-            
-            # Buscar columna de identificador
-            col = next((c for c in df.columns if c.lower() in ['groupid', 'teamid', 'id', 'primarysmtpaddress', 'email', 'correo']), None)
+            # Solo se conserva la columna de identificador (lectura en streaming)
+            col, equipos = LectorArchivo(ruta_archivo).valores_columna(
+                lambda columnas: next((c for c in columnas if c.lower() in ['groupid', 'teamid', 'id', 'primarysmtpaddress', 'email', 'correo']), None)
+            )
             
             if not col:
                 self.resultados["errores"] += 1
                 self.resultados["detalles"].append("No se encontró columna ID o Email")
                 return self.resultados
 
-            equipos = df[col].dropna().unique().tolist()
             self.resultados["total_equipos"] = len(equipos)
             self.resultados["total"] = len(equipos)
 
@@ -252,63 +237,153 @@ class VaciadorEquipos:
             self.resultados["detalles"].append(f"Error leyendo archivo: {e}")
             return self.resultados
         
-        print(f"🔄 Iniciando vaciado de para {len(equipos)} equipos...")
+        equipos = [ident.strip() for ident in equipos]
+        self.abrir_checkpoint(ruta_archivo)
+        pendientes = [ident for ident in equipos if not self.diario.hecho(f"equipo:{ident}")]
 
+        print(f"🔄 Iniciando vaciado de {len(pendientes)} equipos con {config.VACIADO_TRABAJADORES} trabajadores...")
+        # El total crece a medida que se descubren los miembros de cada equipo
+        self.progreso.iniciar(0, etapa=f"Vaciando {len(pendientes)} equipos")
 
-        for ident in equipos:
-            ident = ident.strip()
-            print(f"🔍 Procesando: {ident}")
-            
-            group_id, error_msg = self.obtener_id_equipo(ident)
-            if not group_id:
-                msg = error_msg if error_msg else f"Equipo no encontrado: {ident}"
-                print(f"❌ {msg}")
+        try:
+            # 1. Inventario en paralelo: ID, miembros y owners de cada equipo
+            inventarios = controlador_concurrencia.ejecutar(
+                self.inventariar_equipo, pendientes, "grupos",
+                max_trabajadores=config.VACIADO_TRABAJADORES
+            )
+
+            tareas = []
+            for ident, group_id, eliminaciones in inventarios:
+                if group_id:
+                    tareas.extend(eliminaciones)
+                    self.resultados["equipos_procesados"] += 1
+                    self.eliminaciones_pendientes[ident] = len(eliminaciones)
+                    if not eliminaciones:
+                        self.diario.registrar(f"equipo:{ident}")
+
+            # 2. Eliminaciones de todos los equipos a la vez
+            print(f"🗑️  {len(tareas)} eliminaciones pendientes")
+            controlador_concurrencia.ejecutar(
+                self.ejecutar_eliminacion, tareas, "grupos",
+                max_trabajadores=config.VACIADO_TRABAJADORES
+            )
+        finally:
+            self.cerrar_checkpoint(equipos)
+
+        print(f"✅ {self.resultados['equipos_procesados']} equipos procesados.")
+        self.guardar_log()
+        return self.resultados
+
+    def abrir_checkpoint(self, ruta_archivo: str):
+        """Abre el diario del archivo; si se reanuda, restaura los contadores"""
+        self.archivo_actual = ruta_archivo
+        self.diario = abrir_diario("vaciar_equipos", ruta_archivo)
+
+        if self.diario.reanudado:
+            self.resultados["equipos_procesados"] += self.diario.contar("equipo:")
+            self.resultados["miembros_eliminados"] += self.diario.contar("miembro:")
+            self.resultados["owners_eliminados"] += self.diario.contar("owner:")
+            msg = (f"♻️  Reanudando desde checkpoint: {self.resultados['equipos_procesados']} equipos "
+                   f"y {self.resultados['miembros_eliminados'] + self.resultados['owners_eliminados']} "
+                   f"eliminaciones ya hechas")
+            print(msg)
+            self.resultados["log_detallado"].append(msg)
+
+    def cerrar_checkpoint(self, equipos: list):
+        """Borra el diario si todo terminó; si no, lo deja para reanudar"""
+        self.diario.finalizar(all(self.diario.hecho(f"equipo:{ident}") for ident in equipos))
+
+    def inventariar_equipo(self, ident: str) -> tuple:
+        """Busca el equipo y arma sus eliminaciones (protegiendo a CAP)
+
+        Returns:
+            tuple: (ident, group_id, [(ident, group_id, user_id, upn, es_owner)])
+                group_id es None si el equipo no se encontró o no se pudo inventariar
+        """
+        print(f"🔍 Procesando: {ident}")
+        self.progreso.actualizar(actual=ident)
+        
+        group_id, error_msg = self.obtener_id_equipo(ident)
+        if not group_id:
+            msg = error_msg if error_msg else f"Equipo no encontrado: {ident}"
+            print(f"❌ {msg}")
+            with self._lock:
                 self.resultados["detalles"].append(msg)
                 self.resultados["errores"] += 1
-                continue
+            return ident, None, []
 
-
-            # 1. Eliminar Miembros (Estudiantes)
+        try:
             miembros = self.obtener_usuarios_grupo(group_id, 'members')
-            for m in miembros:
-                uid = m['id']
-                upn = m.get('userPrincipalName', 'unknown')
-                
-                # Opcional: ignorar CAP si está como miembro (aunque no debería importar)
-                if upn.lower() == self.CUENTA_CAP:
-                    continue
+            owners = self.obtener_usuarios_grupo(group_id, 'owners')
+        except Exception as e:
+            # Sin inventario completo el equipo no se toca ni se marca en el checkpoint
+            msg = f"Error listando miembros de {ident}: {e}"
+            print(f"❌ {msg}")
+            with self._lock:
+                self.resultados["detalles"].append(msg)
+                self.resultados["errores"] += 1
+            return ident, None, []
 
-                ok, err = self.eliminar_miembro(group_id, uid, es_owner=False)
-                if ok:
-                    self.resultados["miembros_eliminados"] += 1
-                    self.resultados["log_detallado"].append(f"✓ Miembro eliminado: {upn} del equipo {ident}")
-                else:
-                    self.resultados["detalles"].append(f"Error borrando miembro {upn} de {ident}: {err}")
+        eliminaciones = []
 
-            # 2. Eliminar Owners (Docentes) EXCEPTO CAP
-            owners = self.obtener_usuarios_grupo(group_id, 'owners')
-            for o in owners:
-                uid = o['id']
-                upn = o.get('userPrincipalName', 'unknown')
-                mail = o.get('mail', 'unknown')
-
-                # VALIDACIÓN CRÍTICA: NO BORRAR A CAP
-                if upn.lower() == self.CUENTA_CAP or mail.lower() == self.CUENTA_CAP:
-                    print(f"   🛡️ Se protege al owner CAP: {upn}")
-                    continue
-                
-                ok, err = self.eliminar_miembro(group_id, uid, es_owner=True)
-                if ok:
-                    self.resultados["owners_eliminados"] += 1
-                    self.resultados["log_detallado"].append(f"✓ Owner eliminado: {upn} del equipo {ident}")
-                else:
-                    self.resultados["detalles"].append(f"Error borrando owner {upn} de {ident}: {err}")
+        # Miembros (Estudiantes)
+        self.progreso.agregar_total(len(miembros))
+        for m in miembros:
+            upn = m.get('userPrincipalName') or 'unknown'
+            # Opcional: ignorar CAP si está como miembro (aunque no debería importar)
+            if upn.lower() == self.CUENTA_CAP:
+                self.progreso.avanzar()
+                continue
+            if self.diario.hecho(f"miembro:{group_id}:{m['id']}"):
+                self.progreso.avanzar()
+                continue
+            eliminaciones.append((ident, group_id, m['id'], upn, False))
+
+        # Owners (Docentes) EXCEPTO CAP
+        self.progreso.agregar_total(len(owners))
+        for o in owners:
+            upn = o.get('userPrincipalName') or 'unknown'
+            mail = o.get('mail') or 'unknown'
+            # VALIDACIÓN CRÍTICA: NO BORRAR A CAP
+            if upn.lower() == self.CUENTA_CAP or mail.lower() == self.CUENTA_CAP:
+                print(f"   🛡️ Se protege al owner CAP: {upn}")
+                self.progreso.avanzar()
+                continue
+            if self.diario.hecho(f"owner:{group_id}:{o['id']}"):
+                self.progreso.avanzar()
+                continue
+            eliminaciones.append((ident, group_id, o['id'], upn, True))
 
-            self.resultados["equipos_procesados"] += 1
-            print(f"   ✅ Equipo procesado.")
+        return ident, group_id, eliminaciones
 
-        self.guardar_log()
-        return self.resultados
+    def ejecutar_eliminacion(self, tarea: tuple):
+        """Elimina un miembro u owner y actualiza los contadores"""
+        ident, group_id, uid, upn, es_owner = tarea
+        tipo = "Owner" if es_owner else "Miembro"
+        
+        ok, err = self.eliminar_miembro(group_id, uid, es_owner=es_owner)
+        if ok:
+            self.diario.registrar(f"{tipo.lower()}:{group_id}:{uid}")
+        
+        with self._lock:
+            if ok:
+                self.resultados["owners_eliminados" if es_owner else "miembros_eliminados"] += 1
+                self.resultados["log_detallado"].append(f"✓ {tipo} eliminado: {upn} del equipo {ident}")
+            else:
+                self.resultados["detalles"].append(f"Error borrando {tipo.lower()} {upn} de {ident}: {err}")
+                self.equipos_con_error.add(ident)
+            
+            # El equipo queda en el diario cuando terminan todas sus eliminaciones sin error
+            self.eliminaciones_pendientes[ident] -= 1
+            equipo_terminado = self.eliminaciones_pendientes[ident] == 0 and ident not in self.equipos_con_error
+        
+        if equipo_terminado:
+            self.diario.registrar(f"equipo:{ident}")
+        
+        if ok:
+            self.progreso.avanzar(actual=f"{ident}: {upn}")
+        else:
+            self.progreso.avanzar(actual=f"{ident}: {upn}", exito=False, error=f"{upn} ({ident}): {err}")
 
     def generar_inventario(self, carpeta_salida: str) -> str:
         """Genera un Excel con TODOS los equipos del tenant"""
@@ -325,7 +400,7 @@ class VaciadorEquipos:
         
         while url:
             try:
-                response = requests.get(url, headers=headers, verify=False)
+                response = cliente_graph.get(url, headers=headers, verify=False)
                 if response.status_code == 200:
                     data = response.json()
                     todos_equipos.extend(data.get('value', []))
@@ -395,6 +470,8 @@ class VaciadorEquipos:
                     f.write("="*50 + "\n")
                     for entrada in self.resultados["log_detallado"]:
                         f.write(f"{entrada}\n")
+            
+            registrar_log(log_file)
                     
         except Exception as e:
             print(f"Error guardando log: {e}")
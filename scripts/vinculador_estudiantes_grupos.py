@@ -1,5 +1,4 @@
 import pandas as pd
-import requests
 import urllib3
 from datetime import datetime
 import os
@@ -7,6 +6,13 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from scripts.configuracion import config
+from scripts.lector_archivos import cargar_dataframe
+from scripts.preprocesamiento import limpiar_columnas, normalizar_upn, errores_obligatorios, filas_duplicadas
+from scripts.cliente_graph import cliente_graph, proveedor_token
+from scripts.estadisticas import registrar_log
+from scripts.directorio_local import obtener_directorio
+from scripts.diario_checkpoint import abrir_diario
+from scripts.progreso import reportador_actual
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -14,6 +20,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 class VinculadorEstudiantesGrupos:
     """Vincula estudiantes a grupos de seguridad (como PowerShell #6)"""
     
+    TAMANO_BLOQUE_MIEMBROS = 20  # Máximo de members@odata.bind por PATCH
+    
     def __init__(self):
         try:
             config.validar_configuracion()
@@ -24,6 +32,8 @@ class VinculadorEstudiantesGrupos:
         self.grupos_disponibles = []  # Todos los grupos de Azure AD
         self.grupos_cache = {}
         self.usuarios_cache = {}
+        self.diario = None  # Checkpoint del archivo en proceso
+        self.progreso = reportador_actual()
         
         self.resultados = {
             "total_estudiantes": 0,
@@ -40,18 +50,8 @@ class VinculadorEstudiantesGrupos:
     
     def obtener_token(self) -> bool:
         """Obtiene token"""
-        url = f"https://login.microsoftonline.com/{config.TENANT_ID}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": config.CLIENT_ID,
-            "client_secret": config.CLIENT_SECRET,
-            "scope": "https://graph.microsoft.com/.default"
-        }
-        
         try:
-            response = requests.post(url, data=data, verify=False, timeout=10)
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
+            self.token = proveedor_token.obtener_token()
             print("✅ Token obtenido")
             return True
         except Exception as e:
@@ -117,7 +117,7 @@ class VinculadorEstudiantesGrupos:
             
             # Mejor: Obtener TODOS los grupos y filtrar en Python
             url_simple = f"{config.GRAPH_ENDPOINT}/groups?$filter=startsWith(displayName, 'Estudiantes Curso -')&$select=id,displayName,mail"
-            response = requests.get(url_simple, headers=headers, verify=False, timeout=15)
+            response = cliente_graph.get(url_simple, headers=headers, verify=False, timeout=15)
             
             if response.status_code == 200:
                 data = response.json()
@@ -146,15 +146,7 @@ class VinculadorEstudiantesGrupos:
         Estructura: CODIGO_ESTUDIANTE | CURSO
         """
         try:
-            if ruta_archivo.endswith(".xlsx"):
-                df = pd.read_excel(ruta_archivo, dtype=str)
-            elif ruta_archivo.endswith(".csv"):
-                df = pd.read_csv(ruta_archivo, dtype=str, encoding="utf-8")
-            else:
-                raise ValueError("Formato no soportado")
-            
-            df.columns = df.columns.str.strip()
-            df = df.fillna("")
+            df = cargar_dataframe(ruta_archivo)
             
             print(f"✅ {len(df)} estudiantes cargados")
             self.resultados["total_estudiantes"] = len(df)
@@ -200,17 +192,11 @@ class VinculadorEstudiantesGrupos:
     def validar_datos(self, df: pd.DataFrame, col_est: str, col_curso: str) -> bool:
         """Valida datos"""
         print("\n🔍 Validando datos...")
-        errores = []
+        errores = errores_obligatorios(df, {col_est: "Estudiante", col_curso: "Curso"})
         
-        for idx, row in df.iterrows():
-            est = str(row[col_est]).strip() if row[col_est] else ""
-            curso = str(row[col_curso]).strip() if row[col_curso] else ""
-            
-            if not est or est == "nan":
-                errores.append(f"Fila {idx+2}: Estudiante vacío")
-            
-            if not curso or curso == "nan":
-                errores.append(f"Fila {idx+2}: Curso vacío")
+        duplicados = filas_duplicadas(df, [col_curso, col_est], "Curso + Estudiante")
+        if duplicados:
+            print(f"⚠️  {len(duplicados)} filas repetidas (se vinculan una sola vez)")
         
         if errores:
             print(f"❌ {len(errores)} errores encontrados")
@@ -243,6 +229,13 @@ class VinculadorEstudiantesGrupos:
         if upn in self.usuarios_cache:
             return self.usuarios_cache[upn]
         
+        directorio = obtener_directorio()
+        if directorio:
+            user_id = directorio.obtener_user_id(upn)
+            if user_id:
+                self.usuarios_cache[upn] = user_id
+                return user_id
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -250,7 +243,7 @@ class VinculadorEstudiantesGrupos:
         
         try:
             url = f"{config.GRAPH_ENDPOINT}/users/{upn}?$select=id"
-            response = requests.get(url, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.get(url, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 200:
                 user_id = response.json().get("id")
@@ -278,7 +271,7 @@ class VinculadorEstudiantesGrupos:
         body = {"@odata.id": f"{config.GRAPH_ENDPOINT}/directoryObjects/{user_id}"}
         
         try:
-            response = requests.post(url, json=body, headers=headers, verify=False, timeout=10)
+            response = cliente_graph.post(url, json=body, headers=headers, verify=False, timeout=10)
             
             if response.status_code == 204:
                 return True, "Agregado"
@@ -290,6 +283,123 @@ class VinculadorEstudiantesGrupos:
         except Exception as e:
             return False, f"Error: {str(e)[:50]}"
 
+    def resolver_usuarios(self, upns: list) -> dict:
+        """
+        Resuelve en bloque los IDs de muchos estudiantes
+        
+        Usa primero el cache y el directorio local; el resto se consulta
+        a Graph en bloques de 15 UPN por petición.
+        
+        Returns: {upn: user_id} solo para los encontrados
+        """
+        resueltos = {}
+        pendientes = []
+        directorio = obtener_directorio()
+        
+        for upn in upns:
+            if upn in self.usuarios_cache:
+                resueltos[upn] = self.usuarios_cache[upn]
+                continue
+            user_id = directorio.obtener_user_id(upn) if directorio else None
+            if user_id:
+                self.usuarios_cache[upn] = user_id
+                resueltos[upn] = user_id
+            else:
+                pendientes.append(upn)
+        
+        if pendientes:
+            print(f"🔍 Resolviendo {len(pendientes)} estudiantes en Azure AD...")
+            try:
+                encontrados = cliente_graph.resolver_usuarios(pendientes, select="id")
+            except Exception as e:
+                print(f"⚠️  Error resolviendo estudiantes: {e}")
+                encontrados = {}
+            for upn in pendientes:
+                usuario = encontrados.get(upn.lower())
+                if usuario:
+                    self.usuarios_cache[upn] = usuario["id"]
+                    resueltos[upn] = usuario["id"]
+        
+        return resueltos
+
+    def obtener_miembros_grupo(self, group_id: str) -> set:
+        """IDs de los miembros actuales del grupo (vacío si no se pudo leer)"""
+        url = f"{config.GRAPH_ENDPOINT}/groups/{group_id}/members?$select=id&$top=999"
+        try:
+            return {miembro.get("id") for miembro in cliente_graph.listar(url)}
+        except Exception as e:
+            print(f"    ⚠️  No se pudieron leer los miembros actuales: {e}")
+            return set()
+
+    def agregar_varios_a_grupo(self, group_id: str, user_ids: list) -> tuple:
+        """
+        Agrega hasta 20 estudiantes al grupo en una sola petición
+        PATCH /groups/{id} con members@odata.bind
+        """
+        if not self.token:
+            return False, "Token no disponible"
+        
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        
+        url = f"{config.GRAPH_ENDPOINT}/groups/{group_id}"
+        body = {
+            "members@odata.bind": [
+                f"{config.GRAPH_ENDPOINT}/directoryObjects/{user_id}" for user_id in user_ids
+            ]
+        }
+        
+        try:
+            response = cliente_graph.patch(url, json=body, headers=headers, verify=False, timeout=30)
+            
+            if response.status_code == 204:
+                return True, "Agregado"
+            return False, f"Error {response.status_code}"
+        except Exception as e:
+            return False, f"Error: {str(e)[:50]}"
+
+    def vincular_curso(self, group_id: str, estudiantes_curso: list, ids: dict) -> dict:
+        """
+        Vincula los estudiantes ya resueltos de un curso
+        
+        Omite los que ya son miembros y agrega el resto en bloques de
+        TAMANO_BLOQUE_MIEMBROS; si un bloque falla, se reintenta miembro
+        a miembro para identificar el estudiante problemático.
+        
+        Returns: {upn: (exito, mensaje)} igual que agregar_a_grupo
+        """
+        miembros = self.obtener_miembros_grupo(group_id)
+        resultado = {}
+        por_agregar = []
+        
+        for upn in estudiantes_curso:
+            if ids[upn] in miembros:
+                resultado[upn] = (True, "Ya en grupo")
+            else:
+                por_agregar.append(upn)
+        if len(por_agregar) < len(estudiantes_curso):
+            self.progreso.avanzar(cantidad=len(estudiantes_curso) - len(por_agregar))
+        
+        for i in range(0, len(por_agregar), self.TAMANO_BLOQUE_MIEMBROS):
+            bloque = por_agregar[i:i + self.TAMANO_BLOQUE_MIEMBROS]
+            exito, msg = self.agregar_varios_a_grupo(group_id, [ids[upn] for upn in bloque])
+            
+            if exito:
+                for upn in bloque:
+                    resultado[upn] = (True, msg)
+                self.progreso.avanzar(actual=bloque[-1], cantidad=len(bloque))
+                continue
+            
+            print(f"    ⚠️  Bloque de {len(bloque)} falló ({msg}), agregando uno a uno...")
+            for upn in bloque:
+                resultado[upn] = self.agregar_a_grupo(group_id, ids[upn])
+                exito_upn, msg_upn = resultado[upn]
+                self.progreso.avanzar(actual=upn, exito=exito_upn, error=None if exito_upn else f"{upn}: {msg_upn}")
+        
+        return resultado
+
     def procesar(self, df: pd.DataFrame, col_est: str, col_curso: str) -> dict:
         """
         Procesa vinculación
@@ -307,22 +417,42 @@ class VinculadorEstudiantesGrupos:
         print("🔄 VINCULANDO ESTUDIANTES A GRUPOS")
         print("="*70)
         
-        # Agrupar estudiantes por curso
-        estudiantes_por_curso = {}
-        for idx, row in df.iterrows():
-            est = str(row[col_est]).strip()
-            curso = str(row[col_curso]).strip()
-            
-            if not est or est == "nan" or not curso or curso == "nan":
-                continue
-            
-            if curso not in estudiantes_por_curso:
-                estudiantes_por_curso[curso] = []
-            
-            estudiantes_por_curso[curso].append(est)
+        # Agrupar estudiantes por curso (sin filas vacías ni repetidas)
+        completos = df[(df[col_est] != "") & (df[col_curso] != "")].drop_duplicates([col_curso, col_est])
+        estudiantes_por_curso = completos.groupby(col_curso, sort=False)[col_est].agg(list).to_dict()
         
         print(f"📊 Estudiantes agrupados por {len(estudiantes_por_curso)} cursos")
         
+        codigos = {g.get("displayName", "").replace("Estudiantes Curso - ", "").strip() for g in self.grupos_disponibles}
+        self.progreso.iniciar(
+            sum(len(lista) for curso, lista in estudiantes_por_curso.items() if curso in codigos),
+            etapa="Vinculando estudiantes"
+        )
+        
+        if self.diario and self.diario.reanudado:
+            # Vínculos hechos en la ejecución anterior: ni se resuelven ni se consultan
+            ya_vinculados = 0
+            for curso, lista in estudiantes_por_curso.items():
+                pendientes = []
+                for est in lista:
+                    entrada = self.diario.obtener(f"vinculo:{curso}:{est}")
+                    if entrada is None:
+                        pendientes.append(est)
+                    elif entrada.get("ya_en_grupo"):
+                        self.resultados["estudiantes_ya_en_grupo"] += 1
+                    else:
+                        self.resultados["estudiantes_vinculados"] += 1
+                ya_vinculados += len(lista) - len(pendientes)
+                estudiantes_por_curso[curso] = pendientes
+            if ya_vinculados:
+                print(f"♻️  {ya_vinculados} vínculos ya hechos en la ejecución anterior (omitidos)")
+                self.progreso.avanzar(cantidad=ya_vinculados)
+        
+        # Resolver todos los estudiantes de una vez (en lugar de un GET por estudiante)
+        ids = self.resolver_usuarios(
+            [est for curso, lista in estudiantes_por_curso.items() if curso in codigos for est in lista]
+        )
+        
         # Para cada grupo disponible
         count_grupos = 0
         for grupo in self.grupos_disponibles:
@@ -333,6 +463,7 @@ class VinculadorEstudiantesGrupos:
             codigo_grupo = nombre_grupo.replace("Estudiantes Curso - ", "").strip()
             
             print(f"\n[{count_grupos+1}] Procesando grupo: {nombre_grupo}")
+            self.progreso.actualizar(actual=nombre_grupo)
             
             # Buscar estudiantes para este curso
             if codigo_grupo not in estudiantes_por_curso:
@@ -352,21 +483,25 @@ class VinculadorEstudiantesGrupos:
             
             print(f"    👥 {len(estudiantes_curso)} estudiantes para vincular")
             
-            # Para cada estudiante del curso
-            for estudiante_upn in estudiantes_curso:
-                # Obtener ID del estudiante
-                user_id = self.obtener_user_id(estudiante_upn)
-                
-                if not user_id:
-                    print(f"       ❌ {estudiante_upn}: No encontrado")
-                    self.resultados["estudiantes_no_encontrados"] += 1
-                    count_errores += 1
-                    continue
-                
-                # Agregar al grupo
-                exito, msg = self.agregar_a_grupo(group_id, user_id)
+            no_encontrados = [est for est in estudiantes_curso if est not in ids]
+            encontrados = [est for est in estudiantes_curso if est in ids]
+            
+            for estudiante_upn in no_encontrados:
+                print(f"       ❌ {estudiante_upn}: No encontrado")
+                self.resultados["estudiantes_no_encontrados"] += 1
+                self.progreso.avanzar(actual=estudiante_upn, exito=False, error=f"{estudiante_upn}: No encontrado")
+                count_errores += 1
+            
+            mensajes = self.vincular_curso(group_id, encontrados, ids) if encontrados else {}
+            
+            for estudiante_upn in encontrados:
+                exito, msg = mensajes[estudiante_upn]
                 
                 if exito:
+                    if self.diario:
+                        self.diario.registrar(
+                            f"vinculo:{codigo_grupo}:{estudiante_upn}", ya_en_grupo="Ya en grupo" in msg
+                        )
                     if "Ya en grupo" in msg:
                         self.resultados["estudiantes_ya_en_grupo"] += 1
                         print(f"       ⚠️  {estudiante_upn}: Ya estaba")
@@ -448,6 +583,8 @@ class VinculadorEstudiantesGrupos:
                     for error in self.resultados['errores']:
                         f.write(f"  • {error}\n")
             
+            registrar_log(log_file)
+            
             print(f"\n📝 Log guardado: {log_file}")
         
         except Exception as e:
@@ -474,12 +611,23 @@ class VinculadorEstudiantesGrupos:
             # 4. Detectar columnas
             col_est, col_curso = self.detectar_columnas(df)
             
+            # Limpieza vectorizada: nulos, espacios y UPN en minúsculas con dominio
+            df = limpiar_columnas(df, [col_est, col_curso])
+            df[col_est] = normalizar_upn(df[col_est], config.COLEGIO_DOMINIO)
+            
             # 5. Validar
             if not self.validar_datos(df, col_est, col_curso):
                 raise Exception("Validación fallida")
             
             # 6. Procesar
-            self.procesar(df, col_est, col_curso)
+            self.diario = abrir_diario("vincular_grupos", ruta_archivo)
+            try:
+                self.procesar(df, col_est, col_curso)
+            finally:
+                self.diario.finalizar(
+                    self.resultados["errores_vinculacion"] == 0
+                    and self.resultados["estudiantes_no_encontrados"] == 0
+                )
             
             # 7. Resumen
             self.mostrar_resumen()